@@ -1,9 +1,16 @@
+import asyncio
+import anyio
 import pytest
+import threading
+import time
+from types import SimpleNamespace
 from starlette.testclient import TestClient
 from backend import security
+from backend.cache import PrincipalCache, principal_cache
 
 from backend.main import app
-from sqlmodel import Session, SQLModel, StaticPool, create_engine
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, StaticPool, create_engine, select
 from backend.database.schema import *
 from backend.dependencies import get_session
 from backend.routers.accounts import UpdateAccountDetails
@@ -106,6 +113,93 @@ def test_access_token_success(client: TestClient):
     assert response.json()["email"] == initial_user["email"]
 
 
+# Principal cache
+def test_principal_cache_hits_and_invalidates(client: TestClient):
+    initial_user = {"username": "juniper", "email": "juniper@email.com", "password": "password4"}
+    client.post("/auth/registration", data=initial_user)
+    client.post("/auth/web/login", data=initial_user)
+
+    assert client.get("/accounts/me").json()["username"] == "juniper"
+    assert principal_cache.stats()["misses"] == 1
+    client.get("/accounts/me")
+    assert principal_cache.stats()["hits"] == 1
+
+    # The snapshot leaves out the password hash
+    snapshot = principal_cache.get(principal_cache.digest(client.cookies[security.JWT_COOKIE_KEY]))
+    assert snapshot["username"] == "juniper" and "hashed_password" not in snapshot
+
+    # Updating the account drops its cached principal
+    client.put("/accounts/me", json={"username": "newUser"})
+    assert principal_cache.stats()["size"] == 0
+    assert client.get("/accounts/me").json()["username"] == "newUser"
+
+    # A cached principal loads the hash when the route needs it
+    response = client.put("/accounts/me/password", data={"old_password": "password4", "new_password": "password5"})
+    assert response.status_code == 204
+
+
+def test_update_password_on_cached_principal_stays_off_the_event_loop(client: TestClient, session: Session):
+    initial_user = {"username": "juniper", "email": "juniper@email.com", "password": "password4"}
+    client.post("/auth/registration", data=initial_user)
+    client.post("/auth/web/login", data=initial_user)
+    client.get("/accounts/me")
+
+    on_loop = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(statement)
+        except RuntimeError:
+            pass
+
+    event.listen(session.get_bind(), "before_cursor_execute", _record)
+    try:
+        hits = principal_cache.stats()["hits"]
+        response = client.put("/accounts/me/password", data={"old_password": "password4", "new_password": "password5"})
+        assert response.status_code == 204
+        assert principal_cache.stats()["hits"] == hits + 1
+        # The hash is read on the threadpool, not lazy-loaded by the async route
+        assert on_loop == []
+    finally:
+        event.remove(session.get_bind(), "before_cursor_execute", _record)
+
+    wrong = client.put("/accounts/me/password", data={"old_password": "password4", "new_password": "password6"})
+    assert wrong.status_code == 401
+
+
+def test_principal_cache_never_outlives_token(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(principal_cache, "ttl", 60)
+    monkeypatch.setattr(security, "DURATION", 5)
+    initial_user = {"username": "juniper", "email": "juniper@email.com", "password": "password4"}
+    client.post("/auth/registration", data=initial_user)
+    client.post("/auth/web/login", data=initial_user)
+    client.get("/accounts/me")
+    client.get("/accounts/me")
+    assert principal_cache.stats()["hits"] == 1
+
+    # Once the token's exp has passed the cached entry is gone, long before the ttl
+    later = time.monotonic() + 6
+    monkeypatch.setattr("backend.cache.time", SimpleNamespace(time=time.time, monotonic=lambda: later))
+    misses = principal_cache.stats()["misses"]
+    assert client.get("/accounts/me").status_code == 200
+    assert principal_cache.stats()["misses"] == misses + 1
+
+
+def test_principal_cache_generations_are_bounded():
+    cache = PrincipalCache(maxsize=2, ttl=60)
+    stale = cache.generation(1)
+    for account_id in (1, 2, 3):
+        cache.invalidate_account(account_id)
+    assert len(cache._generations) == 2
+
+    # Account 1's generation was evicted, a put that read it before the invalidation is still refused
+    cache.put(b"digest", {"id": 1}, token_exp=time.time() + 60, generation=stale)
+    assert cache.get(b"digest") is None
+    cache.put(b"digest", {"id": 1}, token_exp=time.time() + 60, generation=cache.generation(1))
+    assert cache.get(b"digest") == {"id": 1}
+
+
 # 3 POST /auth/web/login
 def test_store_JWT_as_cookie_error(client: TestClient):
     initial_user = {"username": "juniper", "email": "juniper@email.com", "password": "password4"}
@@ -342,41 +436,59 @@ def test_create_chat_success(client: TestClient):
     assert response.json()["name"] == "test"
 
 
+# Password pool
+def test_login_rehashes_password_with_new_work_factor(client: TestClient, session: Session, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(security, "BCRYPT_ROUNDS", 4)
+    initial_user = {"username": "juniper", "email": "juniper@email.com", "password": "password4"}
+    client.post("/auth/registration", data=initial_user)
+    account = session.exec(select(DBAccount)).one()
+    assert account.hashed_password.startswith("$2b$04$")
 
+    monkeypatch.setattr(security, "BCRYPT_ROUNDS", 5)
+    response = client.post("/auth/token", data=initial_user)
+    assert response.status_code == 200
+    session.refresh(account)
+    assert account.hashed_password.startswith("$2b$05$")
+    assert client.post("/auth/token", data=initial_user).status_code == 200
 
 
-
-
-    
-    
-
-    
-
-    
-
-
-    
-
-
-
-    
-
-    
-
-
-
-    
-    
-
-    
-
-    
-
-
-    
-
-
-
-    
-
-    
\ No newline at end of file
+def test_password_pool_full_rejects_fast(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(security, "_password_slots", threading.BoundedSemaphore(1))
+    security._password_slots.acquire()
+    initial_user = {"username": "juniper", "email": "juniper@email.com", "password": "password4"}
+    response = client.post("/auth/registration", data=initial_user)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert response.json() == {"error": "service_unavailable",
+                               "message": "Too many password requests, try again shortly"}
+
+
+def test_password_jobs_dont_hold_request_threads(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    started, release = threading.Event(), threading.Event()
+    hashpw = security.bcrypt.hashpw
+
+    def slow_hashpw(password, salt):
+        started.set()
+        release.wait(timeout=10)
+        return hashpw(password, salt)
+
+    async def single_request_thread():
+        anyio.to_thread.current_default_thread_limiter().total_tokens = 1
+
+    monkeypatch.setattr(security.bcrypt, "hashpw", slow_hashpw)
+    # Every request runs on this one event loop, whose threadpool has a single thread
+    with anyio.from_thread.start_blocking_portal() as portal:
+        monkeypatch.setattr(client, "portal", portal)
+        portal.call(single_request_thread)
+
+        initial_user = {"username": "juniper", "email": "juniper@email.com", "password": "password4"}
+        registration = threading.Thread(target=client.post, args=("/auth/registration",), kwargs={"data": initial_user})
+        registration.start()
+        assert started.wait(timeout=5)
+        # The only request thread is free while the password is being hashed
+        listing = threading.Thread(target=client.get, args=("/accounts",))
+        listing.start()
+        listing.join(timeout=5)
+        assert not listing.is_alive()
+        release.set()
+        registration.join(timeout=5)
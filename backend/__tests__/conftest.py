@@ -0,0 +1,68 @@
+"""
+Every request made through backend.main.app is checked against the SQL statement
+budget of its route in query_budgets.json:
+    "METHOD /route/{template}": {"statements": most statements a request may issue, "why": where they go}
+Budgets are chosen from the route's query plan, not recorded from a run. A budget of 0 (or none)
+leaves the route unbudgeted, a request to it that issues any SQL fails the test, as does a request over budget.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+from backend.cache import membership_index, principal_cache
+from backend.metrics import UNMATCHED_ROUTE, registry
+from backend.purge import chat_purger
+
+QUERY_BUDGETS_PATH = Path(__file__).with_name("query_budgets.json")
+QUERY_BUDGETS: dict[str, int] = {endpoint: budget["statements"]
+                                 for endpoint, budget in json.loads(QUERY_BUDGETS_PATH.read_text()).items()}
+
+
+@pytest.fixture(autouse=True)
+def reset_caches():
+    # In-process caches outlive a test's in-memory database, so start every test empty
+    principal_cache.clear()
+    membership_index.clear()
+    registry.clear()
+    yield
+    # Deleted chats are purged on a worker thread, finish before the test's database goes away
+    assert chat_purger.wait(timeout=10)
+    principal_cache.clear()
+    membership_index.clear()
+
+
+@pytest.fixture(autouse=True)
+def query_budget(monkeypatch):
+    # Records (endpoint, statements) for every request and checks them against the budgets on teardown
+    requests: list[tuple[str, int]] = []
+    observe = registry.observe
+
+    def _recording_observe(method, route, status, seconds, sql):
+        requests.append((f"{method} {route}", sql.statements))
+        observe(method, route, status, seconds, sql)
+
+    monkeypatch.setattr(registry, "observe", _recording_observe)
+    yield requests
+
+    failures = set()
+    for endpoint, statements in requests:
+        if endpoint.endswith(UNMATCHED_ROUTE) or statements == 0:
+            continue
+        budget = QUERY_BUDGETS.get(endpoint, 0)
+        if budget == 0:
+            failures.add(f"{endpoint} issued {statements} SQL statements but has no query budget in {QUERY_BUDGETS_PATH.name}")
+        elif statements > budget:
+            failures.add(f"{endpoint} issued {statements} SQL statements, its budget is {budget}")
+    if failures:
+        pytest.fail("\n".join(sorted(failures)), pytrace=False)
+
+
+@pytest.fixture
+def auth_headers():
+    # Registers an account through the client and returns bearer headers with its access token
+    def _auth_headers(client, username: str, email: str | None = None) -> dict[str, str]:
+        user = {"username": username, "email": email or f"{username}@email.com", "password": "password4"}
+        client.post("/auth/registration", data=user)
+        return {"Authorization": f"Bearer {client.post('/auth/token', data=user).json()['access_token']}"}
+    return _auth_headers
@@ -1,9 +1,24 @@
+import gzip
+import json
 import pytest
+from datetime import datetime, timezone
 from starlette.testclient import TestClient
 from backend.main import app
-from sqlmodel import Session, SQLModel, StaticPool, create_engine
+from sqlmodel import Session, SQLModel, StaticPool, create_engine, func, select
 from backend.database.schema import *
-from backend.dependencies import get_session
+from backend.dependencies import add_missing_columns, add_missing_indexes, backfill_message_timestamps, build_engine, get_session
+from backend.settings import DatabaseSettings
+from backend.cache import MembershipIndex, membership_index
+from backend.database.seed import seed_database
+from backend.database.importer import import_messages
+from backend.database import messages as messages_db
+from backend.purge import chat_purger, purge_chat
+from backend import responses
+from backend.routers.chats import export_lines
+from backend.database import chats as chats_db
+from backend.database import stats as stats_db
+from backend.database.chats import unique_chat_name
+from backend.pagination import encode_cursor
 
 
 @pytest.fixture
@@ -37,9 +52,10 @@ def test_accounts(client, session):
         DBAccount(id=1, username="steve", email="test@gmail.com", hashed_password="1"),
         DBAccount(id=2, username="mark", email="test2@gmail.com", hashed_password="2")
     ])
-       response = client.get("/accounts")
+       session.commit()
+       response = client.get("/accounts", params={"include_count": True})
        assert response.json() == {
-            "metadata": {"count": 2}, 
+            "metadata": {"count": 2, "next_cursor": None}, 
             "accounts": [
                 {"id": 1, "username": "steve"},
                 {"id": 2, "username": "mark"}
@@ -58,6 +74,7 @@ def test_account_by_id(client, session):
         DBAccount(id=100, username="steve", email="test@gmail.com", hashed_password="1"),
         DBAccount(id=2, username="mark", email="test2@gmail.com", hashed_password="2")
     ])
+        session.commit()
         response = client.get("/accounts/100")
         assert response.json() == { "id": 100, "username": "steve"} 
 
@@ -68,10 +85,12 @@ def test_chat(client, session):
         DBChat(id=2, name="testName2", owner_id=5),
         DBChat(id=3, name="testName3", owner_id=1)
     ])
-       response = client.get("/chats")
+       session.commit()
+       response = client.get("/chats", params={"include_count": True})
        assert response.json() == {
        "metadata": {
-            "count": 3
+            "count": 3,
+            "next_cursor": None
         },
         "chats":[
           {"id": 1, "name": "testName", "owner_id": 5},
@@ -80,6 +99,31 @@ def test_chat(client, session):
         ]
        }
 
+def test_list_pages_without_count(client, session):
+    session.add_all([DBAccount(id=i, username=f"user{i}", email=f"user{i}@gmail.com", hashed_password="1")
+                     for i in range(1, 6)])
+    session.add_all([DBChat(id=i, name=f"chat{i}", owner_id=1) for i in range(1, 4)])
+    session.commit()
+
+    # count is only computed when asked for
+    first = client.get("/accounts", params={"limit": 3}).json()
+    assert first["metadata"].keys() == {"next_cursor"}
+    assert [a["id"] for a in first["accounts"]] == [1, 2, 3]
+
+    second = client.get("/accounts", params={"limit": 3, "cursor": first["metadata"]["next_cursor"], "include_count": True}).json()
+    assert [a["id"] for a in second["accounts"]] == [4, 5]
+    assert second["metadata"] == {"count": 5, "next_cursor": None}
+
+    chats = client.get("/chats", params={"limit": 2}).json()
+    assert [c["id"] for c in chats["chats"]] == [1, 2]
+    chats = client.get("/chats", params={"limit": 2, "cursor": chats["metadata"]["next_cursor"]}).json()
+    assert [c["id"] for c in chats["chats"]] == [3]
+    assert chats["metadata"]["next_cursor"] is None
+
+    response = client.get("/chats", params={"cursor": "e30"})
+    assert response.status_code == 422
+
+
 def test_chat_by_id(client, session):
      # Entity not found error 
      response = client.get("/chats/1")
@@ -89,6 +133,7 @@ def test_chat_by_id(client, session):
      }
 
      session.add(DBChat(id=1, name="testname", owner_id=5))
+     session.commit()
      new_response = client.get("/chats/1")
 
     # Regular route test
@@ -100,6 +145,7 @@ def test_chat_by_id(client, session):
 # Entity not found error
 def test_get_message_from_chat_id(client, session):
     session.add_all([DBMessage(text="hello world", account_id=1, chat_id=3)]) 
+    session.commit()
     response = client.get("/chats/100/messages")
     assert response.json() == {
          'error': 'entity_not_found',
@@ -107,6 +153,60 @@ def test_get_message_from_chat_id(client, session):
      }
     
 
+def test_get_messages_pages_with_cursor(client, session):
+    session.add(DBChat(id=1, name="paged", owner_id=1))
+    session.add_all([DBMessage(id=i, text=f"message {i}", account_id=1, chat_id=1,
+                               created_at=datetime(2025, 1, 1, 12, 0, i)) for i in range(1, 6)])
+    session.add(DBMessage(id=6, text="other chat", account_id=1, chat_id=2, created_at=datetime(2025, 1, 1)))
+    session.commit()
+
+    # Most recent page first, returned in chronological order
+    response = client.get("/chats/1/messages", params={"limit": 2})
+    assert response.status_code == 200
+    body = response.json()
+    assert [m["id"] for m in body["messages"]] == [4, 5]
+    assert body["metadata"]["count"] == 2
+
+    # next_cursor keeps walking back in time until the history is exhausted
+    body = client.get("/chats/1/messages", params={"limit": 2, "cursor": body["metadata"]["next_cursor"]}).json()
+    assert [m["id"] for m in body["messages"]] == [2, 3]
+    body = client.get("/chats/1/messages", params={"limit": 2, "cursor": body["metadata"]["next_cursor"]}).json()
+    assert [m["id"] for m in body["messages"]] == [1]
+    assert body["metadata"]["next_cursor"] is None
+
+    # after_id pages forward
+    body = client.get("/chats/1/messages", params={"limit": 3, "after_id": 1}).json()
+    assert [m["id"] for m in body["messages"]] == [2, 3, 4]
+    body = client.get("/chats/1/messages", params={"limit": 3, "cursor": body["metadata"]["next_cursor"]}).json()
+    assert [m["id"] for m in body["messages"]] == [5]
+    assert body["metadata"]["next_cursor"] is None
+
+    body = client.get("/chats/1/messages", params={"before_id": 3}).json()
+    assert [m["id"] for m in body["messages"]] == [1, 2]
+
+
+def test_get_messages_pagination_errors(client, session):
+    session.add(DBChat(id=1, name="paged", owner_id=1))
+    session.add(DBMessage(id=1, text="other chat", account_id=1, chat_id=2))
+    session.commit()
+
+    # Empty chat is not an error
+    response = client.get("/chats/1/messages")
+    assert response.status_code == 200
+    assert response.json() == {"metadata": {"count": 0, "next_cursor": None}, "messages": []}
+
+    response = client.get("/chats/1/messages", params={"after_id": 1})
+    assert response.status_code == 404
+    assert response.json() == {"error": "entity_not_found", "message": "Unable to find message with id=1"}
+
+    response = client.get("/chats/1/messages", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 422
+    assert response.json() == {"error": "invalid_cursor", "message": "Invalid pagination cursor"}
+
+    response = client.get("/chats/1/messages", params={"after_id": 1, "before_id": 1})
+    assert response.status_code == 422
+
+
 def test_get_accounts_from_id(client, session):
 
     # Entity not found error
@@ -119,6 +219,7 @@ def test_get_accounts_from_id(client, session):
                      DBAccount(id=2, username="jane", email="jane@gmail.com", hashed_password="2"), 
                      DBAccount(id=3, username="eric", email="ericn@gmail.com", hashed_password="3")])
     session.add(DBChatMembership(account_id=1, chat_id=3))
+    session.commit()
 
     response = client.get("/chats/3/accounts")
 
@@ -126,19 +227,553 @@ def test_get_accounts_from_id(client, session):
     assert response.json() == { "metadata": {"count": 1}, "accounts": 
                                   [{"id": 1, "username": "john"}]
      }
-     
-     
-       
 
 
+def test_membership_index_follows_membership_routes(client, session):
+    session.add_all([DBAccount(id=1, username="john", email="john@gmail.com", hashed_password="1"),
+                     DBAccount(id=2, username="jane", email="jane@gmail.com", hashed_password="2")])
+    session.add(DBChat(id=1, name="indexed", owner_id=1))
+    session.add(DBChatMembership(account_id=1, chat_id=1))
+    session.commit()
 
-       
-       
+    # First check loads the chat into the index
+    assert client.delete("/chats/1/accounts/2").status_code == 422
+    assert membership_index.members(1).tolist() == [1]
+    assert membership_index.chats_of(1) == {1}
+
+    assert client.post("/chats/1/accounts", json={"account_id": 2}).status_code == 201
+    assert membership_index.is_member(1, 2)
+    assert client.post("/chats/1/accounts", json={"account_id": 2}).status_code == 200
+
+    assert client.delete("/chats/1/accounts/2").status_code == 204
+    assert membership_index.is_member(1, 2) is False
+    assert membership_index.chats_of(2) == frozenset()
+
+    client.delete("/chats/1")
+    assert membership_index.is_member(1, 1) is None
+
+
+def test_membership_index_evicts_least_recently_used():
+    index = MembershipIndex(maxsize=2, ttl=60)
+    for chat_id in (1, 2):
+        index.load(chat_id, {chat_id * 10, 7}, index.generation(chat_id))
+    index.members(1)
+    index.load(3, {30}, index.generation(3))
+    assert index.members(2) is None
+    assert index.chats_of(7) == {1}
+
+    # A load that raced with a write is discarded
+    generation = index.generation(1)
+    index.add(1, 11)
+    index.load(1, {10}, generation)
+    assert index.members(1).tolist() == [7, 10, 11]
 
+    # Generations are kept for at most maxsize chats, a load that raced with an evicted one is still discarded
+    generation = index.generation(4)
+    for chat_id in (4, 5, 6):
+        index.drop_chat(chat_id)
+    assert len(index._generations) == 2
+    index.load(4, {40}, generation)
+    assert index.members(4) is None
+    index.load(4, {40}, index.generation(4))
+    assert index.members(4).tolist() == [40]
 
+    # Callers get a copy, later writes don't change it under them
+    members = index.members(1)
+    index.remove(1, 7)
+    assert members.tolist() == [7, 10, 11]
+    assert index.members(1).tolist() == [10, 11]
+
+
+def test_sqlite_engine_profile(tmp_path):
+    engine = build_engine(DatabaseSettings(url=f"sqlite:///{tmp_path}/profile.db", sqlite_busy_timeout_ms=1234))
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == 1234
+        assert connection.exec_driver_sql("PRAGMA foreign_keys").scalar() == 1
+    assert engine.echo is False
+
+
+
+def test_metrics_endpoint(client, session):
+    session.add(DBChat(id=1, name="metered", owner_id=1))
+    session.commit()
+    client.get("/chats/1")
+    client.get("/chats/1")
+    client.get("/chats/2")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    lines = response.text.splitlines()
+    # Labelled by route template, not by the requested path
+    assert 'http_requests_total{method="GET",route="/chats/{chat_id}",status="200"} 2' in lines
+    assert 'http_requests_total{method="GET",route="/chats/{chat_id}",status="404"} 1' in lines
+    assert 'http_request_duration_seconds_count{method="GET",route="/chats/{chat_id}"} 3' in lines
+    assert 'db_statements_per_request_bucket{method="GET",route="/chats/{chat_id}",le="0"} 0' in lines
+    assert 'db_statements_per_request_sum{method="GET",route="/chats/{chat_id}"} 3.0' in lines
+    assert "http_requests_in_flight 1" in lines
+    assert "chat_event_connections 0" in lines
+    assert not any("/chats/1" in line for line in lines)
+
+
+def test_update_message_query_count(client, session, query_budget):
+    session.add(DBChat(id=1, name="budget", owner_id=1))
+    session.add(DBMessage(id=1, text="before", account_id=1, chat_id=1))
+    session.commit()
+
+    assert client.put("/chats/1/messages/1", json={"text": "after"}).status_code == 200
+    # chat lookup, message lookup, update, chat_stats, refresh -- the message is loaded once
+    assert query_budget[-1] == ("PUT /chats/{chat_id}/messages/{message_id}", 5)
+    assert client.put("/chats/2/messages/1", json={"text": "after"}).status_code == 404
+    assert query_budget[-1] == ("PUT /chats/{chat_id}/messages/{message_id}", 1)
+
+
+def test_seed_database_is_deterministic(tmp_path):
+    rows = []
+    for name in ("first", "second"):
+        engine = create_engine(f"sqlite:///{tmp_path}/{name}.db")
+        counts = seed_database(engine, accounts=50, chats=10, messages=500, join_requests=20, seed=7, hashes=["x"])
+        assert counts == {"accounts": 50, "chats": 10, "chat_memberships": counts["chat_memberships"],
+                          "messages": 500, "join_chat_request": 20, "chat_stats": 10}
+        with Session(engine) as session:
+            messages = session.exec(select(DBMessage).order_by(DBMessage.id)).all()
+            memberships = session.exec(select(DBChatMembership)).all()
+            rows.append(([m.model_dump() for m in messages], sorted((m.chat_id, m.account_id) for m in memberships)))
+            # Every author is a member of the chat, and ids follow time within a chat
+            assert all((m.chat_id, m.account_id) in rows[-1][1] for m in messages)
+            for chat_id in range(1, 11):
+                created = [m.created_at for m in messages if m.chat_id == chat_id]
+                assert created == sorted(created)
+    assert rows[0] == rows[1]
+
+
+def test_message_batch_routes(client, session, query_budget, auth_headers):
+    headers = auth_headers(client, "juniper")
+    client.post("/chats", json={"name": "bursty", "owner_id": 1}, headers=headers)
+
+    response = client.post("/chats/1/messages/batch", json={"account_id": 1, "texts": ["one", "two", "three"]}, headers=headers)
+    assert response.status_code == 201
+    body = response.json()
+    assert body["metadata"] == {"count": 3}
+    assert [(m["id"], m["text"]) for m in body["messages"]] == [(1, "one"), (2, "two"), (3, "three")]
+    # chat lookup, membership load, one insert, read marker update, chat_stats update
+    assert query_budget[-1] == ("POST /chats/{chat_id}/messages/batch", 5)
+    assert client.post("/chats/1/messages/batch", json={"account_id": 1, "texts": []}, headers=headers).status_code == 422
+    assert client.post("/chats/2/messages/batch", json={"account_id": 1, "texts": ["x"]}, headers=headers).status_code == 404
+
+    response = client.put("/chats/1/messages/batch", json={"messages": [{"id": 1, "text": "uno"}, {"id": 3, "text": "tres"}]}, headers=headers)
+    assert response.status_code == 200
+    assert [(m["id"], m["text"]) for m in response.json()["messages"]] == [(1, "uno"), (3, "tres")]
+    response = client.put("/chats/1/messages/batch", json={"messages": [{"id": 2, "text": "dos"}, {"id": 9, "text": "nueve"}]}, headers=headers)
+    assert response.status_code == 404
+    assert session.get(DBMessage, 2).text == "two"
+
+    # Editing and deleting need an authenticated member, and only touch the account's own messages
+    assert client.put("/chats/1/messages/batch", json={"messages": [{"id": 2, "text": "dos"}]}).status_code == 403
+    assert client.post("/chats/1/messages/batch/delete", json={"ids": [1, 2]}).status_code == 403
+    outsider_headers = auth_headers(client, "apple")
+    response = client.put("/chats/1/messages/batch", json={"messages": [{"id": 2, "text": "dos"}]}, headers=outsider_headers)
+    assert response.status_code == 422
+    assert response.json()["error"] == "chat_membership_required"
+    assert client.post("/chats/1/messages/batch/delete", json={"ids": [1, 2]}, headers=outsider_headers).status_code == 422
+    assert client.post("/chats/1/accounts/bulk", json={"account_ids": [2]}).status_code == 200
+    assert client.post("/chats/1/messages", json={"text": "four", "account_id": 2}, headers=outsider_headers).status_code == 201
+    response = client.put("/chats/1/messages/batch", json={"messages": [{"id": 2, "text": "dos"}, {"id": 4, "text": "cuatro"}]}, headers=outsider_headers)
+    assert response.status_code == 403
+    assert response.json()["error"] == "access_denied"
+    assert client.post("/chats/1/messages/batch/delete", json={"ids": [2, 4]}, headers=outsider_headers).status_code == 403
+    assert session.get(DBMessage, 2).text == "two"
+    assert client.post("/chats/1/messages/batch/delete", json={"ids": [4]}, headers=outsider_headers).status_code == 204
+
+    assert client.post("/chats/1/messages/batch/delete", json={"ids": [1, 9]}, headers=headers).status_code == 404
+    assert client.post("/chats/1/messages/batch/delete", json={"ids": [1, 2]}, headers=headers).status_code == 204
+    texts = [m["text"] for m in client.get("/chats/1/messages").json()["messages"]]
+    assert texts == ["tres"]
+
+
+def test_bulk_membership_routes(client, session, query_budget):
+    session.add_all([DBAccount(id=i, username=f"user{i}", email=f"user{i}@gmail.com", hashed_password="1") for i in range(1, 6)])
+    session.add(DBChat(id=1, name="team", owner_id=1))
+    session.add_all([DBChatMembership(account_id=1, chat_id=1), DBChatMembership(account_id=2, chat_id=1)])
+    session.add(DBMessage(id=1, text="hi", account_id=3, chat_id=1))
+    session.commit()
+
+    response = client.post("/chats/1/accounts/bulk", json={"account_ids": [2, 3, 4, 4, 99]})
+    assert response.status_code == 200
+    assert response.json() == {
+        "metadata": {"already_member": 1, "added": 2, "not_found": 1},
+        "results": [{"account_id": 2, "outcome": "already_member"}, {"account_id": 3, "outcome": "added"},
+                    {"account_id": 4, "outcome": "added"}, {"account_id": 99, "outcome": "not_found"}]
+    }
+    # chat lookup, IN query, INSERT ... SELECT, chat_stats update
+    assert query_budget[-1] == ("POST /chats/{chat_id}/accounts/bulk", 4)
+    assert client.get("/chats/1/accounts").json()["metadata"]["count"] == 4
+
+    response = client.post("/chats/1/accounts/bulk/delete", json={"account_ids": [1, 3, 5]})
+    assert response.json()["results"] == [{"account_id": 1, "outcome": "chat_owner"}, {"account_id": 3, "outcome": "removed"},
+                                          {"account_id": 5, "outcome": "not_member"}]
+    assert [account["id"] for account in client.get("/chats/1/accounts").json()["accounts"]] == [1, 2, 4]
+    assert client.get("/chats/1/messages").json()["messages"][0]["account_id"] is None
+    assert client.post("/chats/2/accounts/bulk", json={"account_ids": [1]}).status_code == 404
+    assert client.post("/chats/1/accounts/bulk", json={"account_ids": []}).status_code == 422
+
+
+def test_search_chat_messages(client, session, monkeypatch):
+    session.add(DBChat(id=1, name="search", owner_id=1))
+    session.add(DBChat(id=2, name="elsewhere", owner_id=1))
+    session.add_all([
+        DBMessage(id=1, text="the pony express rides at dawn", account_id=1, chat_id=1),
+        DBMessage(id=2, text="Pony pony PONY", account_id=1, chat_id=1),
+        DBMessage(id=3, text="nothing to see here", account_id=1, chat_id=1),
+        DBMessage(id=4, text="a pony in another chat", account_id=1, chat_id=2),
+        DBMessage(id=5, text="express delivery", account_id=1, chat_id=1),
+        DBMessage(id=6, text="<script>alert('pwned')</script> & <b>bold</b>", account_id=1, chat_id=1),
+    ])
+    session.commit()
 
+    body = client.get("/chats/1/messages/search", params={"q": "pony"}).json()
+    # Ranked by bm25 and scoped to the chat
+    assert [m["id"] for m in body["messages"]] == [2, 1]
+    assert body["messages"][1]["highlight"] == "the <mark>pony</mark> express rides at dawn"
+    assert body["metadata"] == {"count": 2, "next_cursor": None}
+
+    assert [m["id"] for m in client.get("/chats/1/messages/search", params={"q": "pony express"}).json()["messages"]] == [1]
+    assert [m["id"] for m in client.get("/chats/1/messages/search", params={"q": "expr*"}).json()["messages"]] == [5, 1]
+    # Message text is escaped, only the marks are markup
+    highlight = client.get("/chats/1/messages/search", params={"q": "alert"}).json()["messages"][0]["highlight"]
+    assert highlight == "&lt;script&gt;<mark>alert</mark>(&#x27;pwned&#x27;)&lt;/script&gt; &amp; &lt;b&gt;bold&lt;/b&gt;"
+    # FTS5 syntax is searched for literally instead of failing
+    assert client.get("/chats/1/messages/search", params={"q": 'pony" OR ("'}).status_code == 200
+
+    page = client.get("/chats/1/messages/search", params={"q": "pony", "limit": 1}).json()
+    assert [m["id"] for m in page["messages"]] == [2]
+    page = client.get("/chats/1/messages/search", params={"q": "pony", "cursor": page["metadata"]["next_cursor"]}).json()
+    assert [m["id"] for m in page["messages"]] == [1]
+
+    # The index follows edits and deletes
+    client.put("/chats/1/messages/3", json={"text": "a pony appears"})
+    client.delete("/chats/1/messages/2")
+    assert sorted(m["id"] for m in client.get("/chats/1/messages/search", params={"q": "pony"}).json()["messages"]) == [1, 3]
+
+    # Paging stops at MAX_SEARCH_RESULTS, a cursor past it is rejected
+    monkeypatch.setattr(messages_db, "MAX_SEARCH_RESULTS", 1)
+    body = client.get("/chats/1/messages/search", params={"q": "pony"}).json()
+    assert len(body["messages"]) == 1 and body["metadata"]["next_cursor"] is None
+    assert client.get("/chats/1/messages/search", params={"q": "pony", "cursor": encode_cursor(o=1)}).status_code == 422
+
+    assert client.get("/chats/9/messages/search", params={"q": "pony"}).status_code == 404
+    assert client.get("/chats/1/messages/search", params={"q": "pony", "cursor": "bad"}).status_code == 422
+
+
+def test_account_inbox(client, session, query_budget, auth_headers):
+    headers = auth_headers(client, "juniper")
+    session.add(DBAccount(id=2, username="other", email="other@gmail.com", hashed_password="1"))
+    session.add_all([DBChat(id=i, name=f"chat {i}", owner_id=1) for i in range(1, 5)])
+    session.add_all([DBChatMembership(account_id=1, chat_id=i) for i in (1, 2, 3)])
+    session.add(DBChatMembership(account_id=2, chat_id=4))
+    session.add_all([
+        DBMessage(id=1, text="old", account_id=1, chat_id=1, created_at=datetime(2025, 1, 1)),
+        DBMessage(id=2, text="newest in 1", account_id=1, chat_id=1, created_at=datetime(2025, 1, 3)),
+        DBMessage(id=3, text="only in 2", account_id=1, chat_id=2, created_at=datetime(2025, 1, 5)),
+        DBMessage(id=4, text="not mine", account_id=2, chat_id=4, created_at=datetime(2025, 1, 9)),
+    ])
+    session.commit()
+
+    body = client.get("/accounts/me/chats", headers=headers).json()
+    assert [(c["id"], c["message_count"], c["last_activity"]) for c in body["chats"]] == [
+        (2, 1, "2025-01-05T00:00:00"), (1, 2, "2025-01-03T00:00:00"), (3, 0, None)]
+    assert body["chats"][1]["last_message"]["text"] == "newest in 1"
+    assert body["chats"][2]["last_message"] is None
+    assert body["metadata"] == {"count": 3, "next_cursor": None}
+
+    ids = []
+    cursor = None
+    while True:
+        params = {"limit": 1, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/accounts/me/chats", params=params, headers=headers).json()
+        ids += [c["id"] for c in body["chats"]]
+        cursor = body["metadata"]["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == [2, 1, 3]
+    # One query per page once the token's account is cached
+    assert query_budget[-1] == ("GET /accounts/me/chats", 1)
+    assert client.get("/accounts/me/chats").status_code == 403
+
+
+def test_read_markers_and_unread_counts(client, session, query_budget, auth_headers):
+    tokens = {name: auth_headers(client, name) for name in ("juniper", "apple")}
+    client.post("/chats", json={"name": "one", "owner_id": 1}, headers=tokens["juniper"])
+    client.post("/chats", json={"name": "two", "owner_id": 1}, headers=tokens["juniper"])
+    client.post("/chats/1/accounts", json={"account_id": 2})
+
+    for text in ["a", "b", "c"]:
+        client.post("/chats/1/messages", json={"text": text, "account_id": 1}, headers=tokens["juniper"])
+    client.post("/chats/2/messages/batch", json={"account_id": 1, "texts": ["x", "y"]}, headers=tokens["juniper"])
+
+    body = client.get("/accounts/me/unread", headers=tokens["apple"]).json()
+    assert body == {"metadata": {"count": 1, "total": 3},
+                    "chats": [{"chat_id": 1, "last_read_message_id": None, "unread_count": 3}]}
+    # The author's own messages are read as they are posted
+    assert client.get("/accounts/me/unread", headers=tokens["juniper"]).json()["metadata"] == {"count": 2, "total": 0}
+    assert query_budget[-1] == ("GET /accounts/me/unread", 1)
+
+    response = client.put("/chats/1/read", json={"message_id": 2}, headers=tokens["apple"])
+    assert response.json() == {"chat_id": 1, "last_read_message_id": 2, "unread_count": 1}
+    # Never moves backwards
+    assert client.put("/chats/1/read", json={"message_id": 1}, headers=tokens["apple"]).json()["last_read_message_id"] == 2
+    assert client.put("/chats/1/read", json={}, headers=tokens["apple"]).json() == {"chat_id": 1, "last_read_message_id": 3, "unread_count": 0}
+
+    assert client.put("/chats/1/read", json={"message_id": 4}, headers=tokens["apple"]).status_code == 404
+    assert client.put("/chats/2/read", json={}, headers=tokens["apple"]).status_code == 422
+    assert client.put("/chats/9/read", json={}, headers=tokens["apple"]).status_code == 404
+
+
+def test_add_missing_columns(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.begin() as connection:
+        # chat_memberships as created before read markers existed
+        connection.exec_driver_sql("CREATE TABLE chat_memberships (account_id INTEGER NOT NULL, chat_id INTEGER NOT NULL, "
+                                   "PRIMARY KEY (account_id, chat_id))")
+        connection.exec_driver_sql("INSERT INTO chat_memberships VALUES (1, 1)")
+        add_missing_columns(connection)
+        assert connection.exec_driver_sql("SELECT last_read_message_id FROM chat_memberships").all() == [(None,)]
+
+        # and without the indexes added since
+        add_missing_indexes(connection)
+        indexes = {row[0] for row in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'chat_memberships'")}
+        assert "ix_chat_memberships_chat_id_account_id" in indexes
+
+        # messages stored while created_at was nullable get the epoch
+        connection.exec_driver_sql("CREATE TABLE messages (id INTEGER PRIMARY KEY, text VARCHAR, account_id INTEGER, "
+                                   "chat_id INTEGER, created_at DATETIME)")
+        connection.exec_driver_sql("INSERT INTO messages VALUES (1, 'old', 1, 1, NULL), (2, 'new', 1, 1, '2024-05-01 12:00:00.000000')")
+        backfill_message_timestamps(connection)
+        assert connection.exec_driver_sql("SELECT id, created_at FROM messages ORDER BY id").all() == [
+            (1, "1970-01-01 00:00:00.000000"), (2, "2024-05-01 12:00:00.000000")]
+
+
+def test_chat_stats_follow_writes(client, session, query_budget, auth_headers):
+    tokens = {name: auth_headers(client, name) for name in ("juniper", "apple", "pear")}
+    client.post("/chats", json={"name": "one", "owner_id": 1}, headers=tokens["juniper"])
+    client.post("/chats/1/accounts", json={"account_id": 2})
+    client.post("/chats/1/accounts/bulk", json={"account_ids": [3]})
+    for text in ["a", "b", "c"]:
+        client.post("/chats/1/messages", json={"text": text, "account_id": 1}, headers=tokens["juniper"])
+    client.post("/chats/1/messages/batch", json={"account_id": 2, "texts": ["x", "y"]}, headers=tokens["apple"])
+    client.delete("/chats/1/messages/5", headers=tokens["apple"])
+    client.delete("/chats/1/accounts/3")
+
+    stats = client.get("/chats/1/stats").json()
+    assert query_budget[-1] == ("GET /chats/{chat_id}/stats", 1)
+    assert {key: stats[key] for key in ("message_count", "member_count", "last_message_id")} == \
+        {"message_count": 4, "member_count": 2, "last_message_id": 4}
+    assert client.get("/chats/1/messages", params={"include_total": True}).json()["metadata"]["total"] == 4
+    assert client.get("/accounts/me/chats", headers=tokens["apple"]).json()["chats"][0]["message_count"] == 4
+    assert client.get("/chats/9/stats").status_code == 404
+
+    # A missing row is computed from the base tables when read, and not written
+    session.delete(session.get(DBChatStats, 1))
+    session.commit()
+    assert client.get("/accounts/me/chats", headers=tokens["apple"]).json()["chats"][0]["message_count"] == 4
+    assert client.get("/chats/1/stats").json() == stats
+    # chat_stats lookup, the computed row
+    assert query_budget[-1] == ("GET /chats/{chat_id}/stats", 2)
+    # The deepest path of the messages route: chat, anchor, page, chat_stats lookup, the computed row
+    page = client.get("/chats/1/messages", params={"before_id": 4, "include_total": True}).json()
+    assert page["metadata"]["total"] == 4 and [message["id"] for message in page["messages"]] == [1, 2, 3]
+    assert query_budget[-1] == ("GET /chats/{chat_id}/messages", 5)
+    assert session.get(DBChatStats, 1) is None
+    # The repair job writes it back
+    stats_db.rebuild_chat_stats(session, [1])
+
+    # A rebuild never lowers the change sequence, it counts as a change so event streams behind it reset
+    session.get(DBChatStats, 1).change_seq = 9
+    session.commit()
+    stats_db.rebuild_chat_stats(session, [1])
+    session.expire_all()
+    assert (session.get(DBChatStats, 1).change_seq, session.get(DBChatStats, 1).last_changed_seq) == (10, 10)
+
+    # The member count of /accounts is the stored one
+    session.get(DBChatStats, 1).member_count = 7
+    session.commit()
+    assert client.get("/chats/1/accounts").json()["metadata"]["count"] == 7
+
+    # A tombstoned or missing chat has no stats to compute
+    session.delete(session.get(DBChatStats, 1))
+    session.commit()
+    chats_db.tombstone_chat(session, 1)
+    assert stats_db.get_chat_stats(session, 1) is None
+    assert stats_db.get_chat_stats(session, 1, include_deleted=True).message_count == 4
+    assert stats_db.get_chat_stats(session, 9) is None
+
+
+def test_lifecycle_deletes_run_in_the_database(tmp_path, query_budget, auth_headers):
+    # The app's SQLite profile, so the ondelete rules are enforced
+    engine = build_engine(DatabaseSettings(url=f"sqlite:///{tmp_path}/lifecycle.db"))
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        app.dependency_overrides[get_session] = lambda: session
+        client = TestClient(app)
+        try:
+            tokens = {name: auth_headers(client, name) for name in ("juniper", "apple")}
+            for name in ("one", "two"):
+                client.post("/chats", json={"name": name, "owner_id": 1}, headers=tokens["juniper"])
+                client.post(f"/chats/{1 if name == 'one' else 2}/accounts", json={"account_id": 2})
+            for chat_id in (1, 2):
+                client.post(f"/chats/{chat_id}/messages/batch", json={"account_id": 2, "texts": ["a", "b", "c"]},
+                            headers=tokens["apple"])
+
+            # Leaving a chat only nulls the messages sent in that chat, whatever their number
+            assert client.delete("/chats/1/accounts/2").status_code == 204
+            # chat lookup, account lookup, one UPDATE of messages, one DELETE, chat_stats update
+            assert query_budget[-1] == ("DELETE /chats/{chat_id}/accounts/{account_id}", 5)
+            authors = session.exec(select(DBMessage.chat_id, DBMessage.account_id).order_by(DBMessage.id)).all()
+            assert authors == [(1, None)] * 3 + [(2, 2)] * 3
+
+            # Deleting the account nulls its remaining messages and drops its memberships in the database
+            assert client.delete("/accounts/me", headers=tokens["apple"]).status_code == 204
+            session.expire_all()
+            assert session.exec(select(DBMessage.account_id).where(DBMessage.chat_id == 2)).all() == [None] * 3
+            assert session.exec(select(DBChatMembership.account_id)).all() == [1, 1]
+
+            # Deleting a chat cascades to its messages, memberships and stats
+            client.delete("/chats/2")
+            assert chat_purger.wait(timeout=10)
+            assert session.exec(select(func.count()).select_from(DBMessage).where(DBMessage.chat_id == 2)).one() == 0
+            assert session.get(DBChatStats, 2) is None
+            assert session.exec(select(DBChatMembership.chat_id)).all() == [1]
+        finally:
+            app.dependency_overrides.clear()
+
+
+def test_deleted_chat_is_hidden_then_purged_in_batches(client, session):
+    session.add(DBAccount(id=1, username="john", email="john@gmail.com", hashed_password="1"))
+    session.add(DBChat(id=1, name="big", owner_id=1))
+    session.add(DBChatMembership(account_id=1, chat_id=1))
+    session.add_all([DBMessage(text=f"message {i}", account_id=1, chat_id=1) for i in range(25)])
+    session.commit()
+
+    # Tombstoned: hidden from every read, purge progress is reported until the row is gone
+    chats_db.tombstone_chat(session, chat_id=1)
+    assert client.get("/chats/1").status_code == 404
+    assert client.get("/chats", params={"include_count": True}).json()["metadata"]["count"] == 0
+    assert client.get("/chats/1/messages").status_code == 404
+    assert client.get("/chats/1/accounts").status_code == 404
+    assert unique_chat_name(session, "big")
+    progress = client.get("/chats/1/deletion").json()
+    assert progress["chat_id"] == 1 and progress["remaining_messages"] == 25
+
+    # An interrupted purge resumes from the tombstone
+    engine = session.get_bind()
+    assert chats_db.purge_chat_messages(session, chat_id=1, limit=10) == 10
+    assert client.get("/chats/1/deletion").json()["remaining_messages"] == 15
+    assert chats_db.get_deleted_chat_ids(session) == [1]
+    assert purge_chat(engine, chat_id=1, batch_size=10, pause=0) == 15
+    assert session.exec(select(func.count()).select_from(DBMessage)).one() == 0
+    assert chats_db.get_deleted_chat_ids(session) == []
+    assert client.get("/chats/1/deletion").status_code == 404
+    assert client.get("/chats/2/deletion").status_code == 404
+
+
+def test_export_chat_messages(client, session, auth_headers):
+    tokens = {name: auth_headers(client, name) for name in ("juniper", "apple")}
+    client.post("/chats", json={"name": "one", "owner_id": 1}, headers=tokens["juniper"])
+    texts = [f"message {i}" for i in range(2500)]
+    session.add_all([DBMessage(text=text, account_id=1, chat_id=1) for text in texts])
+    session.commit()
+
+    response = client.get("/chats/1/messages/export", headers=tokens["juniper"])
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert [json.loads(line)["text"] for line in lines] == texts
+    # The stream yields one chunk per batch read from the database
+    assert [chunk.count(b"\n") for chunk in export_lines(session.get_bind(), 1)] == [1000, 1000, 500]
+    assert json.loads(lines[0]).keys() == {"id", "text", "account_id", "chat_id", "created_at"}
+
+    response = client.get("/chats/1/messages/export", params={"compress": True}, headers=tokens["juniper"])
+    assert response.headers["content-disposition"] == 'attachment; filename="chat-1-messages.ndjson.gz"'
+    assert gzip.decompress(response.content).decode().splitlines() == lines
+
+    assert client.get("/chats/1/messages/export", headers=tokens["apple"]).status_code == 422
+    assert client.get("/chats/9/messages/export", headers=tokens["juniper"]).status_code == 404
+
+
+def test_import_messages_resumes_and_rebuilds(tmp_path):
+    engine = build_engine(DatabaseSettings(url=f"sqlite:///{tmp_path}/import.db"))
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all([DBAccount(id=1, username="juniper", email="juniper@email.com", hashed_password="1"),
+                         DBAccount(id=2, username="apple", email="apple@email.com", hashed_password="2")])
+        session.add(DBChat(id=1, name="migrated", owner_id=1))
+        session.commit()
+
+    authors = ["juniper", "apple", "gone", None]
+    lines = [json.dumps({"username": authors[i % 4], "text": f"pony {i}",
+                         "created_at": datetime(2020, 1, 1, 0, i).isoformat()}) for i in range(24)]
+    # A timestamp with an offset is stored as the same instant in local time, like datetime.now()
+    lines.append(json.dumps({"username": "juniper", "text": "pony 24", "created_at": "2020-01-01T05:24:00+05:00"}))
+    path = tmp_path / "history.ndjson.gz"
+    # A malformed line stops the first run after two committed chunks
+    path.write_bytes(gzip.compress("\n".join(lines[:22] + ["{not json"] + lines[23:]).encode()))
+    with pytest.raises(ValueError, match="history.ndjson.gz:23"):
+        import_messages(engine, path, chat_id=1, batch_size=10, defer_indexes=True)
+    # The deferred indexes come back and chat_stats counts the committed chunks even though the load failed
+    with Session(engine) as session:
+        assert session.get(DBChatStats, 1).message_count == 20
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").first() is not None
+        assert connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'ix_messages_chat_id_id'").first() is not None
+
+    path.write_bytes(gzip.compress("\n".join(lines).encode()))
+    assert import_messages(engine, path, chat_id=1, batch_size=10, defer_indexes=True) == {"lines": 5, "messages": 5, "unknown_authors": 2}
+    assert import_messages(engine, path, chat_id=1, batch_size=10) == {"lines": 0, "messages": 0, "unknown_authors": 0}
+
+    with Session(engine) as session:
+        messages = session.exec(select(DBMessage).order_by(DBMessage.id)).all()
+        assert [m.text for m in messages] == [f"pony {i}" for i in range(25)]
+        assert [m.account_id for m in messages[:4]] == [1, 2, None, None]
+        assert messages[23].created_at == datetime(2020, 1, 1, 0, 23)
+        assert messages[24].created_at == datetime(2020, 1, 1, 0, 24, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+        # Indexes, the full-text index and chat_stats are rebuilt at the end
+        assert session.get(DBChatStats, 1).message_count == 25
+        assert len(messages_db.search_messages(session, chat_id=1, query="pony", limit=50)[0]) == 25
+        indexes = {row[0] for row in session.connection().exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'messages'")}
+        assert {"ix_messages_chat_id_id", "ix_messages_chat_id_created_at_id", "ix_messages_account_id"} <= indexes
+        assert session.get(DBImportCheckpoint, str(path.resolve())).lines == 25
 
+    with pytest.raises(ValueError, match="Unable to find chat"):
+        import_messages(engine, path, chat_id=2)
 
+    # Lines that parse but aren't valid messages are reported with their line number too
+    for line, error in [('{"username": "juniper"}', "bad.ndjson:2: missing text"),
+                        ('{"text": "hi", "created_at": "yesterday"}', "bad.ndjson:2: invalid created_at"),
+                        ('["hi"]', "bad.ndjson:2: expected a JSON object")]:
+        bad = tmp_path / "bad.ndjson"
+        bad.write_text(lines[0] + "\n" + line + "\n")
+        with pytest.raises(ValueError, match=error):
+            import_messages(engine, bad, chat_id=1, source=line)
 
 
+def test_fast_json_responses_match_default(client, session, monkeypatch, auth_headers):
+    headers = auth_headers(client, "jüniper", email="juniper@email.com")
+    client.post("/chats", json={"name": "pony ✉", "owner_id": 1}, headers=headers)
+    session.add_all([DBMessage(text="héllo \"pony\" 🐎", account_id=1, chat_id=1, created_at=datetime(2024, 5, 1, 12)),
+                     DBMessage(text="left", account_id=None, chat_id=1, created_at=datetime(2024, 5, 1, 12, 0, 1, 250))])
+    session.commit()
 
+    paths = ["/chats?include_count=true", "/accounts?include_count=true&limit=1", "/chats/1/accounts",
+             "/chats/1/messages?include_total=true", "/chats/1/messages?limit=1"]
+    default = [client.get(path, headers=headers) for path in paths]
+    monkeypatch.setattr(responses, "FAST_JSON_RESPONSES", True)
+    fast = [client.get(path, headers=headers) for path in paths]
+    for before, after in zip(default, fast):
+        assert after.status_code == before.status_code == 200
+        assert after.headers["content-type"] == before.headers["content-type"]
+        assert after.content == before.content
+    # Only the response model's fields are rendered
+    assert b"hashed_password" not in fast[1].content
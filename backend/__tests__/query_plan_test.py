@@ -0,0 +1,206 @@
+"""
+Runs every query issued by the helpers in backend/database against a seeded database
+and fails if EXPLAIN QUERY PLAN shows a scan of a whole table (SCAN <table>, with or
+without an index, as opposed to SEARCH). Helpers that read every row by design are
+listed in ALLOWED_SCANS, and every helper taking a session has to be exercised or
+listed in NOT_EXERCISED, so new helpers are checked too.
+"""
+
+import inspect
+import re
+from datetime import datetime
+
+import anyio
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, select
+
+from backend import security
+from backend.cache import membership_index
+from backend.database import accounts as accounts_db
+from backend.database import auth as auth_db
+from backend.database import chatmembership as chatmembership_db
+from backend.database import chats as chats_db
+from backend.database import messages as messages_db
+from backend.database import requests as requests_db
+from backend.database import stats as stats_db
+from backend.database.chats import UpdateChatRequest
+from backend.database.messages import UpdateMessageRequest
+from backend.database.schema import *
+from backend.database.seed import seed_database
+from backend.dependencies import build_engine
+from backend.settings import DatabaseSettings
+
+MODULES = (accounts_db, auth_db, chatmembership_db, chats_db, messages_db, requests_db, stats_db)
+
+# helper -> tables it may scan, and why
+ALLOWED_SCANS = {
+    "accounts.count_accounts": ({"accounts"}, "counts every account"),
+    "accounts.get_accounts_page": ({"accounts"}, "walks the primary key and stops after limit rows"),
+    "chats.count_chats": ({"chats"}, "counts every chat"),
+    "chats.get_chats_page": ({"chats"}, "walks the primary key and stops after limit rows"),
+    "stats.rebuild_chat_stats": ({"chats", "chat_stats"}, "the repair job recomputes every chat"),
+}
+
+NOT_EXERCISED = {
+    "requests.create_request": "imports the stdlib select module, its queries can't run",
+    "requests._request_exists": "imports the stdlib select module, its queries can't run",
+    "requests._chat_membership_exists": "imports the stdlib select module, its queries can't run",
+    "accounts.is_account_chat_owner": "compares ids, no query",
+}
+
+SCAN = re.compile(r"^SCAN (\w+)")
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # The app's SQLite profile, so foreign key actions are planned as well
+    engine = build_engine(DatabaseSettings(url=f"sqlite:///{tmp_path}/plans.db"))
+    SQLModel.metadata.create_all(engine)
+    seed_database(engine, accounts=400, chats=80, messages=8000, join_requests=200, seed=3, hashes=["x"])
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ANALYZE")
+    yield engine
+    engine.dispose()
+
+
+def _helpers() -> set[str]:
+    names = set()
+    for module in MODULES:
+        short = module.__name__.rsplit(".", 1)[1]
+        for name, function in inspect.getmembers(module, inspect.isfunction):
+            if function.__module__ == module.__name__ and "session" in inspect.signature(function).parameters:
+                names.add(f"{short}.{name}")
+    return names
+
+
+def _calls(session: Session) -> list[tuple[str, callable]]:
+    """
+    One call per helper (a few with more than one shape), ordered so the destructive ones run last
+    """
+    member = session.exec(select(DBChatMembership).join(DBChat, DBChat.owner_id != DBChatMembership.account_id)
+                          .where(DBChat.id == DBChatMembership.chat_id)).first()
+    chat_id, account_id = member.chat_id, member.account_id
+    chat = session.get(DBChat, chat_id)
+    account = session.get(DBAccount, account_id)
+    outsider = session.exec(select(DBAccount).where(DBAccount.id.not_in(
+        select(DBChatMembership.account_id).where(DBChatMembership.chat_id == chat_id)))).first()
+    owner_free = session.exec(select(DBAccount).where(DBAccount.id.not_in(select(DBChat.owner_id)))).first()
+    message = session.exec(select(DBMessage).where(DBMessage.chat_id == chat_id).order_by(DBMessage.id)).first()
+    message_ids = list(session.exec(select(DBMessage.id).where(DBMessage.chat_id == chat_id).order_by(DBMessage.id).limit(5)))
+    keyset = (message.created_at, message.id)
+    other_chat_id = session.exec(select(DBChat.id).where(DBChat.id != chat_id).order_by(DBChat.id.desc())).first()
+
+    def new_chat_without_stats():
+        new_chat = DBChat(name="no stats yet", owner_id=account_id)
+        session.add(new_chat)
+        session.commit()
+        stats_db.create_chat_stats(session, new_chat.id)
+        session.commit()
+
+    return [
+        ("accounts.count_accounts", lambda: accounts_db.count_accounts(session)),
+        ("accounts.get_accounts_page", lambda: accounts_db.get_accounts_page(session, limit=50, after_id=100)),
+        ("accounts.get_by_account_email", lambda: accounts_db.get_by_account_email(session, account.email)),
+        ("accounts.get_by_account_id", lambda: accounts_db.get_by_account_id(session, account_id)),
+        ("accounts.get_by_account_username", lambda: accounts_db.get_by_account_username(session, account.username)),
+        ("accounts.get_hashed_password", lambda: accounts_db.get_hashed_password(session, account_id)),
+        ("accounts.get_chat_accounts", lambda: accounts_db.get_chat_accounts(session, chat_id)),
+        ("accounts.owns_chats", lambda: accounts_db.owns_chats(session, account_id)),
+        ("auth.email_exists", lambda: auth_db.email_exists(session, account.email)),
+        ("auth.username_exists", lambda: auth_db.username_exists(session, account.username)),
+        ("chats.count_chats", lambda: chats_db.count_chats(session)),
+        ("chats.get_chat_by_id", lambda: chats_db.get_chat_by_id(session, chat_id)),
+        ("chats.get_chats_page", lambda: chats_db.get_chats_page(session, limit=20, after_id=10)),
+        ("chats.get_inbox_page", lambda: chats_db.get_inbox_page(session, account_id, limit=20)),
+        ("chats.get_inbox_page", lambda: chats_db.get_inbox_page(session, account_id, limit=20, before=(datetime(2024, 6, 1), 10))),
+        ("chats.get_same_chat_name", lambda: chats_db.get_same_chat_name(session, chat.name)),
+        ("chats.unique_chat_name", lambda: chats_db.unique_chat_name(session, chat.name)),
+        ("chats.get_deleted_chat_ids", lambda: chats_db.get_deleted_chat_ids(session)),
+        ("chats.get_deleted_chat", lambda: chats_db.get_deleted_chat(session, chat_id)),
+        ("chatmembership.get_chat_member_ids", lambda: chatmembership_db.get_chat_member_ids(session, chat_id)),
+        ("chatmembership.is_account_chat_member", lambda: (membership_index.clear(),
+                                                           chatmembership_db.is_account_chat_member(session, account_id, chat))),
+        ("chatmembership.get_read_state", lambda: chatmembership_db.get_read_state(session, chat_id, account_id)),
+        ("chatmembership.get_unread_counts", lambda: chatmembership_db.get_unread_counts(session, account_id)),
+        ("chatmembership.advance_read_marker", lambda: chatmembership_db.advance_read_marker(session, chat_id, account_id, message.id)),
+        ("messages.get_latest_message_id", lambda: messages_db.get_latest_message_id(session, chat_id)),
+        ("messages.get_message_by_id", lambda: messages_db.get_message_by_id(session, message.id)),
+        ("messages.get_latest_messages", lambda: messages_db.get_latest_messages(session, chat_id, limit=50, up_to_id=message.id)),
+        ("messages.get_messages_by_ids", lambda: messages_db.get_messages_by_ids(session, chat_id, message_ids)),
+        ("messages.iter_message_batches", lambda: list(messages_db.iter_message_batches(session, chat_id, batch_size=100))),
+        ("messages.get_messages_page", lambda: messages_db.get_messages_page(session, chat_id, limit=50)),
+        ("messages.get_messages_page", lambda: messages_db.get_messages_page(session, chat_id, limit=50, before=keyset)),
+        ("messages.get_messages_page", lambda: messages_db.get_messages_page(session, chat_id, limit=50, after=keyset)),
+        ("messages.message_in_chat", lambda: messages_db.message_in_chat(session, message.id, chat)),
+        ("messages.search_messages", lambda: messages_db.search_messages(session, chat_id, "pony express", 20, 0, "[", "]")),
+        ("stats.get_chat_stats", lambda: stats_db.get_chat_stats(session, chat_id)),
+        ("stats.rebuild_chat_stats", lambda: stats_db.rebuild_chat_stats(session)),
+        ("stats.rebuild_chat_stats", lambda: stats_db.rebuild_chat_stats(session, [chat_id])),
+        ("stats.record_members_changed", lambda: stats_db.record_members_changed(session, chat_id, 1)),
+        ("stats.record_messages_added", lambda: stats_db.record_messages_added(session, chat_id, 1, message.id, message.created_at)),
+        ("stats.record_messages_removed", lambda: stats_db.record_messages_removed(session, chat_id, 1)),
+        ("stats.record_messages_changed", lambda: stats_db.record_messages_changed(session, chat_id, 1)),
+        ("stats.record_account_left_chats", lambda: stats_db.record_account_left_chats(session, account_id)),
+        ("stats.create_chat_stats", new_chat_without_stats),
+        ("chats.add_chat", lambda: chats_db.add_chat(session, DBChat(name="added", owner_id=account_id))),
+        ("chats.update_chat", lambda: chats_db.update_chat(session, chat_id, UpdateChatRequest(chat_name="renamed"))),
+        ("messages.create_message", lambda: messages_db.create_message(session, DBMessage(text="new", account_id=account_id, chat_id=chat_id))),
+        ("messages.create_messages", lambda: messages_db.create_messages(session, chat_id, account_id, ["one", "two"])),
+        ("messages.update_message", lambda: messages_db.update_message(session, message, UpdateMessageRequest(text="edited"))),
+        ("messages.update_messages", lambda: messages_db.update_messages(session, [message], {message.id: "edited again"})),
+        ("messages.delete_messages", lambda: messages_db.delete_messages(session, chat_id, message_ids[1:3])),
+        ("messages.delete_message", lambda: messages_db.delete_message(session, message)),
+        ("chatmembership.create_membership", lambda: chatmembership_db.create_membership(
+            session, DBChatMembership(account_id=outsider.id, chat_id=chat_id))),
+        ("chatmembership.delete_membership", lambda: chatmembership_db.delete_membership(session, chat_id, outsider.id)),
+        ("chatmembership.add_chat_member", lambda: chatmembership_db.add_chat_member(session, outsider, chat)),
+        ("chatmembership.remove_chat_members", lambda: chatmembership_db.remove_chat_members(session, chat, [outsider.id])),
+        ("chatmembership.add_chat_members", lambda: chatmembership_db.add_chat_members(session, chat, [outsider.id, 10**6])),
+        ("messages.nullify_account_messages", lambda: messages_db.nullify_account_messages(session, account_id, chat_id)),
+        ("auth.create_account", lambda: auth_db.create_account(session, "planned", "planned@example.com",
+                                                               anyio.run(security.hash_password_async, "password4"))),
+        ("auth.verify_user", lambda: anyio.run(auth_db.verify_user, session, "planned", "password4")),
+        ("accounts.update_email", lambda: accounts_db.update_email(session, account, "renamed@example.com")),
+        ("accounts.update_password", lambda: accounts_db.update_password(session, account, "hash")),
+        ("accounts.update_username", lambda: accounts_db.update_username(session, account, "renamed")),
+        ("accounts.delete_account", lambda: accounts_db.delete_account(session, owner_free)),
+        ("chats.tombstone_chat", lambda: chats_db.tombstone_chat(session, other_chat_id)),
+        ("chats.purge_chat_messages", lambda: chats_db.purge_chat_messages(session, other_chat_id, limit=100)),
+        ("chats.delete_chat", lambda: chats_db.delete_chat(session, other_chat_id)),
+    ]
+
+
+def test_database_helpers_never_scan_whole_tables(engine):
+    tables = set(SQLModel.metadata.tables)
+    statements: list[tuple[str, str, object]] = []
+    current = [""]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if current[0] and statement.lstrip().split(" ", 1)[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+            # an executemany statement has one plan, explain it with its first parameter set
+            # (multi-row INSERT ... VALUES batches arrive flattened, as one set)
+            if executemany and parameters and isinstance(parameters[0], (tuple, list, dict)):
+                parameters = parameters[0]
+            statements.append((current[0], statement, parameters))
+
+    with Session(engine) as session:
+        calls = _calls(session)
+        for name, call in calls:
+            current[0] = name
+            call()
+        session.commit()
+    event.remove(engine, "before_cursor_execute", _record)
+
+    assert _helpers() - set(NOT_EXERCISED) == {name for name, _ in calls}
+
+    scans = set()
+    with engine.connect() as connection:
+        for name, statement, parameters in statements:
+            allowed = ALLOWED_SCANS.get(name, (set(), ""))[0]
+            for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters):
+                match = SCAN.match(row[-1])
+                if match and match.group(1) in tables and match.group(1) not in allowed:
+                    scans.add(f"{name}: {row[-1]}\n    {' '.join(statement.split())}")
+    assert not scans, "full table scans:\n" + "\n".join(sorted(scans))
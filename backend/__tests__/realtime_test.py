@@ -0,0 +1,256 @@
+import asyncio
+import pytest
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from backend.main import app
+from sqlmodel import Session, SQLModel, StaticPool, create_engine
+from backend.database.schema import *
+from backend.dependencies import get_session
+from backend.metrics import registry
+from backend import realtime
+from backend.realtime import ChatEventBroker
+
+
+@pytest.fixture
+def session():
+    # Session fixture
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def client(session):
+    # Client fixture
+    def _get_session_override():
+        return session
+
+    app.dependency_overrides[get_session] = _get_session_override
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def _login(client: TestClient, username: str) -> str:
+    user = {"username": username, "email": f"{username}@email.com", "password": "password4"}
+    client.post("/auth/registration", data=user)
+    return client.post("/auth/token", data=user).json()["access_token"]
+
+
+def test_websocket_receives_message_events(client: TestClient):
+    token = _login(client, "juniper")
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/chats", json={"name": "live", "owner_id": 1}, headers=headers)
+
+    with client.websocket_connect(f"/chats/1/ws?token={token}") as websocket:
+        created = client.post("/chats/1/messages", json={"text": "hello", "account_id": 1}, headers=headers).json()
+        event = websocket.receive_json()
+        assert event["type"] == "message_created"
+        assert event["chat_id"] == 1
+        assert event["message"]["id"] == created["id"]
+        assert event["message"]["text"] == "hello"
+
+        client.put(f"/chats/1/messages/{created['id']}", json={"text": "edited"})
+        event = websocket.receive_json()
+        assert event["type"] == "message_updated"
+        assert event["message"]["text"] == "edited"
+
+        client.delete(f"/chats/1/messages/{created['id']}")
+        assert websocket.receive_json() == {"type": "message_deleted", "chat_id": 1, "seq": 3, "message": {"id": created["id"]}}
+
+
+def test_websocket_rejects_non_members(client: TestClient):
+    owner_token = _login(client, "juniper")
+    client.post("/chats", json={"name": "live", "owner_id": 1}, headers={"Authorization": f"Bearer {owner_token}"})
+    outsider_token = _login(client, "apple")
+
+    for url in ["/chats/1/ws", "/chats/1/ws?token=invalid", f"/chats/1/ws?token={outsider_token}", f"/chats/2/ws?token={owner_token}"]:
+        with pytest.raises(WebSocketDisconnect) as disconnect:
+            with client.websocket_connect(url):
+                pass
+        assert disconnect.value.code == 1008
+
+
+def test_websocket_closes_when_membership_ends(client: TestClient):
+    owner_token = _login(client, "juniper")
+    headers = {"Authorization": f"Bearer {owner_token}"}
+    client.post("/chats", json={"name": "live", "owner_id": 1}, headers=headers)
+    member_token = _login(client, "apple")
+    client.post("/chats/1/accounts", json={"account_id": 2})
+
+    with client.websocket_connect(f"/chats/1/ws?token={owner_token}") as owner_socket:
+        with client.websocket_connect(f"/chats/1/ws?token={member_token}") as member_socket:
+            assert client.delete("/chats/1/accounts/2").status_code == 204
+            with pytest.raises(WebSocketDisconnect) as disconnect:
+                member_socket.receive_json()
+            assert disconnect.value.code == 1008
+        # Other members keep their socket until the chat is deleted
+        client.post("/chats/1/messages", json={"text": "still here", "account_id": 1}, headers=headers)
+        assert owner_socket.receive_json()["message"]["text"] == "still here"
+        assert client.delete("/chats/1").status_code == 204
+        with pytest.raises(WebSocketDisconnect) as disconnect:
+            owner_socket.receive_json()
+        assert disconnect.value.code == 1008
+    assert realtime.chat_events.connection_count() == 0
+
+
+def test_event_stream_replays_after_last_event_id(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(realtime, "SSE_HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(realtime, "SSE_IDLE_TIMEOUT_SECONDS", 0.2)
+    token = _login(client, "juniper")
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/chats", json={"name": "live", "owner_id": 1}, headers=headers)
+    for text in ["one", "two", "three"]:
+        client.post("/chats/1/messages", json={"text": text, "account_id": 1}, headers=headers)
+
+    response = client.get("/chats/1/events", headers={**headers, "Last-Event-ID": "1"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = [frame for frame in response.text.split("\n\n") if frame]
+    assert frames[0].startswith("id: 2\nevent: message_created\ndata: ")
+    assert frames[1].startswith("id: 3\nevent: message_created\ndata: ")
+    assert '"text":"three"' in frames[1]
+    # Stream idles with heartbeats until the idle timeout closes it
+    assert frames[2] == ": keep-alive"
+    assert realtime.chat_events.connection_count() == 0
+    # The request latency covers the stream up to its start, not its lifetime
+    latency = registry.routes[("GET", "/chats/{chat_id}/events")].latency
+    assert latency.count == 1 and latency.sum < realtime.SSE_IDLE_TIMEOUT_SECONDS
+
+    # Too many missed messages -> client is told to refetch instead
+    monkeypatch.setattr(realtime, "SSE_REPLAY_LIMIT", 1)
+    response = client.get("/chats/1/events", headers={**headers, "Last-Event-ID": "0"})
+    assert response.text.startswith("id: 3\nevent: reset\n")
+    # The reset's id is resent on reconnect, the client isn't reset again
+    response = client.get("/chats/1/events", headers={**headers, "Last-Event-ID": "3"})
+    assert "event: reset" not in response.text
+
+
+def test_event_stream_resets_after_missed_edits(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(realtime, "SSE_IDLE_TIMEOUT_SECONDS", 0.1)
+    token = _login(client, "juniper")
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/chats", json={"name": "live", "owner_id": 1}, headers=headers)
+    for text in ["one", "two"]:
+        client.post("/chats/1/messages", json={"text": text, "account_id": 1}, headers=headers)
+
+    # An edit made while the client was away isn't replayable
+    client.put("/chats/1/messages/1", json={"text": "edited"})
+    response = client.get("/chats/1/events", headers={**headers, "Last-Event-ID": "2"})
+    assert response.text.startswith("id: 3\nevent: reset\n")
+    # Reconnecting with the reset's id, or the edit's for a client that received it live, doesn't reset again
+    response = client.get("/chats/1/events", headers={**headers, "Last-Event-ID": "3"})
+    assert "event: reset" not in response.text
+
+    # A client that saw a message created after the edit has seen the edit too
+    client.post("/chats/1/messages", json={"text": "three", "account_id": 1}, headers=headers)
+    response = client.get("/chats/1/events", headers={**headers, "Last-Event-ID": "4"})
+    assert "event: reset" not in response.text
+    # A client still behind the edit is reset to the current sequence number, which it reconnects with
+    response = client.get("/chats/1/events", headers={**headers, "Last-Event-ID": "1"})
+    assert response.text.startswith("id: 4\nevent: reset\n")
+
+    # Deleting the newest message leaves last_message_id below the sequence
+    client.delete("/chats/1/messages/3")
+    response = client.get("/chats/1/events", headers={**headers, "Last-Event-ID": "4"})
+    assert response.text.startswith("id: 5\nevent: reset\n")
+    assert '"last_message_id":2' in response.text
+    response = client.get("/chats/1/events", headers={**headers, "Last-Event-ID": "5"})
+    assert "event: reset" not in response.text
+
+    # Messages created after the delete are replayed again, numbered from the client's id
+    client.post("/chats/1/messages", json={"text": "four", "account_id": 1}, headers=headers)
+    response = client.get("/chats/1/events", headers={**headers, "Last-Event-ID": "5"})
+    assert response.text.startswith("id: 6\nevent: message_created\n")
+    assert '"text":"four"' in response.text
+    # An id past the chat's sequence can't be resumed
+    response = client.get("/chats/1/events", headers={**headers, "Last-Event-ID": "9"})
+    assert response.text.startswith("id: 6\nevent: reset\n")
+
+
+def test_event_stream_releases_subscription_never_iterated():
+    async def disconnect_before_first_chunk():
+        subscription = realtime.chat_events.subscribe(1)
+        response = realtime.EventStreamResponse(subscription, [], None)
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            raise OSError("client went away")
+
+        # Raised from the response's task group, possibly wrapped in an ExceptionGroup
+        with pytest.raises(Exception):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        return realtime.chat_events.connection_count()
+
+    assert asyncio.run(disconnect_before_first_chunk()) == 0
+
+
+def test_event_stream_orders_events_published_out_of_order(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(realtime, "SSE_HEARTBEAT_SECONDS", 10)
+    monkeypatch.setattr(realtime, "SSE_REORDER_SECONDS", 0.05)
+
+    def created(seq: int) -> dict:
+        return {"type": "message_created", "chat_id": 1, "seq": seq, "message": {"id": seq}}
+
+    async def stream(published: list[int], count: int) -> list[list[str]]:
+        subscription = realtime.chat_events.subscribe(1)
+        frames = realtime.stream_events(subscription, [], 5)
+        # Writers publish after they commit, so seq 7 may reach the broker before seq 6
+        for seq in published:
+            realtime.chat_events.publish(1, created(seq))
+        received = [await anext(frames) for _ in range(count)]
+        await frames.aclose()
+        return [frame.split("\n")[:2] for frame in received]
+
+    assert asyncio.run(stream([7, 6], 2)) == [["id: 6", "event: message_created"], ["id: 7", "event: message_created"]]
+    # A seq that never arrives resets the client past the held back events, they aren't dropped silently
+    assert asyncio.run(stream([7, 8], 1)) == [["id: 8", "event: reset"]]
+    assert realtime.chat_events.connection_count() == 0
+
+
+def test_event_stream_requires_membership(client: TestClient):
+    owner_token = _login(client, "juniper")
+    client.post("/chats", json={"name": "live", "owner_id": 1}, headers={"Authorization": f"Bearer {owner_token}"})
+    outsider_token = _login(client, "apple")
+
+    response = client.get("/chats/1/events", headers={"Authorization": f"Bearer {outsider_token}"})
+    assert response.status_code == 422
+    response = client.get("/chats/2/events", headers={"Authorization": f"Bearer {owner_token}"})
+    assert response.status_code == 404
+
+
+def test_slow_consumer_is_flagged():
+    async def publish_burst():
+        broker = ChatEventBroker(queue_size=2)
+        subscription = broker.subscribe(1)
+        for i in range(3):
+            broker.publish(1, {"type": "message_created", "message": {"id": i}})
+        await asyncio.sleep(0)
+        broker.unsubscribe(subscription)
+        return subscription, broker.connection_count()
+
+    subscription, remaining = asyncio.run(publish_burst())
+    assert subscription.overflowed.is_set()
+    assert subscription.queue.qsize() == 2
+    assert remaining == 0
+
+
+def test_disconnect_revokes_matching_subscriptions():
+    async def revoke():
+        broker = ChatEventBroker()
+        apple, pear, other_chat = broker.subscribe(1, 2), broker.subscribe(1, 3), broker.subscribe(2, 2)
+        assert broker.disconnect(1, 2) == 1
+        assert broker.disconnect(account_id=2) == 1
+        await asyncio.sleep(0)
+        return [await subscription.get() if subscription.revoked.is_set() else "open" for subscription in (apple, pear, other_chat)], \
+            broker.connection_count()
+
+    outcomes, remaining = asyncio.run(revoke())
+    assert outcomes == [None, "open", None]
+    assert remaining == 1
@@ -0,0 +1,362 @@
+"""In-process caches.
+
+Args:
+    PRINCIPAL_CACHE_SIZE (int): Most tokens the principal cache remembers
+    PRINCIPAL_CACHE_TTL (float): Longest a cached principal is reused, never past the token's exp
+    MEMBERSHIP_INDEX_CHATS (int): Most chats whose member ids are kept in memory
+    MEMBERSHIP_INDEX_TTL (float): Seconds before a chat's member ids are reloaded, bounds staleness across workers
+    principal_cache (PrincipalCache): Token digest -> authenticated account snapshot, used by security.extract_user
+    membership_index (MembershipIndex): chat id <-> member account ids, used by chatmembership_db
+"""
+
+import bisect
+import hashlib
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+MEMBERSHIP_INDEX_CHATS = int(os.getenv("MEMBERSHIP_INDEX_CHATS", "10000"))
+MEMBERSHIP_INDEX_TTL = float(os.getenv("MEMBERSHIP_INDEX_TTL", "300"))
+
+
+class LRUCache:
+    """A thread-safe, size-bounded LRU mapping whose entries may also expire."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns the value cached under key and marks it recently used, default if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, expires_at: float | None = None) -> None:
+        """
+        Caches value under key until the time.monotonic() deadline expires_at (forever if None)
+        Evicts the least recently used entries beyond maxsize
+        """
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Removes and returns the value cached under key
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def clear(self) -> None:
+        """
+        Removes every entry and resets the counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the hit/miss/eviction counters and current size
+        """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self)}
+
+
+class PrincipalCache:
+    """Caches who a token belongs to so authenticated requests skip jwt.decode and the account lookup.
+
+    Entries hold a column snapshot of the account, never live ORM objects or the password
+    hash, and are dropped when the account changes through accounts_db.
+
+    Invalidations are numbered. The last number of each recently invalidated account is kept
+    (at most maxsize of them), an account without one reads the highest number evicted, so a
+    put that raced with any invalidation of its account is still detected.
+    """
+
+    def __init__(self, maxsize: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = LRUCache(maxsize)
+        self._digests: dict[int, set[bytes]] = {}
+        self._generations: OrderedDict[int, int] = OrderedDict()
+        self._invalidations = 0
+        self._evicted_generation = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        """
+        Returns the cache key of a token, tokens themselves are never kept in memory
+        """
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, digest: bytes) -> dict | None:
+        """
+        Returns the account snapshot cached for the token digest, None on a miss
+        """
+        return self._entries.get(digest)
+
+    def generation(self, account_id: int) -> int:
+        """
+        Returns the account's invalidation counter, read before loading the account to pass to put
+        """
+        return self._generations.get(account_id, self._evicted_generation)
+
+    def put(self, digest: bytes, snapshot: dict, token_exp: int, generation: int) -> None:
+        """
+        Caches the account snapshot for the token until the earlier of ttl and the token's exp
+        Skipped if the account was invalidated since generation was read
+        """
+        remaining = min(self.ttl, token_exp - time.time())
+        if remaining <= 0:
+            return
+        account_id = snapshot["id"]
+        with self._lock:
+            if self._generations.get(account_id, self._evicted_generation) != generation:
+                return
+            # Forget digests the LRU already evicted so the reverse index stays bounded
+            live = {known for known in self._digests.get(account_id, ()) if known in self._entries}
+            live.add(digest)
+            self._digests[account_id] = live
+            self._entries.put(digest, snapshot, expires_at=time.monotonic() + remaining)
+
+    def invalidate_account(self, account_id: int) -> None:
+        """
+        Drops every cached token of the account, called whenever the account changes or is deleted
+        """
+        with self._lock:
+            self._invalidations += 1
+            self._generations[account_id] = self._invalidations
+            self._generations.move_to_end(account_id)
+            while len(self._generations) > self._entries.maxsize:
+                self._evicted_generation = self._generations.popitem(last=False)[1]
+            digests = self._digests.pop(account_id, set())
+        for digest in digests:
+            self._entries.pop(digest)
+
+    def clear(self) -> None:
+        """
+        Drops every cached token
+        """
+        with self._lock:
+            self._digests.clear()
+            self._generations.clear()
+            # Puts in flight must not refill the cache
+            self._evicted_generation = self._invalidations = self._invalidations + 1
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the hit/miss/eviction counters and current size
+        """
+        return self._entries.stats()
+
+
+class MembershipIndex:
+    """In-memory index of chat memberships for authorization checks and event fan-out.
+
+    Member ids of a chat are loaded lazily, kept as a sorted array of ints and evicted
+    least recently used. The reverse map (account id -> ids of loaded chats it belongs to)
+    only covers loaded chats. Writers must keep it current through add, remove, drop_chat
+    and drop_account after they commit.
+
+    Writes are numbered like PrincipalCache invalidations: the last number of at most maxsize
+    recently written chats is kept, other chats read the highest number evicted.
+    """
+
+    def __init__(self, maxsize: int = MEMBERSHIP_INDEX_CHATS, ttl: float = MEMBERSHIP_INDEX_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._members: OrderedDict[int, tuple[array, float]] = OrderedDict()
+        self._chats_of: dict[int, set[int]] = {}
+        self._generations: OrderedDict[int, int] = OrderedDict()
+        self._writes = 0
+        self._evicted_generation = 0
+        self._lock = threading.Lock()
+
+    def members(self, chat_id: int) -> array | None:
+        """
+        Returns a copy of the sorted member ids of the chat, None if the chat isn't loaded
+        """
+        with self._lock:
+            members = self._lookup(chat_id)
+            return None if members is None else array("q", members)
+
+    def is_member(self, chat_id: int, account_id: int) -> bool | None:
+        """
+        Returns whether the account is a member of the chat, None if the chat isn't loaded
+        """
+        with self._lock:
+            members = self._lookup(chat_id)
+            if members is None:
+                return None
+            position = bisect.bisect_left(members, account_id)
+            return position < len(members) and members[position] == account_id
+
+    def chats_of(self, account_id: int) -> frozenset[int]:
+        """
+        Returns the ids of the loaded chats the account belongs to
+        """
+        with self._lock:
+            return frozenset(self._chats_of.get(account_id, ()))
+
+    def generation(self, chat_id: int) -> int:
+        """
+        Returns the chat's change counter, read before querying members to pass to load
+        """
+        return self._generations.get(chat_id, self._evicted_generation)
+
+    def load(self, chat_id: int, account_ids, generation: int) -> None:
+        """
+        Stores the chat's member ids, skipped if the chat changed since generation was read
+        """
+        members = array("q", sorted(account_ids))
+        with self._lock:
+            if self._generations.get(chat_id, self._evicted_generation) != generation:
+                return
+            self._drop(chat_id)
+            self._members[chat_id] = (members, time.monotonic() + self.ttl)
+            for account_id in members:
+                self._chats_of.setdefault(account_id, set()).add(chat_id)
+            while len(self._members) > self.maxsize:
+                self._drop(next(iter(self._members)))
+                self.evictions += 1
+
+    def add(self, chat_id: int, account_id: int) -> None:
+        """
+        Records a new membership
+        """
+        with self._lock:
+            self._bump(chat_id)
+            entry = self._members.get(chat_id)
+            if entry is None:
+                return
+            members = entry[0]
+            position = bisect.bisect_left(members, account_id)
+            if position == len(members) or members[position] != account_id:
+                members.insert(position, account_id)
+            self._chats_of.setdefault(account_id, set()).add(chat_id)
+
+    def remove(self, chat_id: int, account_id: int) -> None:
+        """
+        Records a removed membership
+        """
+        with self._lock:
+            self._bump(chat_id)
+            entry = self._members.get(chat_id)
+            if entry is None:
+                return
+            members = entry[0]
+            position = bisect.bisect_left(members, account_id)
+            if position < len(members) and members[position] == account_id:
+                del members[position]
+            self._forget(account_id, chat_id)
+
+    def drop_chat(self, chat_id: int) -> None:
+        """
+        Forgets a chat, called when it is deleted
+        """
+        with self._lock:
+            self._bump(chat_id)
+            self._drop(chat_id)
+
+    def drop_account(self, account_id: int) -> None:
+        """
+        Removes the account from every loaded chat, called when it is deleted
+        """
+        with self._lock:
+            for chat_id in self._chats_of.pop(account_id, set()):
+                self._bump(chat_id)
+                members = self._members[chat_id][0]
+                position = bisect.bisect_left(members, account_id)
+                if position < len(members) and members[position] == account_id:
+                    del members[position]
+
+    def clear(self) -> None:
+        """
+        Forgets every chat and resets the counters
+        """
+        with self._lock:
+            self._members.clear()
+            self._chats_of.clear()
+            self._generations.clear()
+            # Loads in flight must not refill the index
+            self._evicted_generation = self._writes = self._writes + 1
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the hit/miss/eviction counters and number of loaded chats
+        """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._members)}
+
+    def _lookup(self, chat_id: int) -> array | None:
+        # Callers hold the lock, the array itself is mutated in place by add and remove
+        entry = self._members.get(chat_id)
+        if entry is not None and entry[1] <= time.monotonic():
+            self._drop(chat_id)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._members.move_to_end(chat_id)
+        self.hits += 1
+        return entry[0]
+
+    def _bump(self, chat_id: int) -> None:
+        self._writes += 1
+        self._generations[chat_id] = self._writes
+        self._generations.move_to_end(chat_id)
+        while len(self._generations) > self.maxsize:
+            self._evicted_generation = self._generations.popitem(last=False)[1]
+
+    def _drop(self, chat_id: int) -> None:
+        entry = self._members.pop(chat_id, None)
+        if entry is None:
+            return
+        for account_id in entry[0]:
+            self._forget(account_id, chat_id)
+
+    def _forget(self, account_id: int, chat_id: int) -> None:
+        chats = self._chats_of.get(account_id)
+        if chats is not None:
+            chats.discard(chat_id)
+            if not chats:
+                del self._chats_of[account_id]
+
+
+principal_cache = PrincipalCache()
+membership_index = MembershipIndex()
@@ -1,24 +1,36 @@
 from backend.database.schema import DBAccount
 from backend.database.schema import DBChat
 from backend.database.schema import DBChatMembership
-from backend.database.schema import DBMessage
-from sqlmodel import select
+from sqlmodel import func, select
 from pydantic import BaseModel
+from backend.cache import membership_index, principal_cache
+from backend.database import stats as stats_db
 from backend.dependencies import DBSession
 from backend.error_responses import DeleteErrorAccountChatOnwer
+from backend.realtime import chat_events
 
 
 class AccountRequest(BaseModel):
     account_id: int 
 
 
-def get_all(session: DBSession) -> list[DBAccount]:
+def get_accounts_page(session: DBSession, limit: int, after_id: int | None = None) -> tuple[list[DBAccount], bool]:
     '''
-    Uses current session to return all the DBAccounts in the database
+    Uses current session to return up to limit accounts ordered by id, starting after after_id
+    Also returns whether more accounts remain
     '''
-    stmt = select(DBAccount)
+    stmt = select(DBAccount).order_by(DBAccount.id).limit(limit + 1)
+    if after_id is not None:
+        stmt = stmt.where(DBAccount.id > after_id)
     results = list(session.exec(stmt))
-    return results
+    return results[:limit], len(results) > limit
+
+
+def count_accounts(session: DBSession) -> int:
+    '''
+    Uses current session to count the accounts in the database without loading them
+    '''
+    return session.exec(select(func.count()).select_from(DBAccount)).one()
 
 
 def get_by_account_id(session: DBSession, account_id: int) -> DBAccount:
@@ -29,6 +41,13 @@ def get_by_account_id(session: DBSession, account_id: int) -> DBAccount:
     return account
 
 
+def get_hashed_password(session: DBSession, account_id: int) -> str | None:
+    '''
+    Returns the password hash of the account with one column query, None if it doesn't exist
+    '''
+    return session.exec(select(DBAccount.hashed_password).where(DBAccount.id == account_id)).first()
+
+
 def get_by_account_username(session: DBSession, username: str) -> DBAccount:
     '''
     Uses current session to return account in database associated with given username
@@ -52,8 +71,10 @@ def get_by_account_email(session: DBSession, email: str) -> DBAccount:
 def get_chat_accounts(session: DBSession, chat_id: int) -> list[DBAccount]:
     '''
     Uses current session to return all accounts within a chat membership 
+    None are returned for a tombstoned chat, it is treated as missing until purged
     '''
-    stmt = select(DBAccount).join(DBChatMembership).where(DBChatMembership.chat_id == chat_id)
+    tombstoned = select(DBChat.id).where(DBChat.id == chat_id, DBChat.deleted_at.is_not(None)).exists()
+    stmt = select(DBAccount).join(DBChatMembership).where(DBChatMembership.chat_id == chat_id, ~tombstoned)
     results = list(session.exec(stmt))
     return results
 
@@ -62,31 +83,32 @@ def is_account_chat_owner(session: DBSession, account: DBAccount, chat: DBChat)
     """
     Determines whether a given account is the owner of the given chat
     """
-    stmt = select(DBAccount).where(account.id == chat.owner_id)
-    result = session.exec(stmt).first()
-    return result
+    return account.id == chat.owner_id
 
 
-def get_all_messages(session: DBSession, account_id: int) -> list[DBMessage]:
+def owns_chats(session: DBSession, account_id: int) -> bool:
     """
-    Returns all messages in databse corresponding with account_id
+    Determines whether the account owns at least one chat
+    Tombstoned chats count until they are purged, their rows still reference the owner
     """
-    stmt = select(DBMessage).where(DBMessage.account_id == account_id)
-    results = list(session.exec(stmt))
-    return results
+    stmt = select(DBChat.id).where(DBChat.owner_id == account_id).limit(1)
+    return session.exec(stmt).first() is not None
 
 
 def delete_account(session: DBSession, account: DBAccount) -> None:
     """
-    Deletes given account from database
+    Deletes given account from database in one DELETE
+    The database nulls the account's messages and removes its memberships and join requests (ondelete rules)
     """
-    stmt = select(DBAccount).where(DBChat.owner_id == account.id)
-    owned_chats = session.exec(stmt).all()
-    
-    if owned_chats:
+    if owns_chats(session=session, account_id=account.id):
         raise DeleteErrorAccountChatOnwer()
+    account_id = account.id
+    stats_db.record_account_left_chats(session=session, account_id=account_id)
     session.delete(account)
     session.commit()
+    principal_cache.invalidate_account(account_id)
+    membership_index.drop_account(account_id)
+    chat_events.disconnect(account_id=account_id)
 
 
 def update_password(session: DBSession, account: DBAccount, hashed_password: str) -> None:
@@ -98,6 +120,7 @@ def update_password(session: DBSession, account: DBAccount, hashed_password: str
     session.add(account)  
     session.commit()      
     session.refresh(account) 
+    principal_cache.invalidate_account(account.id)
 
 
 def update_email(session: DBSession, account: DBAccount, email: str) -> None:
@@ -109,6 +132,7 @@ def update_email(session: DBSession, account: DBAccount, email: str) -> None:
     session.add(account)  
     session.commit()      
     session.refresh(account) 
+    principal_cache.invalidate_account(account.id)
 
 
 def update_username(session: DBSession, account: DBAccount, username: str) -> None:
@@ -120,6 +144,7 @@ def update_username(session: DBSession, account: DBAccount, username: str) -> No
     session.add(account)  
     session.commit()      
     session.refresh(account) 
+    principal_cache.invalidate_account(account.id)
 
 
 
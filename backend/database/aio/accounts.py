@@ -0,0 +1,29 @@
+from backend.database.schema import DBAccount
+from sqlmodel import func, select
+from backend.dependencies import AsyncDBSession
+
+
+async def get_by_account_id(session: AsyncDBSession, account_id: int) -> DBAccount:
+    '''
+    Async version of accounts.get_by_account_id
+    '''
+    account = await session.get(DBAccount, account_id)
+    return account
+
+
+async def get_accounts_page(session: AsyncDBSession, limit: int, after_id: int | None = None) -> tuple[list[DBAccount], bool]:
+    '''
+    Async version of accounts.get_accounts_page
+    '''
+    stmt = select(DBAccount).order_by(DBAccount.id).limit(limit + 1)
+    if after_id is not None:
+        stmt = stmt.where(DBAccount.id > after_id)
+    results = list(await session.exec(stmt))
+    return results[:limit], len(results) > limit
+
+
+async def count_accounts(session: AsyncDBSession) -> int:
+    '''
+    Async version of accounts.count_accounts
+    '''
+    return (await session.exec(select(func.count()).select_from(DBAccount))).one()
@@ -0,0 +1,19 @@
+from backend.database.schema import DBChatMembership, DBChat
+from sqlmodel import select
+from backend.cache import membership_index
+from backend.dependencies import AsyncDBSession
+
+
+async def is_account_chat_member(session: AsyncDBSession, account_id: int, chat: DBChat) -> bool:
+      """
+      Async version of chatmembership.is_account_chat_member
+      NOTE: This assumes that the chat exists
+      """
+      is_member = membership_index.is_member(chat.id, account_id)
+      if is_member is None:
+            generation = membership_index.generation(chat.id)
+            stmt = select(DBChatMembership.account_id).where(DBChatMembership.chat_id == chat.id)
+            member_ids = set(await session.exec(stmt))
+            membership_index.load(chat.id, member_ids, generation)
+            is_member = account_id in member_ids
+      return is_member
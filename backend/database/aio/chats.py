@@ -0,0 +1,29 @@
+from sqlmodel import func, select
+from backend.database.schema import DBChat
+from backend.dependencies import AsyncDBSession
+
+
+async def get_chats_page(session: AsyncDBSession, limit: int, after_id: int | None = None) -> tuple[list[DBChat], bool]:
+     """
+        Async version of chats.get_chats_page
+     """
+     stmt = select(DBChat).where(DBChat.deleted_at.is_(None)).order_by(DBChat.id).limit(limit + 1)
+     if after_id is not None:
+          stmt = stmt.where(DBChat.id > after_id)
+     results = list(await session.exec(stmt))
+     return results[:limit], len(results) > limit
+
+async def count_chats(session: AsyncDBSession) -> int:
+     """
+        Async version of chats.count_chats
+     """
+     return (await session.exec(select(func.count()).select_from(DBChat).where(DBChat.deleted_at.is_(None)))).one()
+
+async def get_chat_by_id(session: AsyncDBSession, chat_id: int) -> DBChat:
+     """
+        Async version of chats.get_chat_by_id
+     """
+     chat = await session.get(DBChat, chat_id)
+     if chat is not None and chat.deleted_at is not None:
+          return None
+     return chat
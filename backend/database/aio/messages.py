@@ -0,0 +1,34 @@
+from datetime import datetime
+from backend.database.schema import DBMessage
+from backend.database.chatmembership import update_read_marker
+from backend.database.stats import messages_added
+from backend.database.messages import order_messages_page, select_messages_page
+from backend.dependencies import AsyncDBSession
+
+
+async def get_messages_page(session: AsyncDBSession, chat_id: int, limit: int,
+                            before: tuple[datetime, int] | None = None,
+                            after: tuple[datetime, int] | None = None) -> tuple[list[DBMessage], bool]:
+     """
+     Async version of messages.get_messages_page
+     """
+     stmt = select_messages_page(chat_id=chat_id, limit=limit, before=before, after=after)
+     return order_messages_page(list(await session.exec(stmt)), limit=limit, forward=after is not None)
+
+async def get_message_by_id(session: AsyncDBSession, message_id: int) -> DBMessage:
+     """
+     Async version of messages.get_message_by_id
+     """
+     message = await session.get(DBMessage, message_id)
+     return message
+
+async def create_message(session: AsyncDBSession, message: DBMessage) -> int | None:
+     """
+     Async version of messages.create_message
+     """
+     session.add(message)
+     await session.flush()
+     await session.exec(update_read_marker(chat_id=message.chat_id, account_id=message.account_id, message_id=message.id))
+     seq = (await session.exec(messages_added(chat_id=message.chat_id, count=1, last_message_id=message.id, created_at=message.created_at))).scalar()
+     await session.commit()
+     return seq
@@ -0,0 +1,14 @@
+from backend.database.schema import DBChatStats
+from backend.database.stats import STATS_COLUMNS, select_computed_stats
+from backend.dependencies import AsyncDBSession
+
+
+async def get_chat_stats(session: AsyncDBSession, chat_id: int, include_deleted: bool = False) -> DBChatStats | None:
+     """
+        Async version of stats.get_chat_stats
+     """
+     stats = await session.get(DBChatStats, chat_id)
+     if stats is not None:
+          return stats
+     row = (await session.exec(select_computed_stats(chat_id, include_deleted))).first()
+     return DBChatStats(**dict(zip(STATS_COLUMNS, row))) if row is not None else None
@@ -1,8 +1,9 @@
-from backend.database.accounts import get_by_account_username
+from fastapi.concurrency import run_in_threadpool
+from backend.database.accounts import get_by_account_username, update_password
 from backend.database.schema import DBAccount
 from backend.dependencies import DBSession
 from sqlmodel import select
-from backend.security import hash_password, verify_password
+from backend.security import hash_password_async, password_needs_rehash, verify_password_async
 
 def username_exists(session: DBSession, username: str) -> bool:
       """
@@ -24,19 +25,26 @@ def email_exists(session: DBSession, email: str) -> bool:
       return result is not None 
 
 
-def verify_user(session: DBSession, username: str, password: str,) -> bool:
+async def verify_user(session: DBSession, username: str, password: str,) -> bool:
      """
      Verifies that given account associated with given username is exists and passwords match
+     Rehashes the password if it was stored with a different work factor than BCRYPT_ROUNDS
+     Queries run on the request threadpool, the bcrypt calls are awaited on the password pool
      """
-     account = get_by_account_username(session=session, username=username)
-     return account != None and verify_password(password=password, hashed_password=account.hashed_password)
+     account = await run_in_threadpool(get_by_account_username, session=session, username=username)
+     if account is None or not await verify_password_async(password=password, hashed_password=account.hashed_password):
+          return False
+     if password_needs_rehash(account.hashed_password):
+          hashed_password = await hash_password_async(password)
+          await run_in_threadpool(update_password, session=session, account=account, hashed_password=hashed_password)
+     return True
 
 
-def create_account(session: DBSession, username: str, email: str, password: str) -> DBAccount:
+def create_account(session: DBSession, username: str, email: str, hashed_password: str) -> DBAccount:
     """
-    Adds the new registered account to the database
+    Adds the new registered account to the database with its already hashed password
     """
-    new_acc = DBAccount(username=username, email=email, hashed_password=hash_password(password))
+    new_acc = DBAccount(username=username, email=email, hashed_password=hashed_password)
     session.add(new_acc)
     session.commit()
     return new_acc
@@ -1,6 +1,20 @@
-from backend.database.schema import DBChatMembership, DBChat, DBAccount
+from backend.database.schema import DBChatMembership, DBChat, DBAccount, DBMessage
+from pydantic import BaseModel, Field
+from sqlalchemy import and_, delete, exists, func, insert, literal, or_, update
 from sqlmodel import select
+from backend.cache import membership_index
+from backend.database import stats as stats_db
 from backend.dependencies import DBSession
+from backend.realtime import chat_events
+
+# Most account ids a single bulk membership request may carry
+MAX_BULK_MEMBERS = 1000
+
+class BulkMembershipRequest(BaseModel):
+      account_ids: list[int] = Field(min_length=1, max_length=MAX_BULK_MEMBERS)
+
+class ReadMarkerRequest(BaseModel):
+      message_id: int | None = None
 
 
 def create_membership(session: DBSession, membership: DBChatMembership):
@@ -8,41 +22,163 @@ def create_membership(session: DBSession, membership: DBChatMembership):
       Creates a new chat membership in database to record the new chat's owner as a member of the chat
       """
       session.add(membership)
+      stats_db.record_members_changed(session=session, chat_id=membership.chat_id, delta=1)
       session.commit()
       session.refresh(membership)
+      membership_index.add(membership.chat_id, membership.account_id)
       return membership
 
 def is_account_chat_member(session: DBSession, account_id: int, chat: DBChat) -> bool:
       """
       Returns true if account corresponding with given id is a member of given chat
+      Answered from the membership index, the chat's member ids are loaded on first use
       NOTE: This assumes that the chat exists
       """
-      stmt = select(DBChatMembership).where(
-            DBChatMembership.account_id == account_id,
-            DBChatMembership.chat_id == chat.id
-            )
-      result = session.exec(stmt).first()
-      return result is not None 
+      is_member = membership_index.is_member(chat.id, account_id)
+      if is_member is None:
+            generation = membership_index.generation(chat.id)
+            member_ids = get_chat_member_ids(session=session, chat_id=chat.id)
+            membership_index.load(chat.id, member_ids, generation)
+            is_member = account_id in member_ids
+      return is_member
+
+def get_chat_member_ids(session: DBSession, chat_id: int) -> set[int]:
+      """
+      Returns the ids of every account that is a member of the chat corresponding with chat_id
+      """
+      stmt = select(DBChatMembership.account_id).where(DBChatMembership.chat_id == chat_id)
+      return set(session.exec(stmt))
 
 def add_chat_member(session: DBSession, account: DBAccount, chat: DBChat) -> DBChatMembership:
       """
       Creates a membership with given account 
       """
-      membership = DBChatMembership(account_id=account.id, chat_id=chat.id, account=account, chat=chat)
+      chat_id, account_id = chat.id, account.id
+      membership = DBChatMembership(account_id=account_id, chat_id=chat_id, account=account, chat=chat)
       session.add(membership)
+      stats_db.record_members_changed(session=session, chat_id=chat_id, delta=1)
       session.commit()
+      # Ids read before the commit, reading them after it would reload the expired rows
+      membership_index.add(chat_id, account_id)
       return membership
 
 
 def delete_membership(session: DBSession, chat_id: int, account_id: int) -> None:
       """
-      Deletes membership associated with given account_id and chat_id
+      Deletes membership associated with given account_id and chat_id with one DELETE
       NOTE: Assumes membership exists
       """
-      stmt = select(DBChatMembership).where(DBChatMembership.account_id == account_id, DBChatMembership.chat_id == chat_id)
-      result = session.exec(stmt).first()
-      session.delete(result)
+      session.execute(delete(DBChatMembership).where(
+            DBChatMembership.account_id == account_id,
+            DBChatMembership.chat_id == chat_id))
+      stats_db.record_members_changed(session=session, chat_id=chat_id, delta=-1)
       session.commit()
+      membership_index.remove(chat_id, account_id)
+      chat_events.disconnect(chat_id, account_id)
+
+
+def add_chat_members(session: DBSession, chat: DBChat, account_ids: list[int]) -> dict[int, str]:
+      """
+      Adds the accounts among account_ids to the chat in one transaction
+      One IN query resolves the ids, one INSERT ... SELECT with an anti-join inserts every account that isn't a member yet
+      Returns account id -> "added", "already_member" or "not_found", in request order
+      """
+      chat_id = chat.id
+      requested = list(dict.fromkeys(account_ids))
+      existing = set(session.exec(select(DBAccount.id).where(DBAccount.id.in_(requested))))
+      is_member = exists().where(and_(DBChatMembership.chat_id == chat_id, DBChatMembership.account_id == DBAccount.id))
+      new_members = select(DBAccount.id, literal(chat_id)).where(DBAccount.id.in_(requested), ~is_member)
+      stmt = insert(DBChatMembership).from_select(["account_id", "chat_id"], new_members).returning(DBChatMembership.account_id)
+      added = set(session.scalars(stmt))
+      if added:
+            stats_db.record_members_changed(session=session, chat_id=chat_id, delta=len(added))
+      session.commit()
+      for account_id in added:
+            membership_index.add(chat_id, account_id)
+      return {account_id: "added" if account_id in added else "already_member" if account_id in existing else "not_found"
+              for account_id in requested}
+
+
+def remove_chat_members(session: DBSession, chat: DBChat, account_ids: list[int]) -> dict[int, str]:
+      """
+      Removes the accounts among account_ids from the chat in one transaction, the owner is never removed
+      Messages the removed accounts sent in this chat are updated to a NULL account_id
+      Returns account id -> "removed", "chat_owner" or "not_member", in request order
+      """
+      chat_id, owner_id = chat.id, chat.owner_id
+      requested = list(dict.fromkeys(account_ids))
+      removable = [account_id for account_id in requested if account_id != owner_id]
+      stmt = delete(DBChatMembership).where(
+            DBChatMembership.chat_id == chat_id,
+            DBChatMembership.account_id.in_(removable)
+            ).returning(DBChatMembership.account_id)
+      removed = set(session.scalars(stmt))
+      if removed:
+            session.execute(update(DBMessage).where(
+                  DBMessage.chat_id == chat_id,
+                  DBMessage.account_id.in_(removed)
+                  ).values(account_id=None))
+            stats_db.record_members_changed(session=session, chat_id=chat_id, delta=-len(removed))
+      session.commit()
+      for account_id in removed:
+            membership_index.remove(chat_id, account_id)
+            chat_events.disconnect(chat_id, account_id)
+      return {account_id: "chat_owner" if account_id == owner_id else "removed" if account_id in removed else "not_member"
+              for account_id in requested}
+
+
+def advance_read_marker(session: DBSession, chat_id: int, account_id: int, message_id: int) -> None:
+      """
+      Moves the account's read marker in the chat forward to message_id, never backwards
+      Doesn't commit, so it joins the caller's transaction
+      """
+      session.execute(update_read_marker(chat_id=chat_id, account_id=account_id, message_id=message_id))
+
+
+def update_read_marker(chat_id: int, account_id: int, message_id: int):
+      """
+      Builds the UPDATE behind advance_read_marker, shared with the async helpers
+      """
+      return update(DBChatMembership).where(
+            DBChatMembership.chat_id == chat_id,
+            DBChatMembership.account_id == account_id,
+            or_(DBChatMembership.last_read_message_id.is_(None), DBChatMembership.last_read_message_id < message_id)
+            ).values(last_read_message_id=message_id)
 
 
+def unread_count():
+      """
+      Correlated count of the messages after a membership's read marker
+      A range count on the (chat_id, id) index, never a scan of the chat
+      """
+      return (select(func.count())
+              .select_from(DBMessage)
+              .where(DBMessage.chat_id == DBChatMembership.chat_id,
+                     DBMessage.id > func.coalesce(DBChatMembership.last_read_message_id, 0))
+              .correlate(DBChatMembership)
+              .scalar_subquery())
+
+
+def get_read_state(session: DBSession, chat_id: int, account_id: int) -> tuple[int | None, int]:
+      """
+      Returns the account's read marker in the chat and its number of unread messages
+      NOTE: Assumes the membership exists
+      """
+      stmt = select(DBChatMembership.last_read_message_id, unread_count()).where(
+            DBChatMembership.chat_id == chat_id,
+            DBChatMembership.account_id == account_id)
+      return tuple(session.exec(stmt).one())
+
+
+def get_unread_counts(session: DBSession, account_id: int) -> list[tuple[int, int | None, int]]:
+      """
+      Returns (chat id, read marker, unread count) for every chat the account is a member of, in one query
+      """
+      stmt = select(DBChatMembership.chat_id, DBChatMembership.last_read_message_id, unread_count()).join(
+            DBChat, DBChat.id == DBChatMembership.chat_id
+            ).where(
+            DBChatMembership.account_id == account_id,
+            DBChat.deleted_at.is_(None)
+            ).order_by(DBChatMembership.chat_id)
+      return [tuple(row) for row in session.exec(stmt)]
 
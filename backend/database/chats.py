@@ -1,8 +1,14 @@
-from sqlmodel import select 
-from backend.database.schema import DBChat
+from datetime import datetime
+from sqlalchemy import case, delete, tuple_, update
+from sqlalchemy.orm import aliased
+from sqlmodel import func, select 
+from backend.database.schema import DBChat, DBChatMembership, DBChatStats, DBMessage
 from pydantic import BaseModel
 from typing import Optional
+from backend.cache import membership_index
+from backend.database import stats as stats_db
 from backend.dependencies import DBSession
+from backend.realtime import chat_events
 
 class UpdateChatRequest(BaseModel):
       chat_name: Optional[str] = None
@@ -12,26 +18,80 @@ class CreateChatRequest(BaseModel):
       name: str
       owner_id: int
 
-def get_chats(session: DBSession) -> list[DBChat]:
+def get_chats_page(session: DBSession, limit: int, after_id: int | None = None) -> tuple[list[DBChat], bool]:
      """
-        Retrieves all the chats in the database
+        Retrieves up to limit chats ordered by id, starting after after_id
+        Also returns whether more chats remain
      """
-     stmt = select(DBChat)
+     stmt = select(DBChat).where(DBChat.deleted_at.is_(None)).order_by(DBChat.id).limit(limit + 1)
+     if after_id is not None:
+          stmt = stmt.where(DBChat.id > after_id)
      results = list(session.exec(stmt))
-     return results
+     return results[:limit], len(results) > limit
+
+def count_chats(session: DBSession) -> int:
+     """
+        Counts the chats in the database without loading them
+     """
+     return session.exec(select(func.count()).select_from(DBChat).where(DBChat.deleted_at.is_(None))).one()
+
+# Sort key of chats without messages in the inbox, after every chat with activity
+NO_ACTIVITY = datetime.min
+
+def get_inbox_page(session: DBSession, account_id: int, limit: int,
+                   before: tuple[datetime, int] | None = None) -> tuple[list[tuple[DBChat, DBMessage | None, int]], bool]:
+     """
+        Retrieves up to limit chats the account is a member of, most recent activity first, in one query
+        Each chat comes with its last message (None if it has none) and its message count, both read
+        from the chat's chat_stats row; chats without one fall back to correlated lookups on the
+        (chat_id, created_at, id) index, so the cost follows the account's memberships, not the size of the messages table
+        before pages on the (last activity, chat id) keyset, last activity is NO_ACTIVITY for chats without messages
+        Also returns whether more chats remain
+     """
+     latest_message_id = (select(DBMessage.id)
+                          .where(DBMessage.chat_id == DBChat.id)
+                          .order_by(DBMessage.created_at.desc(), DBMessage.id.desc())
+                          .limit(1)
+                          .correlate(DBChat)
+                          .scalar_subquery())
+     counted_messages = (select(func.count())
+                         .select_from(DBMessage)
+                         .where(DBMessage.chat_id == DBChat.id)
+                         .correlate(DBChat)
+                         .scalar_subquery())
+     has_stats = DBChatStats.chat_id.is_not(None)
+     last_message_id = case((has_stats, DBChatStats.last_message_id), else_=latest_message_id)
+     message_count = case((has_stats, DBChatStats.message_count), else_=counted_messages)
+     last_message = aliased(DBMessage)
+     activity = func.coalesce(last_message.created_at, NO_ACTIVITY)
+     stmt = (select(DBChat, last_message, message_count)
+             .join(DBChatMembership, DBChatMembership.chat_id == DBChat.id)
+             .outerjoin(DBChatStats, DBChatStats.chat_id == DBChat.id)
+             .outerjoin(last_message, last_message.id == last_message_id)
+             .where(DBChatMembership.account_id == account_id, DBChat.deleted_at.is_(None))
+             .order_by(activity.desc(), DBChat.id.desc())
+             .limit(limit + 1))
+     if before is not None:
+          stmt = stmt.where(tuple_(activity, DBChat.id) < tuple_(*before))
+     results = [tuple(row) for row in session.exec(stmt)]
+     return results[:limit], len(results) > limit
 
 def get_chat_by_id(session: DBSession, chat_id: int) -> DBChat:
        """
-        Retrieves chat associated with given chat_id
+        Retrieves chat associated with given chat_id, None if it doesn't exist or is being deleted
        """
        chat = session.get(DBChat, chat_id)
+       if chat is not None and chat.deleted_at is not None:
+             return None
        return chat
 
 def add_chat(session: DBSession, chat: DBChat) -> DBChat:
       """
-      Adds given chat to database
+      Adds given chat to database along with its empty stats row
       """
       session.add(chat)
+      session.flush()
+      stats_db.create_chat_stats(session=session, chat_id=chat.id)
       session.commit()
       session.refresh(chat)
       return chat
@@ -40,7 +100,7 @@ def unique_chat_name(session: DBSession, name: str) -> bool:
       """
       Checks database to determine whether given name exists for other chats
       """
-      stmt = select(DBChat).where(DBChat.name == name)
+      stmt = select(DBChat).where(DBChat.name == name, DBChat.deleted_at.is_(None))
       result = session.exec(stmt).first()
       return result is None
 
@@ -48,7 +108,7 @@ def get_same_chat_name(session: DBSession, name:str ) -> DBChat:
       """
       Retrives the chat corresponding to given name from database
       """
-      stmt = select(DBChat).where(DBChat.name == name)
+      stmt = select(DBChat).where(DBChat.name == name, DBChat.deleted_at.is_(None))
       result = session.exec(stmt).first()
       return result
 
@@ -73,15 +133,58 @@ def update_chat(session: DBSession, chat_id: int, update: UpdateChatRequest) ->
 
       return original_chat
 
+def tombstone_chat(session: DBSession, chat_id: int) -> None:
+      """
+      Marks the chat deleted with one UPDATE, from then on every read treats it as missing
+      Its messages are removed later by purge_chat_messages and the row itself by delete_chat
+      NOTE: Assumes chat exists
+      """
+      session.execute(update(DBChat).where(DBChat.id == chat_id).values(deleted_at=datetime.now()))
+      session.commit()
+      membership_index.drop_chat(chat_id)
+      chat_events.disconnect(chat_id)
+
+def get_deleted_chat_ids(session: DBSession) -> list[int]:
+      """
+      Retrieves the ids of the tombstoned chats still waiting to be purged, oldest deletion first
+      """
+      stmt = select(DBChat.id).where(DBChat.deleted_at.is_not(None)).order_by(DBChat.deleted_at, DBChat.id)
+      return list(session.exec(stmt))
+
+def get_deleted_chat(session: DBSession, chat_id: int) -> DBChat | None:
+      """
+      Retrieves the chat if it is tombstoned and not purged yet
+      """
+      chat = session.get(DBChat, chat_id)
+      if chat is None or chat.deleted_at is None:
+            return None
+      return chat
+
+def purge_chat_messages(session: DBSession, chat_id: int, limit: int) -> int:
+      """
+      Deletes up to limit of the chat's messages, oldest ids first, and commits
+      Each call is its own short write transaction so other writers get in between batches
+      Returns the number of messages deleted, 0 once none remain
+      """
+      batch = select(DBMessage.id).where(DBMessage.chat_id == chat_id).order_by(DBMessage.id).limit(limit)
+      deleted = session.execute(delete(DBMessage).where(DBMessage.id.in_(batch.scalar_subquery()))).rowcount
+      if deleted:
+            stats_db.record_messages_removed(session=session, chat_id=chat_id, count=deleted)
+      session.commit()
+      return deleted
+
 def delete_chat(session: DBSession, chat_id: int) -> None:
       """ 
       Deletes specifed chat from database and therefore deletes the chat messages within the chat as well as the chat memberships 
-      Automatically deleted due to ondelete="CASCADE"
+      and stats, automatically deleted by the database due to ondelete="CASCADE"
+      Run by the purge once the messages are gone, a chat with many messages is tombstoned instead
       NOTE: Assumes chat exists
       """
-      chat_to_delete = get_chat_by_id(session=session, chat_id=chat_id)
+      chat_to_delete = session.get(DBChat, chat_id)
       session.delete(chat_to_delete)
       session.commit()
+      membership_index.drop_chat(chat_id)
+      chat_events.disconnect(chat_id)
 
 
 
@@ -0,0 +1,202 @@
+"""Imports a chat's history from an NDJSON file, e.g. when migrating a channel from another system.
+
+Each line is one message, oldest first:
+    {"username": "juniper", "text": "hello", "created_at": "2024-05-01T12:00:00"}
+The author is looked up by username, a username without an account (or a null one) imports the
+message with a null account_id, like the messages of members who left. created_at is kept as is,
+one with a UTC offset is converted to the server's local time like the timestamps the API writes,
+a message without one gets the import time. The file may be gzipped (.gz), so the output of
+GET /chats/{chat_id}/messages/export?compress=true can be read back after mapping account ids to usernames.
+
+The file is read as a stream. Usernames are resolved with one IN query per chunk of --batch lines
+and the chunk is inserted with one executemany, in one transaction together with the import's
+checkpoint row (import_checkpoints). Running the same import again resumes after the last
+committed chunk, and a completed import is not repeated.
+
+A line that isn't a JSON object with a text (and, if given, an ISO created_at) stops the import
+with a ValueError naming FILE:LINE, the chunks before it stay committed and are counted in chat_stats.
+
+With --defer-indexes the messages indexes and the full-text index are dropped for the load
+instead of being maintained for every row, and rebuilt when it ends, whether it succeeded or not.
+Only use it on a database that isn't serving traffic: reads go without the indexes meanwhile.
+At the end chat_stats is rebuilt and the planner statistics refreshed (ANALYZE).
+
+Usage:
+    python -m backend.database.importer FILE --chat-id 12 [--batch 5000] [--source NAME]
+                                        [--defer-indexes] [--url sqlite:///development.db]
+"""
+
+import argparse
+import gzip
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+from sqlalchemy import Engine, insert, select, update
+from sqlmodel import Session, SQLModel
+
+from backend.database.schema import DBAccount, DBChat, DBImportCheckpoint, DBMessage, drop_message_search, install_message_search
+from backend.database.stats import rebuild_chat_stats
+from backend.dependencies import add_missing_indexes, build_engine
+from backend.settings import DatabaseSettings
+
+
+BATCH_SIZE = 5000
+
+
+def _open_lines(path: Path) -> Iterator[str]:
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as lines:
+        yield from lines
+
+
+def _parse_line(path: Path, number: int, line: str) -> dict:
+    """
+    Returns the username, text and created_at (None if absent) of one line
+    Raises ValueError naming path:number if the line isn't a valid message
+    """
+    try:
+        message = json.loads(line)
+    except json.JSONDecodeError as error:
+        raise ValueError(f"{path}:{number}: invalid JSON ({error.msg})") from None
+    if not isinstance(message, dict):
+        raise ValueError(f"{path}:{number}: expected a JSON object")
+    if not isinstance(message.get("text"), str):
+        raise ValueError(f"{path}:{number}: missing text")
+    created_at = message.get("created_at")
+    try:
+        created_at = datetime.fromisoformat(created_at) if created_at else None
+    except (TypeError, ValueError):
+        raise ValueError(f"{path}:{number}: invalid created_at {created_at!r}") from None
+    if created_at is not None and created_at.tzinfo is not None:
+        # Stored naive, the offset would otherwise be dropped without shifting the time
+        created_at = created_at.astimezone().replace(tzinfo=None)
+    return {"username": message.get("username"), "text": message["text"], "created_at": created_at}
+
+
+def _chunks(path: Path, skip: int, size: int) -> Iterator[tuple[int, list[dict]]]:
+    """
+    Yields (lines consumed so far, parsed messages) per size lines, after skipping the first skip lines
+    Blank lines are consumed without producing a message
+    """
+    chunk, number = [], 0
+    for number, line in enumerate(_open_lines(path), start=1):
+        if number <= skip:
+            continue
+        if line.strip():
+            chunk.append(_parse_line(path, number, line))
+        if number % size == 0:
+            yield number, chunk
+            chunk = []
+    if number > skip and (chunk or number % size):
+        yield number, chunk
+
+
+def _message_rows(messages: list[dict], chat_id: int, authors: dict[str, int | None], imported_at: datetime) -> list[dict]:
+    return [{
+        "text": message["text"],
+        "account_id": authors.get(message["username"]),
+        "chat_id": chat_id,
+        "created_at": message["created_at"] or imported_at,
+    } for message in messages]
+
+
+def _resolve_authors(connection, messages: list[dict], authors: dict[str, int | None]) -> None:
+    """
+    Adds the account id (None if there is no such account) of every new username in messages to authors
+    """
+    usernames = {message["username"] for message in messages} - authors.keys() - {None}
+    if not usernames:
+        return
+    found = dict(connection.execute(select(DBAccount.username, DBAccount.id).where(DBAccount.username.in_(usernames))).all())
+    for username in usernames:
+        authors[username] = found.get(username)
+
+
+def import_messages(engine: Engine, path: Path, chat_id: int, batch_size: int = BATCH_SIZE,
+                    source: str | None = None, defer_indexes: bool = False) -> dict[str, int]:
+    """
+    Imports the messages of the NDJSON file at path into the chat, resuming the checkpoint of source
+    (the file's absolute path by default)
+    With defer_indexes the messages indexes are dropped for the load and always rebuilt when it ends
+    Returns the number of lines and messages imported by this run and the messages without a known author
+    Raises ValueError if the chat doesn't exist, the checkpoint belongs to another chat or a line isn't a valid message
+    """
+    path = Path(path)
+    source = source or str(path.resolve())
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        if connection.execute(select(DBChat.id).where(DBChat.id == chat_id, DBChat.deleted_at.is_(None))).first() is None:
+            raise ValueError(f"Unable to find chat with id={chat_id}")
+        checkpoint = connection.execute(select(DBImportCheckpoint).where(DBImportCheckpoint.source == source)).first()
+        if checkpoint is None:
+            connection.execute(insert(DBImportCheckpoint).values(source=source, chat_id=chat_id))
+        elif checkpoint.chat_id != chat_id:
+            raise ValueError(f"{source} is being imported into chat with id={checkpoint.chat_id}")
+        elif checkpoint.completed_at is not None:
+            return {"lines": 0, "messages": 0, "unknown_authors": 0}
+    skip = checkpoint.lines if checkpoint is not None else 0
+
+    if defer_indexes:
+        with engine.begin() as connection:
+            drop_message_search(connection)
+            for index in DBMessage.__table__.indexes:
+                index.drop(connection, checkfirst=True)
+
+    counts = {"lines": 0, "messages": 0, "unknown_authors": 0}
+    authors: dict[str, int | None] = {}
+    imported_at = datetime.now()
+    messages_table = DBMessage.__table__
+    try:
+        for lines, messages in _chunks(path, skip, batch_size):
+            with engine.begin() as connection:
+                _resolve_authors(connection, messages, authors)
+                rows = _message_rows(messages, chat_id, authors, imported_at)
+                if rows:
+                    connection.execute(insert(messages_table), rows)
+                connection.execute(update(DBImportCheckpoint).where(DBImportCheckpoint.source == source).values(
+                    lines=lines, messages=DBImportCheckpoint.messages + len(rows)))
+            counts["lines"] = lines - skip
+            counts["messages"] += len(rows)
+            counts["unknown_authors"] += sum(row["account_id"] is None for row in rows)
+    finally:
+        # Also on a failed load: the app is never left without its indexes, and the committed chunks are counted
+        if defer_indexes:
+            with engine.begin() as connection:
+                add_missing_indexes(connection)
+                install_message_search(connection)
+        with Session(engine) as session:
+            rebuild_chat_stats(session, [chat_id])
+
+    with engine.begin() as connection:
+        connection.execute(update(DBImportCheckpoint).where(DBImportCheckpoint.source == source).values(
+            completed_at=datetime.now()))
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ANALYZE")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", type=Path, help="NDJSON file, optionally gzipped")
+    parser.add_argument("--chat-id", type=int, required=True)
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="lines per insert transaction")
+    parser.add_argument("--source", help="checkpoint name, defaults to the file's absolute path")
+    parser.add_argument("--defer-indexes", action="store_true",
+                        help="drop the messages indexes for the load and rebuild them at the end, only on an idle database")
+    parser.add_argument("--url", help="database url, defaults to the DB_ settings")
+    args = parser.parse_args()
+
+    engine = build_engine(DatabaseSettings(url=args.url) if args.url else DatabaseSettings())
+    start = time.perf_counter()
+    counts = import_messages(engine, args.file, args.chat_id, batch_size=args.batch, source=args.source,
+                             defer_indexes=args.defer_indexes)
+    elapsed = time.perf_counter() - start
+    print(f"{counts['messages']:,} messages from {counts['lines']:,} lines in {elapsed:.1f}s "
+          f"({counts['unknown_authors']:,} without a known author)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
+import html
+from datetime import datetime
+from typing import Iterator
 from backend.database.schema import DBMessage, DBChat
-from sqlmodel import select
-from pydantic import BaseModel
-from backend.database import accounts as accounts_db
+from sqlalchemy import Row, delete, insert, text, tuple_, update
+from sqlmodel import func, select
+from pydantic import BaseModel, Field
+from backend.database import chatmembership as chatmembership_db
+from backend.database import stats as stats_db
 from backend.dependencies import DBSession
 
 class MessageRequest(BaseModel):
@@ -11,20 +16,226 @@ class MessageRequest(BaseModel):
 class UpdateMessageRequest(BaseModel):
      text: str
 
-def get_messages(session: DBSession, chat_id: int) -> list[DBMessage]:
+# Most messages a single batch request may create, edit or delete
+MAX_BATCH_SIZE = 500
+
+class MessageBatchRequest(BaseModel):
+     account_id: int
+     texts: list[str] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+class MessageEdit(BaseModel):
+     id: int
+     text: str
+
+class MessageBatchUpdateRequest(BaseModel):
+     messages: list[MessageEdit] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+class MessageBatchDeleteRequest(BaseModel):
+     ids: list[int] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+# Deepest result a search pages to, each page rescans and re-ranks every match before it
+MAX_SEARCH_RESULTS = 1000
+
+# Rows fetched per round trip while exporting a chat
+EXPORT_BATCH_SIZE = 1000
+
+def iter_message_batches(session: DBSession, chat_id: int, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[list[Row]]:
+     """
+     Yields every message of the chat as batches of (id, text, account_id, chat_id, created_at) rows, ordered by (created_at, id)
+     One statement read through a server-side cursor (yield_per), so only one batch is held in memory at a time
+     Plain rows rather than DBMessage objects, so nothing accumulates in the session's identity map
+     """
+     stmt = (select(DBMessage.id, DBMessage.text, DBMessage.account_id, DBMessage.chat_id, DBMessage.created_at)
+             .where(DBMessage.chat_id == chat_id)
+             .order_by(DBMessage.created_at, DBMessage.id)
+             .execution_options(yield_per=batch_size))
+     yield from session.execute(stmt).partitions()
+
+def get_messages_page(session: DBSession, chat_id: int, limit: int,
+                      before: tuple[datetime, int] | None = None,
+                      after: tuple[datetime, int] | None = None) -> tuple[list[DBMessage], bool]:
+     """
+     Retrieves up to limit messages of a chat ordered by (created_at, id)
+     Without a keyset the most recent messages are returned, otherwise the messages strictly before/after the given (created_at, id)
+     Returns the page in chronological order and whether more messages remain in the same direction
+     """
+     stmt = select_messages_page(chat_id=chat_id, limit=limit, before=before, after=after)
+     return order_messages_page(list(session.exec(stmt)), limit=limit, forward=after is not None)
+
+def select_messages_page(chat_id: int, limit: int,
+                         before: tuple[datetime, int] | None = None,
+                         after: tuple[datetime, int] | None = None):
      """
-     Retrieves all messages inside of a chat given chat_id
+     Builds the keyset query behind get_messages_page, shared with the async helpers
+     Selects one extra row so the caller can tell whether another page exists
      """
+     key = tuple_(DBMessage.created_at, DBMessage.id)
      stmt = select(DBMessage).where(DBMessage.chat_id == chat_id)
+     if after is not None:
+          stmt = stmt.where(key > tuple_(*after)).order_by(DBMessage.created_at, DBMessage.id)
+     else:
+          if before is not None:
+               stmt = stmt.where(key < tuple_(*before))
+          stmt = stmt.order_by(DBMessage.created_at.desc(), DBMessage.id.desc())
+     return stmt.limit(limit + 1)
+
+def order_messages_page(results: list[DBMessage], limit: int, forward: bool) -> tuple[list[DBMessage], bool]:
+     """
+     Trims the extra row fetched by select_messages_page and puts the page in chronological order
+     """
+     has_more = len(results) > limit
+     results = results[:limit]
+     if not forward:
+          results.reverse()
+     return results, has_more
+
+def get_latest_messages(session: DBSession, chat_id: int, limit: int, up_to_id: int) -> list[DBMessage]:
+     """
+     Retrieves the limit newest messages of a chat whose id is at most up_to_id, in id order
+     Backward range scan over the (chat_id, id) index, used to replay messages a client missed
+     """
+     stmt = select(DBMessage).where(
+          DBMessage.chat_id == chat_id,
+          DBMessage.id <= up_to_id
+          ).order_by(DBMessage.id.desc()).limit(limit)
      results = list(session.exec(stmt))
+     results.reverse()
      return results
 
-def create_message(session: DBSession, message: DBMessage) -> DBMessage:
+def create_message(session: DBSession, message: DBMessage) -> int | None:
      """
      Adds given message to database
+     The author's read marker moves to the new message in the same transaction, so their own messages are never unread
+     Returns the chat's change_seq of the new message (see stats.record_messages_added)
      """
      session.add(message)
+     session.flush()
+     chatmembership_db.advance_read_marker(session=session, chat_id=message.chat_id, account_id=message.account_id, message_id=message.id)
+     seq = stats_db.record_messages_added(session=session, chat_id=message.chat_id, count=1, last_message_id=message.id, created_at=message.created_at)
      session.commit()
+     return seq
+
+
+def create_messages(session: DBSession, chat_id: int, account_id: int, texts: list[str]) -> tuple[list[DBMessage], int | None]:
+     """
+     Adds the messages with one multi-row INSERT ... RETURNING id and a single commit
+     The author's read marker moves to the last of them
+     Returns the created messages in request order, not attached to the session, and the chat's change_seq of the last one
+     """
+     created_at = datetime.now()
+     rows = [{"text": text, "account_id": account_id, "chat_id": chat_id, "created_at": created_at} for text in texts]
+     if session.get_bind().dialect.name == "sqlite":
+          # SQLite hands out ids in VALUES order, so the sorted ids line up with rows. sort_by_parameter_order
+          # would fall back to one INSERT per row there
+          ids = sorted(session.scalars(insert(DBMessage).returning(DBMessage.id), rows).all())
+     else:
+          # Elsewhere neither the id order nor the RETURNING order is guaranteed, SQLAlchemy matches them to rows
+          ids = session.scalars(insert(DBMessage).returning(DBMessage.id, sort_by_parameter_order=True), rows).all()
+     chatmembership_db.advance_read_marker(session=session, chat_id=chat_id, account_id=account_id, message_id=ids[-1])
+     seq = stats_db.record_messages_added(session=session, chat_id=chat_id, count=len(ids), last_message_id=ids[-1], created_at=created_at)
+     session.commit()
+     return [DBMessage(id=message_id, **row) for message_id, row in zip(ids, rows)], seq
+
+def get_messages_by_ids(session: DBSession, chat_id: int, message_ids: list[int]) -> list[DBMessage]:
+     """
+     Retrieves the messages of the chat among the given ids with one IN query
+     """
+     stmt = select(DBMessage).where(DBMessage.chat_id == chat_id, DBMessage.id.in_(message_ids))
+     results = list(session.exec(stmt))
+     return results
+
+def update_messages(session: DBSession, messages: list[DBMessage], texts: dict[int, str]) -> tuple[list[DBMessage], int | None]:
+     """
+     Sets the text of each given message of one chat to texts[message.id] with one executemany UPDATE and a single commit
+     Returns the updated messages, not attached to the session, and the chat's change_seq of the last one
+     """
+     updated = [DBMessage(**{**message.model_dump(), "text": texts[message.id]}) for message in messages]
+     session.execute(update(DBMessage), [{"id": message.id, "text": message.text} for message in updated])
+     seq = stats_db.record_messages_changed(session=session, chat_id=updated[0].chat_id, count=len(updated))
+     session.commit()
+     return updated, seq
+
+def delete_messages(session: DBSession, chat_id: int, message_ids: list[int]) -> tuple[list[int], int | None] | None:
+     """
+     Deletes the messages of the chat with the given ids in one statement
+     All or nothing: if any id isn't a message of the chat nothing is deleted and None is returned
+     Returns the deleted ids and the chat's change_seq of the last one otherwise
+     """
+     stmt = delete(DBMessage).where(DBMessage.chat_id == chat_id, DBMessage.id.in_(message_ids)).returning(DBMessage.id)
+     deleted = session.scalars(stmt).all()
+     if len(deleted) != len(set(message_ids)):
+          session.rollback()
+          return None
+     seq = stats_db.record_messages_removed(session=session, chat_id=chat_id, count=len(deleted))
+     session.commit()
+     return list(deleted), seq
+
+
+def search_query(query: str) -> str:
+     """
+     Turns user input into an FTS5 query: every whitespace separated term must match,
+     a trailing * makes a term a prefix. Terms are quoted so FTS5 syntax in the input is searched for literally
+     """
+     terms = []
+     for term in query.split():
+          prefix = term.endswith("*")
+          term = term.rstrip("*")
+          if term:
+               terms.append('"' + term.replace('"', '""') + '"' + ("*" if prefix else ""))
+     return " ".join(terms)
+
+# Private use characters FTS5 wraps matches in, replaced by the markup once the text is escaped
+HIGHLIGHT_OPEN = "\ue000"
+HIGHLIGHT_CLOSE = "\ue001"
+
+def render_highlight(highlighted: str, message_text: str, open_mark: str, close_mark: str) -> str:
+     """
+     Returns the HTML-escaped text of a search hit with its matches wrapped in open_mark and close_mark
+     A message that itself contains the sentinels is returned escaped without highlights
+     """
+     if HIGHLIGHT_OPEN in message_text or HIGHLIGHT_CLOSE in message_text:
+          return html.escape(message_text)
+     return html.escape(highlighted).replace(HIGHLIGHT_OPEN, open_mark).replace(HIGHLIGHT_CLOSE, close_mark)
+
+def search_messages(session: DBSession, chat_id: int, query: str, limit: int, offset: int = 0,
+                    open_mark: str = "<mark>", close_mark: str = "</mark>") -> tuple[list[tuple[DBMessage, str]], bool]:
+     """
+     Searches the messages of a chat, best match first
+     SQLite ranks with bm25 over the messages_fts index and highlights matches between open_mark and close_mark
+     Other databases fall back to a case-insensitive substring match, newest first, without highlights
+     The highlighted text is HTML-escaped, only the marks are markup
+     Returns up to limit (message, highlighted text) pairs and whether more results remain
+     """
+     terms = search_query(query)
+     if not terms:
+          return [], False
+     if session.get_bind().dialect.name == "sqlite":
+          stmt = text("""
+               SELECT rowid, highlight(messages_fts, 0, :open_mark, :close_mark)
+               FROM messages_fts
+               WHERE messages_fts MATCH :match
+               ORDER BY bm25(messages_fts, 1.0, 0.0), rowid DESC
+               LIMIT :limit OFFSET :offset""")
+          match = f'chat_id : "{chat_id}" AND text : ({terms})'
+          hits = session.execute(stmt, {"match": match, "open_mark": HIGHLIGHT_OPEN, "close_mark": HIGHLIGHT_CLOSE,
+                                        "limit": limit + 1, "offset": offset}).all()
+     else:
+          stmt = select(DBMessage.id, DBMessage.text).where(DBMessage.chat_id == chat_id)
+          for term in query.split():
+               stmt = stmt.where(DBMessage.text.icontains(term.rstrip("*"), autoescape=True))
+          hits = session.exec(stmt.order_by(DBMessage.id.desc()).limit(limit + 1).offset(offset)).all()
+     has_more = len(hits) > limit
+     hits = hits[:limit]
+     messages = {message.id: message for message in get_messages_by_ids(session, chat_id, [hit[0] for hit in hits])}
+     return [(messages[message_id], render_highlight(highlighted, messages[message_id].text, open_mark, close_mark))
+             for message_id, highlighted in hits if message_id in messages], has_more
+
+
+def get_latest_message_id(session: DBSession, chat_id: int) -> int | None:
+     """
+     Returns the greatest message id of the chat, None if it has no messages
+     """
+     return session.exec(select(func.max(DBMessage.id)).where(DBMessage.chat_id == chat_id)).one()
 
 
 def get_message_by_id(session: DBSession, message_id: int) -> DBMessage:
@@ -48,30 +259,37 @@ def message_in_chat(session: DBSession, message_id: int, chat: DBChat) -> bool:
      result = session.exec(stmt).first()
      return result is not None 
 
-def update_message(session: DBSession, message: DBMessage, update: UpdateMessageRequest) -> DBMessage:
+def update_message(session: DBSession, message: DBMessage, update: UpdateMessageRequest) -> int | None:
     """
     Updates the text of given message based on given request model.
+    Returns the chat's change_seq of the edit
     """
     message.text = update.text
+    seq = stats_db.record_messages_changed(session=session, chat_id=message.chat_id, count=1)
     session.commit()
-    return message
+    return seq
 
-def delete_message(session: DBSession, message: DBMessage) -> None:
+def delete_message(session: DBSession, message: DBMessage) -> int | None:
      """
      Deletes given message from database
+     Returns the chat's change_seq of the delete
      """
-     mesage_to_delete = get_message_by_id(session=session, message_id=message.id)
-     session.delete(mesage_to_delete)
+     chat_id = message.chat_id
+     session.delete(message)
+     session.flush()
+     seq = stats_db.record_messages_removed(session=session, chat_id=chat_id, count=1)
      session.commit()
+     return seq
 
-def nullify_account_messages(session: DBSession, account_id: int) -> None:
+def nullify_account_messages(session: DBSession, account_id: int, chat_id: int) -> None:
      """
-     Nullifies each message associated with given account id
+     Nullifies the account_id of the account's messages in the given chat with one UPDATE
+     Doesn't commit, so it joins the caller's transaction
      """
-     messages = accounts_db.get_all_messages(session=session, account_id=account_id)
-     for message in messages:
-          message.account = None
-     session.commit()
+     session.execute(update(DBMessage).where(
+          DBMessage.chat_id == chat_id,
+          DBMessage.account_id == account_id
+          ).values(account_id=None))
      
 
 
@@ -1,9 +1,14 @@
 """Database table models."""
 
 from datetime import datetime
+from sqlalchemy import Index, event
 from sqlmodel import Field, Relationship, SQLModel
 
 
+# passive_deletes leaves the ondelete rules of the child foreign keys to the database
+# (SQLite enforces them with PRAGMA foreign_keys=ON, see settings.sqlite_foreign_keys),
+# so deleting an account or a chat never loads its messages and memberships into the session
+
 class DBAccount(SQLModel, table=True):
     __tablename__ = "accounts"  # type: ignore
 
@@ -15,10 +20,14 @@ class DBAccount(SQLModel, table=True):
 
     # relationships
     owned_chats: list["DBChat"] = Relationship(back_populates="owner")
-    messages: list["DBMessage"] = Relationship(back_populates="account")
+    messages: list["DBMessage"] = Relationship(
+        back_populates="account",
+        passive_deletes=True,
+    )
     memberships: list["DBChatMembership"] = Relationship(
         back_populates="account",
         cascade_delete=True,
+        passive_deletes=True,
     )
 
 
@@ -27,23 +36,32 @@ class DBChat(SQLModel, table=True):
 
     # fields
     id: int | None = Field(default=None, primary_key=True)
-    name: str
-    owner_id: int = Field(foreign_key="accounts.id", ondelete="RESTRICT")
+    name: str = Field(index=True)
+    owner_id: int = Field(foreign_key="accounts.id", ondelete="RESTRICT", index=True)
+    # set when the chat is deleted, the row stays (hidden from every read) until its messages are purged
+    deleted_at: datetime | None = Field(default=None, index=True)
 
     # relationships
     owner: DBAccount = Relationship(back_populates="owned_chats")
     messages: list["DBMessage"] = Relationship(
         back_populates="chat",
         cascade_delete=True,
+        passive_deletes=True,
     )
     memberships: list["DBChatMembership"] = Relationship(
         back_populates="chat",
         cascade_delete=True,
+        passive_deletes=True,
     )
 
 
 class DBMessage(SQLModel, table=True):
     __tablename__ = "messages"  # type: ignore
+    __table_args__ = (
+        # keyset pagination within a chat: id ranges and (created_at, id) ordering
+        Index("ix_messages_chat_id_id", "chat_id", "id"),
+        Index("ix_messages_chat_id_created_at_id", "chat_id", "created_at", "id"),
+    )
 
     # fields
     id: int | None = Field(default=None, primary_key=True)
@@ -52,12 +70,13 @@ class DBMessage(SQLModel, table=True):
         default=None,
         foreign_key="accounts.id",
         ondelete="SET NULL",
+        index=True,
     )
     chat_id: int = Field(
         foreign_key="chats.id",
         ondelete="CASCADE",
     )
-    created_at: datetime | None = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=datetime.now)
     print(created_at, "                 created at ")
 
     # relationships
@@ -67,6 +86,10 @@ class DBMessage(SQLModel, table=True):
 
 class DBChatMembership(SQLModel, table=True):
     __tablename__ = "chat_memberships"  # type: ignore
+    __table_args__ = (
+        # the primary key leads with account_id, this serves the members of a chat
+        Index("ix_chat_memberships_chat_id_account_id", "chat_id", "account_id"),
+    )
 
     # fields
     account_id: int = Field(
@@ -79,6 +102,8 @@ class DBChatMembership(SQLModel, table=True):
         primary_key=True,
         ondelete="CASCADE",
     )
+    # id of the newest message the account has read, messages of the chat with a greater id are unread
+    last_read_message_id: int | None = None
 
     # relationships
     account: DBAccount = Relationship(back_populates="memberships")
@@ -87,6 +112,40 @@ class DBChatMembership(SQLModel, table=True):
 
 
 
+class DBChatStats(SQLModel, table=True):
+    """Per-chat counters maintained by every write path, rebuilt from the base tables by stats.rebuild_chat_stats."""
+
+    __tablename__ = "chat_stats"  # type: ignore
+
+    # fields
+    chat_id: int = Field(
+        foreign_key="chats.id",
+        primary_key=True,
+        ondelete="CASCADE",
+    )
+    message_count: int = 0
+    member_count: int = 0
+    last_message_id: int | None = None
+    last_activity_at: datetime | None = None
+    # Bumped by every message created, edited or deleted, the id of the chat's event stream events
+    change_seq: int = 0
+    # change_seq of the last edit or delete, an event stream behind it may have missed one
+    last_changed_seq: int = 0
+
+
+class DBImportCheckpoint(SQLModel, table=True):
+    """Progress of an NDJSON import (backend.database.importer), committed with every chunk it inserts."""
+
+    __tablename__ = "import_checkpoints"  # type: ignore
+
+    # fields
+    source: str = Field(primary_key=True)
+    chat_id: int = Field(foreign_key="chats.id", ondelete="CASCADE", index=True)
+    lines: int = 0  # lines of the source consumed so far
+    messages: int = 0
+    completed_at: datetime | None = None
+
+
 class DBJoinChatRequest(SQLModel, table=True):
     
     __tablename__ = "join_chat_request"  # type: ignore
@@ -101,9 +160,63 @@ class DBJoinChatRequest(SQLModel, table=True):
         foreign_key="chats.id",
         primary_key=True,
         ondelete="CASCADE",
+        index=True,
     )
 
 
-
-
+# Full-text search over messages (SQLite FTS5)
+# messages_fts is an external content index of messages.text and messages.chat_id, so the
+# text is stored once. Triggers keep it in step with every insert, edit and delete, including
+# bulk statements and cascades. chat_id is indexed as a token so a search within one chat
+# intersects posting lists instead of filtering every match.
+MESSAGE_SEARCH_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        text, chat_id, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, text, chat_id) VALUES (new.id, new.text, new.chat_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text, chat_id) VALUES ('delete', old.id, old.text, old.chat_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF text, chat_id ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text, chat_id) VALUES ('delete', old.id, old.text, old.chat_id);
+        INSERT INTO messages_fts(rowid, text, chat_id) VALUES (new.id, new.text, new.chat_id);
+    END""",
+)
+
+
+def install_message_search(connection) -> None:
+    """
+    Creates messages_fts and its triggers if missing and indexes the messages already stored
+    No-op on databases other than SQLite
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    installed = connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").first()
+    for statement in MESSAGE_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+    if installed is None:
+        connection.exec_driver_sql("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+
+@event.listens_for(DBMessage.__table__, "after_create")
+def _create_message_search(target, connection, **kw):
+    install_message_search(connection)
+
+
+def drop_message_search(connection) -> None:
+    """
+    Drops messages_fts and its triggers, install_message_search recreates and refills them
+    No-op on databases other than SQLite
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    for trigger in ("messages_fts_insert", "messages_fts_delete", "messages_fts_update"):
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    connection.exec_driver_sql("DROP TABLE IF EXISTS messages_fts")
+
+
+@event.listens_for(DBMessage.__table__, "before_drop")
+def _drop_message_search(target, connection, **kw):
+    drop_message_search(connection)
 
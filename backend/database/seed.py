@@ -0,0 +1,204 @@
+"""Fills the database with a synthetic, deterministic dataset for benchmarks and query plan checks.
+
+Chat sizes follow a Pareto distribution (a few huge chats, a long tail of small ones),
+and each chat's share of the messages is proportional to its size. Message timestamps
+are spread between the chat's creation and --end, so ids increase with created_at as in
+production. Message lengths are log-normal in words.
+
+Rows are written with multi-row executemany inserts in chunks of --batch, one transaction
+per chunk, instead of session.add/commit per object, and chat_stats is rebuilt once at the end. Passwords come from a small pool
+hashed once: account n logs in with f"seed-password-{n % PASSWORD_POOL_SIZE}".
+
+The same --seed always produces the same rows.
+
+Usage:
+    python -m backend.database.seed [--accounts 10000] [--chats 2000] [--messages 1000000]
+                                    [--join-requests 5000] [--seed 0] [--url sqlite:///seed.db]
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator
+
+from sqlalchemy import Engine, func, insert, select
+from sqlmodel import Session, SQLModel
+
+from backend.database.schema import DBAccount, DBChat, DBChatMembership, DBJoinChatRequest, DBMessage
+from backend.database.stats import rebuild_chat_stats
+from backend.dependencies import build_engine
+from backend.security import hash_password
+from backend.settings import DatabaseSettings
+
+
+PASSWORD_POOL_SIZE = 4
+CHAT_SIZE_ALPHA = 1.2
+MIN_CHAT_SIZE = 2
+BATCH_SIZE = 5000
+WORDS = (
+    "pony express mail rider saddle trail river station relay canyon desert prairie letter parcel "
+    "sunrise dust horse fast route west east frontier telegraph schedule arrive depart message reply "
+    "thanks sure okay maybe tomorrow tonight meeting lunch update deploy review ticket issue fixed "
+    "broken works again later please check this that with from about around before after the a and"
+).split()
+
+
+def password_pool(size: int = PASSWORD_POOL_SIZE) -> list[str]:
+    """
+    Returns bcrypt hashes of the seed passwords, hashed once so seeding isn't bcrypt-bound
+    """
+    return [hash_password(f"seed-password-{i}") for i in range(size)]
+
+
+def chat_sizes(rng: random.Random, chats: int, accounts: int, alpha: float = CHAT_SIZE_ALPHA) -> list[int]:
+    """
+    Returns the member count of each chat, Pareto distributed and capped at the number of accounts
+    """
+    low = min(MIN_CHAT_SIZE, accounts)
+    return [min(accounts, int(low * rng.paretovariate(alpha))) for _ in range(chats)]
+
+
+def message_counts(sizes: list[int], messages: int) -> list[int]:
+    """
+    Splits messages across chats in proportion to their size, the counts add up to messages
+    """
+    total = sum(sizes) or 1
+    counts = [messages * size // total for size in sizes]
+    # Hand the rounding remainder to the largest chats
+    for index in sorted(range(len(sizes)), key=lambda i: -sizes[i])[:messages - sum(counts)]:
+        counts[index] += 1
+    return counts
+
+
+def message_text(rng: random.Random) -> str:
+    """
+    Returns a message of log-normally distributed length (median around 7 words)
+    """
+    length = max(1, min(200, int(rng.lognormvariate(2.0, 0.8))))
+    return " ".join(rng.choices(WORDS, k=length))
+
+
+def _chunks(rows: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _bulk_insert(engine: Engine, table, rows: Iterable[dict], batch_size: int) -> int:
+    inserted = 0
+    for chunk in _chunks(rows, batch_size):
+        with engine.begin() as connection:
+            connection.execute(insert(table), chunk)
+        inserted += len(chunk)
+    return inserted
+
+
+def _next_id(engine: Engine, table) -> int:
+    with engine.connect() as connection:
+        return (connection.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def seed_database(engine: Engine, accounts: int, chats: int, messages: int, join_requests: int = 0,
+                  seed: int = 0, end: datetime = datetime(2025, 1, 1), days: int = 365,
+                  batch_size: int = BATCH_SIZE, hashes: list[str] | None = None) -> dict[str, int]:
+    """
+    Adds the synthetic dataset to the engine's database (tables are created if missing)
+    Ids continue after the existing rows, so it can also be run against a non-empty database
+    Returns the number of rows inserted per table
+    """
+    SQLModel.metadata.create_all(engine)
+    rng = random.Random(seed)
+    hashes = hashes or password_pool()
+    accounts_table, chats_table = DBAccount.__table__, DBChat.__table__
+    memberships_table, messages_table = DBChatMembership.__table__, DBMessage.__table__
+    first_account, first_chat, first_message = (_next_id(engine, table) for table in (accounts_table, chats_table, messages_table))
+    account_ids = range(first_account, first_account + accounts)
+    chat_ids = range(first_chat, first_chat + chats)
+    counts = {}
+
+    counts["accounts"] = _bulk_insert(engine, accounts_table, (
+        {"id": account_id, "username": f"seed{account_id}", "email": f"seed{account_id}@example.com",
+         "hashed_password": hashes[account_id % len(hashes)]}
+        for account_id in account_ids
+    ), batch_size)
+
+    sizes = chat_sizes(rng, chats, accounts)
+    owners = [rng.choice(account_ids) for _ in chat_ids]
+    span = timedelta(days=days).total_seconds()
+    created = [end - timedelta(seconds=rng.uniform(0, span)) for _ in chat_ids]
+    counts["chats"] = _bulk_insert(engine, chats_table, (
+        {"id": chat_id, "name": f"{rng.choice(WORDS)}-{rng.choice(WORDS)}-{chat_id}", "owner_id": owner}
+        for chat_id, owner in zip(chat_ids, owners)
+    ), batch_size)
+
+    members: list[list[int]] = []
+    for owner, size in zip(owners, sizes):
+        others = [account_id for account_id in rng.sample(account_ids, size) if account_id != owner][:max(0, size - 1)]
+        members.append([owner, *others])
+    counts["chat_memberships"] = _bulk_insert(engine, memberships_table, (
+        {"account_id": account_id, "chat_id": chat_id}
+        for chat_id, chat_members in zip(chat_ids, members)
+        for account_id in chat_members
+    ), batch_size)
+
+    def message_rows() -> Iterator[dict]:
+        message_id = first_message
+        for chat_id, chat_members, start, count in zip(chat_ids, members, created, message_counts(sizes, messages)):
+            window = (end - start).total_seconds()
+            for offset in sorted(rng.uniform(0, window) for _ in range(count)):
+                yield {"id": message_id, "text": message_text(rng), "account_id": rng.choice(chat_members),
+                       "chat_id": chat_id, "created_at": start + timedelta(seconds=offset)}
+                message_id += 1
+
+    counts["messages"] = _bulk_insert(engine, messages_table, message_rows(), batch_size)
+
+    requested = set()
+    attempts = 0
+    while len(requested) < join_requests and attempts < join_requests * 10 and chats:
+        attempts += 1
+        index = rng.randrange(chats)
+        sender = rng.choice(account_ids)
+        if sender not in members[index]:
+            requested.add((sender, chat_ids[index]))
+    counts["join_chat_request"] = _bulk_insert(engine, DBJoinChatRequest.__table__, (
+        {"sender_id": sender, "chat_id": chat_id} for sender, chat_id in sorted(requested)
+    ), batch_size)
+
+    # The bulk inserts bypass the write paths that keep chat_stats current
+    with Session(engine) as session:
+        counts["chat_stats"] = rebuild_chat_stats(session, list(chat_ids))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--chats", type=int, default=2_000)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--join-requests", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--end", type=datetime.fromisoformat, default=datetime(2025, 1, 1),
+                        help="latest message timestamp, ISO format")
+    parser.add_argument("--days", type=int, default=365, help="how far back chats were created")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="rows per insert transaction")
+    parser.add_argument("--url", help="database url, defaults to the DB_ settings")
+    args = parser.parse_args()
+
+    engine = build_engine(DatabaseSettings(url=args.url) if args.url else DatabaseSettings())
+    start = time.perf_counter()
+    counts = seed_database(engine, args.accounts, args.chats, args.messages, args.join_requests,
+                           seed=args.seed, end=args.end, days=args.days, batch_size=args.batch)
+    elapsed = time.perf_counter() - start
+    for table, count in counts.items():
+        print(f"{table:<20}{count:>12,}")
+    print(f"{sum(counts.values()):,} rows in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
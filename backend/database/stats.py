@@ -0,0 +1,198 @@
+"""Denormalized per-chat statistics (chat_stats).
+
+Write paths adjust a chat's row in the same transaction as the change itself, so counts
+are read with one primary key lookup instead of counting the base tables. A missing row
+(a chat written outside these paths, e.g. by a bulk load) is computed from the base tables
+when it is read, without writing it; rebuild_chat_stats repairs the rows.
+
+Usage:
+    python -m backend.database.stats [--url sqlite:///development.db]
+"""
+
+import argparse
+from datetime import datetime
+
+from sqlalchemy import bindparam, delete, insert, literal, update
+from sqlmodel import Session, func, select
+
+from backend.database.schema import DBChat, DBChatMembership, DBChatStats, DBMessage
+from backend.dependencies import DBSession, build_engine
+from backend.settings import DatabaseSettings
+
+
+def _last_message(column, chat_id):
+     return (select(column)
+             .where(DBMessage.chat_id == chat_id)
+             .order_by(DBMessage.created_at.desc(), DBMessage.id.desc())
+             .limit(1)
+             .scalar_subquery())
+
+
+def messages_added(chat_id: int, count: int, last_message_id: int, created_at: datetime):
+     """
+     Builds the chat_stats UPDATE for count new messages, the newest being last_message_id
+     Each message takes the next change_seq, the statement returns the last one
+     """
+     return update(DBChatStats).where(DBChatStats.chat_id == chat_id).values(
+          message_count=DBChatStats.message_count + count,
+          last_message_id=last_message_id,
+          last_activity_at=created_at,
+          change_seq=DBChatStats.change_seq + count,
+     ).returning(DBChatStats.change_seq)
+
+
+def messages_removed(chat_id: int, count: int):
+     """
+     Builds the chat_stats UPDATE for count deleted messages, the last message is looked up again on the index
+     Run after the DELETE so the lookup no longer sees the deleted rows
+     Each message takes the next change_seq, the statement returns the last one
+     """
+     return update(DBChatStats).where(DBChatStats.chat_id == chat_id).values(
+          message_count=DBChatStats.message_count - count,
+          last_message_id=_last_message(DBMessage.id, chat_id),
+          last_activity_at=_last_message(DBMessage.created_at, chat_id),
+          # The right-hand sides read the row as it was before this UPDATE
+          change_seq=DBChatStats.change_seq + count,
+          last_changed_seq=DBChatStats.change_seq + count,
+     ).returning(DBChatStats.change_seq)
+
+
+def messages_changed(chat_id: int, count: int):
+     """
+     Builds the chat_stats UPDATE for count edited messages
+     Each message takes the next change_seq, the statement returns the last one
+     """
+     return update(DBChatStats).where(DBChatStats.chat_id == chat_id).values(
+          change_seq=DBChatStats.change_seq + count,
+          last_changed_seq=DBChatStats.change_seq + count,
+     ).returning(DBChatStats.change_seq)
+
+
+def members_changed(chat_id: int, delta: int):
+     """
+     Builds the chat_stats UPDATE for delta members joining (positive) or leaving (negative)
+     """
+     return update(DBChatStats).where(DBChatStats.chat_id == chat_id).values(
+          member_count=DBChatStats.member_count + delta,
+     )
+
+
+def record_messages_added(session: DBSession, chat_id: int, count: int, last_message_id: int, created_at: datetime) -> int | None:
+     """
+     Adds count messages to the chat's stats, doesn't commit
+     Returns the chat's change_seq after the write, None if the chat has no stats row
+     """
+     return session.execute(messages_added(chat_id=chat_id, count=count, last_message_id=last_message_id, created_at=created_at)).scalar()
+
+
+def record_messages_removed(session: DBSession, chat_id: int, count: int) -> int | None:
+     """
+     Removes count messages from the chat's stats, doesn't commit
+     Returns the chat's change_seq after the write, None if the chat has no stats row
+     """
+     return session.execute(messages_removed(chat_id=chat_id, count=count)).scalar()
+
+
+def record_messages_changed(session: DBSession, chat_id: int, count: int) -> int | None:
+     """
+     Records that count messages of the chat were edited, doesn't commit
+     Returns the chat's change_seq after the write, None if the chat has no stats row
+     """
+     return session.execute(messages_changed(chat_id=chat_id, count=count)).scalar()
+
+
+def record_members_changed(session: DBSession, chat_id: int, delta: int) -> None:
+     """
+     Adds delta to the chat's member count, doesn't commit
+     """
+     session.execute(members_changed(chat_id=chat_id, delta=delta))
+
+
+def record_account_left_chats(session: DBSession, account_id: int) -> None:
+     """
+     Decrements the member count of every chat the account belongs to, run before the account is deleted, doesn't commit
+     """
+     chat_ids = select(DBChatMembership.chat_id).where(DBChatMembership.account_id == account_id)
+     session.execute(update(DBChatStats).where(DBChatStats.chat_id.in_(chat_ids)).values(
+          member_count=DBChatStats.member_count - 1,
+     ))
+
+
+def create_chat_stats(session: DBSession, chat_id: int) -> None:
+     """
+     Adds the stats row of a new, empty chat, doesn't commit
+     """
+     session.add(DBChatStats(chat_id=chat_id))
+
+
+STATS_COLUMNS = ("chat_id", "message_count", "member_count", "last_message_id", "last_activity_at", "change_seq", "last_changed_seq")
+
+
+def select_computed_stats(chat_id: int | None = None, include_deleted: bool = True):
+     """
+     Builds the SELECT of the STATS_COLUMNS computed from the base tables, with change_seq and last_changed_seq 0
+     Of the given chat (every chat if None), tombstoned chats left out unless include_deleted
+     """
+     message_count = select(func.count()).select_from(DBMessage).where(DBMessage.chat_id == DBChat.id).scalar_subquery()
+     member_count = select(func.count()).select_from(DBChatMembership).where(DBChatMembership.chat_id == DBChat.id).scalar_subquery()
+     stmt = select(DBChat.id, message_count, member_count,
+                   _last_message(DBMessage.id, DBChat.id), _last_message(DBMessage.created_at, DBChat.id),
+                   literal(0), literal(0))
+     if chat_id is not None:
+          stmt = stmt.where(DBChat.id == chat_id)
+     if not include_deleted:
+          stmt = stmt.where(DBChat.deleted_at.is_(None))
+     return stmt
+
+
+def rebuild_chat_stats(session: DBSession, chat_ids: list[int] | None = None) -> int:
+     """
+     Recomputes the stats of the given chats (every chat if None) from the base tables and commits
+     The rebuilt chats may have had writes no event was published for, so a chat that had a row keeps its
+     change_seq, bumped once and counted as a change (an event stream behind it resets once)
+     Returns the number of rows written
+     """
+     rows = select_computed_stats()
+     clear = delete(DBChatStats)
+     sequences = select(DBChatStats.chat_id, DBChatStats.change_seq)
+     if chat_ids is not None:
+          rows = rows.where(DBChat.id.in_(chat_ids))
+          clear = clear.where(DBChatStats.chat_id.in_(chat_ids))
+          sequences = sequences.where(DBChatStats.chat_id.in_(chat_ids))
+     kept = [{"stats_chat_id": chat_id, "seq": seq + 1} for chat_id, seq in session.execute(sequences)]
+     session.execute(clear)
+     result = session.execute(insert(DBChatStats).from_select(list(STATS_COLUMNS), rows))
+     if kept:
+          # A sequence that went back would let a stream's Last-Event-ID skip the changes up to it
+          table = DBChatStats.__table__
+          session.execute(update(table).where(table.c.chat_id == bindparam("stats_chat_id"))
+                          .values(change_seq=bindparam("seq"), last_changed_seq=bindparam("seq")), kept)
+     session.commit()
+     return result.rowcount
+
+
+def get_chat_stats(session: DBSession, chat_id: int, include_deleted: bool = False) -> DBChatStats | None:
+     """
+     Returns the chat's stats
+     If the row is missing they are computed from the base tables into an object that isn't added to the session,
+     reads never write; None then if the chat doesn't exist or is tombstoned (unless include_deleted)
+     """
+     stats = session.get(DBChatStats, chat_id)
+     if stats is not None:
+          return stats
+     row = session.execute(select_computed_stats(chat_id, include_deleted)).first()
+     return DBChatStats(**dict(zip(STATS_COLUMNS, row))) if row is not None else None
+
+
+def main():
+     parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+     parser.add_argument("--url", help="database url, defaults to the DB_ settings")
+     args = parser.parse_args()
+
+     engine = build_engine(DatabaseSettings(url=args.url) if args.url else DatabaseSettings())
+     with Session(engine) as session:
+          print(f"rebuilt stats of {rebuild_chat_stats(session):,} chats")
+
+
+if __name__ == "__main__":
+     main()
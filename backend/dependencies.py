@@ -1,33 +1,141 @@
 """Dependencies for the backend API.
 
 Args:
-    engine (sqlachemy.engine.Engine): The database engine
+    engine (sqlachemy.engine.Engine): The database engine, configured from backend.settings.database_settings
+    ASYNC_DATABASE (bool): Whether the async-native routes and async_engine are enabled (ASYNC_DATABASE=true)
+    async_engine (sqlalchemy.ext.asyncio.AsyncEngine | None): The async database engine, None unless ASYNC_DATABASE
 """
 
+from datetime import datetime
+
+from sqlalchemy import Engine, event, inspect, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import Depends
-from typing import Annotated
+from typing import Annotated, AsyncIterator
 
 from backend.database.schema import *
-import os
+from backend.settings import DatabaseSettings, database_settings
+
+
+def configure_sqlite(engine: Engine, settings: DatabaseSettings = database_settings) -> None:
+    """
+    Applies the settings' SQLite pragmas to every connection the engine opens
+    """
+    pragmas = settings.sqlite_pragmas()
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def build_engine(settings: DatabaseSettings = database_settings) -> Engine:
+    """
+    Creates the sync engine for the settings' database url
+    SQLite gets the pragma profile, server databases get a pre-pinged, recycled connection pool
+    """
+    url = settings.database_url()
+    if url.startswith("sqlite"):
+        sqlite_engine = create_engine(url, echo=settings.echo, connect_args={"check_same_thread": False})
+        configure_sqlite(sqlite_engine, settings)
+        return sqlite_engine
+    return create_engine(
+        url,
+        echo=settings.echo,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_pre_ping=settings.pool_pre_ping,
+        pool_recycle=settings.pool_recycle,
+    )
+
+
+_db_url = database_settings.database_url()
+engine = build_engine()
+
 
+def _async_url(url: str) -> str:
+    """
+    Returns the given database url with the async driver of its backend (aiosqlite or asyncpg)
+    """
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url.removeprefix("sqlite:")
+    for scheme in ("postgres://", "postgresql://", "postgresql+psycopg2://"):
+        if url.startswith(scheme):
+            return "postgresql+asyncpg://" + url.removeprefix(scheme)
+    return url
 
-if os.getenv("RENDER") == "true":
-    _db_url = os.environ["DATABASE_URL"]
-    engine = create_engine(_db_url, echo=True)
-else:
-    _db_filename = "backend/database/development.db"
-    _db_url = f"sqlite:///{_db_filename}"
-    engine = create_engine(_db_url, echo=True, connect_args={"check_same_thread": False})
 
+ASYNC_DATABASE = database_settings.async_database
+async_engine = create_async_engine(_async_url(_db_url), echo=database_settings.echo) if ASYNC_DATABASE else None
+if async_engine is not None and _db_url.startswith("sqlite"):
+    configure_sqlite(async_engine.sync_engine)
+_async_session_factory = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def add_missing_columns(connection) -> None:
+    """
+    Adds the nullable columns declared on the models but missing from existing tables
+    create_all only creates missing tables, this brings databases created before a column was added up to date
+    """
+    inspector = inspect(connection)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable and not column.primary_key:
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+
+def add_missing_indexes(connection) -> None:
+    """
+    Creates the indexes declared on the models but missing from existing tables
+    create_all only indexes the tables it creates
+    """
+    inspector = inspect(connection)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def backfill_message_timestamps(connection) -> None:
+    """
+    Sets created_at of messages stored without one to the epoch, where the (created_at, id) order already placed them
+    Message pages are keyed on (created_at, id), which cannot represent a NULL created_at
+    Only databases created while the column was nullable are checked
+    """
+    inspector = inspect(connection)
+    if not inspector.has_table("messages"):
+        return
+    columns = {column["name"]: column for column in inspector.get_columns("messages")}
+    if "created_at" in columns and columns["created_at"]["nullable"]:
+        connection.execute(update(DBMessage).where(DBMessage.created_at.is_(None)).values(created_at=datetime(1970, 1, 1)))
 
 
 def create_db_tables():
     SQLModel.metadata.create_all(engine)
+    # Databases created by earlier versions get new columns, indexes and the full-text index on startup
+    with engine.begin() as connection:
+        add_missing_columns(connection)
+        add_missing_indexes(connection)
+        backfill_message_timestamps(connection)
+        install_message_search(connection)
 
 def get_session():
     with Session(engine) as session:
         yield session
 
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    async with _async_session_factory() as session:
+        yield session
+
 # Create the type alias for our session
 DBSession = Annotated[Session, Depends(get_session)]
+AsyncDBSession = Annotated[AsyncSession, Depends(get_async_session)]
@@ -44,6 +44,27 @@ class DeleteErrorAccountChatOnwer(Exception):
                     "message": "Unable to remove the owner of a chat"
                     }) 
      
+class InvalidCursorError(Exception):
+    """Raised when a pagination cursor or keyset anchor can't be used"""
+    def response(self) -> Response:
+        return JSONResponse(
+            status_code=422,
+            content={
+                "error": "invalid_cursor",
+                "message": "Invalid pagination cursor"
+                })
+
+class PasswordHashingUnavailable(Exception):
+    """Raised when the password pool's queue is full"""
+    def response(self) -> Response:
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": "1"},
+            content={
+                "error": "service_unavailable",
+                "message": "Too many password requests, try again shortly"
+                })
+
 class JoinChatRequestDuplicate(Exception):
     def __init__(self, sender_id: int, chat_id: int):
         self.status_code = 422
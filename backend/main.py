@@ -5,11 +5,17 @@ Args:
 """
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from backend.dependencies import create_db_tables
 import backend.dependencies as db
 # Routers to include 
-from backend.error_responses import DeleteErrorAccountChatOnwer, ExpiredAccessToken, InvalidAccessToken, TokenNotProvidedError
+from backend.error_responses import DeleteErrorAccountChatOnwer, ExpiredAccessToken, InvalidAccessToken, InvalidCursorError, PasswordHashingUnavailable, TokenNotProvidedError
 from backend.routers import accounts, auth, chats, requests
+from backend.routers.aio import accounts as aio_accounts, chats as aio_chats
+from backend import metrics
+from backend.cache import membership_index, principal_cache
+from backend.purge import chat_purger
+from backend.realtime import chat_events
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -17,6 +23,8 @@ from fastapi.middleware.cors import CORSMiddleware
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_tables()
+    # Finish purging chats deleted before the last shutdown
+    chat_purger.resume(db.engine)
     yield
 
 app = FastAPI(
@@ -32,14 +40,33 @@ app.add_middleware(
     allow_headers=["*"],
     allow_credentials=True,
 )
+# Added last so it is outermost and times the whole request, CORS included
+app.add_middleware(metrics.MetricsMiddleware)
 
 
+if db.ASYNC_DATABASE:
+    # Async-native routes take precedence over the sync routes with the same path
+    app.include_router(aio_accounts.router)
+    app.include_router(aio_chats.router)
 app.include_router(accounts.router)
 app.include_router(chats.router)
 app.include_router(auth.router)
 app.include_router(requests.router)
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics() -> PlainTextResponse:
+    """
+    Request, SQL, cache and connection metrics in the Prometheus text format
+    """
+    gauges = {"chat_event_connections": ("Open websocket and event stream connections", chat_events.connection_count()),
+              "chat_purge_pending": ("Deleted chats waiting for their messages to be purged", chat_purger.pending())}
+    for name, cache in (("principal_cache", principal_cache), ("membership_index", membership_index)):
+        for stat, value in cache.stats().items():
+            gauges[f"{name}_{stat}"] = (f"{name} {stat}", value)
+    return PlainTextResponse(metrics.registry.render(gauges), media_type="text/plain; version=0.0.4")
+
+
 @app.exception_handler(ExpiredAccessToken)
 def handled_expired_token(request: Request, exception: ExpiredAccessToken):
     return exception.response()
@@ -56,6 +83,14 @@ def handled_expired_token(request: Request, exception: InvalidAccessToken):
 def handled_expired_token(request: Request, exception: DeleteErrorAccountChatOnwer):
     return exception.response()
 
+@app.exception_handler(InvalidCursorError)
+def handled_invalid_cursor(request: Request, exception: InvalidCursorError):
+    return exception.response()
+
+@app.exception_handler(PasswordHashingUnavailable)
+def handled_password_unavailable(request: Request, exception: PasswordHashingUnavailable):
+    return exception.response()
+
 
 
 
@@ -0,0 +1,216 @@
+"""Request and SQL metrics in the Prometheus text exposition format.
+
+MetricsMiddleware times every HTTP request and labels it with the route template
+(e.g. /chats/{chat_id}/messages), never the raw path, so label sets stay bounded.
+SQL statements are counted through engine events into a per-request tally held in
+a context variable, which follows the request into the threadpool that runs sync routes.
+The tally also wraps the ASGI send to capture the response status, one object per request.
+
+A streamed response (no content-length, e.g. an event stream or an export) is measured up to
+the start of the response, so long-lived streams don't fill the latency histogram with their
+lifetime and the SQL their bodies issue isn't charged to the request. Websockets aren't recorded.
+
+Counters are plain ints only ever written on the event loop thread, so they need no lock.
+A route's series are allocated on its first request; later requests only increment.
+
+Args:
+    LATENCY_BUCKETS (tuple[float]): Upper bounds of the request latency histogram, in seconds
+    SQL_COUNT_BUCKETS (tuple[float]): Upper bounds of the statements per request histogram
+    SQL_TIME_BUCKETS (tuple[float]): Upper bounds of the SQL seconds per request histogram
+    registry (MetricsRegistry): The process wide registry the middleware records into
+"""
+
+import bisect
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import Engine, event
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SQL_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    """Fixed-bucket histogram, bucket counts are kept non-cumulative and summed when rendered."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: str) -> list[str]:
+        """
+        Returns the _bucket, _sum and _count lines of the histogram
+        """
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _format_value(bound)
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class RouteMetrics:
+    """Every series recorded for one method and route template."""
+
+    __slots__ = ("responses", "latency", "sql_statements", "sql_seconds")
+
+    def __init__(self):
+        self.responses: dict[int, int] = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.sql_statements = Histogram(SQL_COUNT_BUCKETS)
+        self.sql_seconds = Histogram(SQL_TIME_BUCKETS)
+
+
+class RequestSQL:
+    """SQL tally and response status of the request being served."""
+
+    __slots__ = ("statements", "seconds", "started", "status", "responded", "_send")
+
+    def __init__(self, send):
+        self.statements = 0
+        self.seconds = 0.0
+        self.started = 0.0
+        self.status = 500
+        # perf_counter when a streamed response started, the request is over for its metrics
+        self.responded: float | None = None
+        self._send = send
+
+    async def send(self, message) -> None:
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            if not any(name == b"content-length" for name, _ in message.get("headers", ())):
+                self.responded = time.perf_counter()
+        await self._send(message)
+
+
+_request_sql: ContextVar[RequestSQL | None] = ContextVar("request_sql", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    tally = _request_sql.get()
+    if tally is not None and tally.responded is None:
+        tally.started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    tally = _request_sql.get()
+    if tally is not None and tally.responded is None:
+        tally.statements += 1
+        tally.seconds += time.perf_counter() - tally.started
+
+
+class MetricsRegistry:
+    """Per-route request metrics plus the process wide in-flight gauge."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.routes: dict[tuple[str, str], RouteMetrics] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float, sql: RequestSQL) -> None:
+        """
+        Records one finished request
+        """
+        metrics = self.routes.get((method, route))
+        if metrics is None:
+            metrics = self.routes[(method, route)] = RouteMetrics()
+        metrics.responses[status] = metrics.responses.get(status, 0) + 1
+        metrics.latency.observe(seconds)
+        metrics.sql_statements.observe(sql.statements)
+        metrics.sql_seconds.observe(sql.seconds)
+
+    def clear(self) -> None:
+        """
+        Forgets every recorded route
+        """
+        self.routes.clear()
+
+    def render(self, gauges: dict[str, tuple[str, float]] | None = None) -> str:
+        """
+        Returns the registry in the Prometheus text format
+        gauges adds extra name -> (help, value) gauges, e.g. cache sizes
+        """
+        lines = [
+            "# HELP http_requests_in_flight Requests currently being served",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_requests_total Requests served by method, route and status",
+            "# TYPE http_requests_total counter",
+        ]
+        routes = sorted(self.routes.items())
+        for (method, route), metrics in routes:
+            for status, count in sorted(metrics.responses.items()):
+                lines.append(f'http_requests_total{{{_labels(method, route)},status="{status}"}} {count}')
+
+        for name, attribute, help_text in (
+            ("http_request_duration_seconds", "latency", "Request latency by method and route"),
+            ("db_statements_per_request", "sql_statements", "SQL statements issued per request"),
+            ("db_statement_seconds_per_request", "sql_seconds", "Seconds spent executing SQL per request"),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), metrics in routes:
+                lines.extend(getattr(metrics, attribute).samples(name, _labels(method, route)))
+
+        for name, (help_text, value) in (gauges or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording every HTTP request into a MetricsRegistry."""
+
+    def __init__(self, app, metrics: MetricsRegistry | None = None):
+        self.app = app
+        self.registry = metrics if metrics is not None else registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        sql = RequestSQL(send)
+        token = _request_sql.set(sql)
+        registry.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, sql.send)
+        finally:
+            elapsed = (sql.responded or time.perf_counter()) - start
+            registry.in_flight -= 1
+            _request_sql.reset(token)
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            path = getattr(route, "path", UNMATCHED_ROUTE)
+            registry.observe(scope["method"], path, sql.status, elapsed, sql)
+
+
+def _labels(method: str, route: str) -> str:
+    route = route.replace("\\", "\\\\").replace('"', '\\"')
+    return f'method="{method}",route="{route}"'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
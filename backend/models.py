@@ -13,9 +13,24 @@ class Chat(BaseModel):
 class Message(BaseModel):
     id: int | None
     text: str
-    account_id: int 
+    account_id: int | None  # null once the author leaves the chat or deletes their account
     chat_id: int 
-    created_at: datetime | None
+    created_at: datetime
+
+class MessageSearchResult(Message):
+    highlight: str
+
+class InboxChat(Chat):
+    message_count: int
+    last_message: Message | None
+    last_activity: datetime | None
+
+class ChatStats(BaseModel):
+    chat_id: int
+    message_count: int
+    member_count: int
+    last_message_id: int | None
+    last_activity_at: datetime | None
 
 class ChatMembership(BaseModel):
     account_id: int 
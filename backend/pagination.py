@@ -0,0 +1,63 @@
+"""Cursor (keyset) pagination helpers shared by the list routes.
+
+Args:
+    DEFAULT_PAGE_SIZE (int): Page size used when the caller does not pass a limit
+    MAX_PAGE_SIZE (int): Largest page size a caller may request
+"""
+
+import base64
+import binascii
+import json
+
+from backend.error_responses import InvalidCursorError
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(**fields) -> str:
+    """
+    Encodes the given keyset fields as an opaque, url-safe cursor string
+    """
+    raw = json.dumps(fields, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Decodes a cursor produced by encode_cursor back into its keyset fields
+    Raises InvalidCursorError if the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        fields = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise InvalidCursorError()
+    if not isinstance(fields, dict):
+        raise InvalidCursorError()
+    return fields
+
+
+def decode_id_cursor(cursor: str) -> int:
+    """
+    Decodes a cursor that pages by primary key, returning the last id already seen
+    """
+    try:
+        return int(decode_cursor(cursor)["i"])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidCursorError()
+
+
+def decode_offset_cursor(cursor: str, max_offset: int | None = None) -> int:
+    """
+    Decodes a cursor that pages by position, used where results have no stable keyset (e.g. ranked search)
+    An offset past max_offset is rejected, every page up to it has to be scanned again
+    """
+    try:
+        offset = int(decode_cursor(cursor)["o"])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidCursorError()
+    if offset < 0 or (max_offset is not None and offset > max_offset):
+        raise InvalidCursorError()
+    return offset
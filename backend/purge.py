@@ -0,0 +1,119 @@
+"""Background purge of deleted chats.
+
+DELETE /chats/{chat_id} only tombstones the chat (chats.deleted_at), which hides it from
+every read at once. The ChatPurger's worker thread then deletes the chat's messages in
+batches of PURGE_BATCH_SIZE, each in its own short transaction, pausing between batches so
+other writers are not locked out of SQLite for the length of the whole delete. Once no
+messages remain the chat row is deleted and its memberships and stats cascade with it.
+
+Tombstones live in the database, so a purge interrupted by a restart is picked up again by
+resume() on startup. Progress is the chat's remaining message count in chat_stats.
+
+Args:
+    PURGE_BATCH_SIZE (int): Messages deleted per transaction
+    PURGE_PAUSE_SECONDS (float): Pause between batches
+    chat_purger (ChatPurger): The process wide purger routes schedule deleted chats on
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import Engine
+from sqlmodel import Session
+
+from backend.database import chats as chats_db
+
+
+PURGE_BATCH_SIZE = int(os.getenv("CHAT_PURGE_BATCH_SIZE", "1000"))
+PURGE_PAUSE_SECONDS = float(os.getenv("CHAT_PURGE_PAUSE_SECONDS", "0.01"))
+
+logger = logging.getLogger(__name__)
+
+
+def purge_chat(engine: Engine, chat_id: int, batch_size: int = PURGE_BATCH_SIZE, pause: float = PURGE_PAUSE_SECONDS) -> int:
+    """
+    Deletes a tombstoned chat's messages batch by batch, then the chat itself
+    Returns the number of messages deleted
+    """
+    purged = 0
+    with Session(engine) as session:
+        if chats_db.get_deleted_chat(session, chat_id) is None:
+            return 0
+        while deleted := chats_db.purge_chat_messages(session, chat_id, batch_size):
+            purged += deleted
+            time.sleep(pause)
+        chats_db.delete_chat(session, chat_id)
+    return purged
+
+
+class ChatPurger:
+    """Single worker thread purging scheduled chats one at a time, in scheduling order."""
+
+    def __init__(self, batch_size: int = PURGE_BATCH_SIZE, pause: float = PURGE_PAUSE_SECONDS):
+        self.batch_size = batch_size
+        self.pause = pause
+        self._queue: deque[tuple[Engine, int]] = deque()
+        self._scheduled: set[int] = set()
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._worker: threading.Thread | None = None
+
+    def schedule(self, engine: Engine, chat_id: int) -> None:
+        """
+        Queues the tombstoned chat for purging, a chat already queued is not queued twice
+        """
+        with self._lock:
+            if chat_id in self._scheduled:
+                return
+            self._scheduled.add(chat_id)
+            self._queue.append((engine, chat_id))
+            self._idle.clear()
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="chat-purger", daemon=True)
+                self._worker.start()
+
+    def resume(self, engine: Engine) -> list[int]:
+        """
+        Schedules every chat left tombstoned by an earlier process, returns their ids
+        """
+        with Session(engine) as session:
+            chat_ids = chats_db.get_deleted_chat_ids(session)
+        for chat_id in chat_ids:
+            self.schedule(engine, chat_id)
+        return chat_ids
+
+    def pending(self) -> int:
+        """
+        Returns the number of chats queued or being purged
+        """
+        return len(self._scheduled)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Blocks until every scheduled chat is purged, returns False on timeout
+        """
+        return self._idle.wait(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._worker = None
+                    self._idle.set()
+                    return
+                engine, chat_id = self._queue.popleft()
+            try:
+                purge_chat(engine, chat_id, self.batch_size, self.pause)
+            except Exception:
+                # The tombstone stays, the next resume() retries the chat
+                logger.exception("Purging chat %s failed", chat_id)
+            finally:
+                with self._lock:
+                    self._scheduled.discard(chat_id)
+
+
+chat_purger = ChatPurger()
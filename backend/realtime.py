@@ -0,0 +1,332 @@
+"""Live delivery of chat events to connected clients.
+
+Routes publish message events after they commit. Every connected client owns a
+Subscription with a bounded send queue; a client that lets its queue fill up is
+disconnected instead of buffering without limit. Subscriptions of an account that
+leaves a chat, and of a deleted chat, are revoked by the writers after they commit.
+
+Args:
+    SEND_QUEUE_SIZE (int): Events buffered per connection before it is dropped as a slow consumer
+    SLOW_CONSUMER_CLOSE_CODE (int): Websocket close code sent to a slow consumer
+    REVOKED_CLOSE_CODE (int): Websocket close code sent once the account may no longer see the chat
+    SSE_HEARTBEAT_SECONDS (float): Idle seconds before an event stream sends a keep-alive comment
+    SSE_IDLE_TIMEOUT_SECONDS (float): Seconds without events before an event stream is closed
+    SSE_REPLAY_LIMIT (int): Most messages replayed to a reconnecting event stream
+    SSE_REORDER_SECONDS (float): How long an event stream holds back events behind a missing seq before it resets
+    chat_events (ChatEventBroker): The process wide broker routes use to publish and subscribe
+"""
+
+import asyncio
+import json
+import os
+import threading
+from typing import AsyncIterator
+
+from fastapi import WebSocket
+from fastapi.responses import StreamingResponse
+from starlette.websockets import WebSocketDisconnect
+
+from backend.database.schema import DBMessage
+from backend.models import Message
+
+
+SEND_QUEUE_SIZE = int(os.getenv("CHAT_SEND_QUEUE_SIZE", "256"))
+SLOW_CONSUMER_CLOSE_CODE = 1013
+REVOKED_CLOSE_CODE = 1008
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_IDLE_TIMEOUT_SECONDS = float(os.getenv("SSE_IDLE_TIMEOUT_SECONDS", "300"))
+SSE_REPLAY_LIMIT = int(os.getenv("SSE_REPLAY_LIMIT", "500"))
+SSE_REORDER_SECONDS = float(os.getenv("SSE_REORDER_SECONDS", "2"))
+
+MESSAGE_CREATED = "message_created"
+MESSAGE_UPDATED = "message_updated"
+MESSAGE_DELETED = "message_deleted"
+STREAM_RESET = "reset"
+
+
+def message_event(event_type: str, message: DBMessage, seq: int | None) -> dict:
+    """
+    Builds the JSON event pushed to clients for the given message
+    seq is the chat's change_seq of the write (None if the chat has no stats row), deleted messages only carry their id
+    """
+    if event_type == MESSAGE_DELETED:
+        payload = {"id": message.id}
+    else:
+        payload = Message.model_validate(message, from_attributes=True).model_dump(mode="json")
+    return {"type": event_type, "chat_id": message.chat_id, "seq": seq, "message": payload}
+
+
+def reset_event(chat_id: int, seq: int, last_message_id: int | None) -> dict:
+    """
+    Builds the event telling a client to refetch the chat's messages, up to last_message_id as of change_seq seq
+    """
+    return {"type": STREAM_RESET, "chat_id": chat_id, "seq": seq, "last_message_id": last_message_id}
+
+
+class Subscription:
+    """A single client's bounded queue of events for one chat."""
+
+    def __init__(self, chat_id: int, loop: asyncio.AbstractEventLoop, maxsize: int, account_id: int | None = None):
+        self.chat_id = chat_id
+        self.account_id = account_id
+        self.loop = loop
+        self.queue: asyncio.Queue[dict | None] = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = asyncio.Event()
+        self.revoked = asyncio.Event()
+
+    def deliver(self, event: dict) -> None:
+        """
+        Queues an event for the client, flags the subscription as overflowed if the queue is full
+        Must run on the subscription's event loop
+        """
+        if self.overflowed.is_set() or self.revoked.is_set():
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed.set()
+
+    def revoke(self) -> None:
+        """
+        Ends the subscription, the queued events are dropped and the consumer gets None
+        Must run on the subscription's event loop
+        """
+        self.revoked.set()
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def get(self) -> dict | None:
+        """
+        Waits for the next queued event, None once the subscription is revoked
+        """
+        return await self.queue.get()
+
+
+class ChatEventBroker:
+    """Routes published chat events to the subscriptions of that chat."""
+
+    def __init__(self, queue_size: int = SEND_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscriptions: dict[int, set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, chat_id: int, account_id: int | None = None) -> Subscription:
+        """
+        Registers a new subscription of the account to the given chat
+        Must be called from the event loop that will consume it
+        """
+        subscription = Subscription(chat_id, asyncio.get_running_loop(), self.queue_size, account_id)
+        with self._lock:
+            self._subscriptions.setdefault(chat_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Removes the given subscription, no-op if it was already removed
+        """
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.chat_id)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.chat_id]
+
+    def publish(self, chat_id: int, event: dict) -> None:
+        """
+        Hands the event to every subscription of the chat
+        Safe to call from the threadpool that runs sync routes
+        """
+        with self._lock:
+            subscriptions = tuple(self._subscriptions.get(chat_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's event loop has shut down
+                self.unsubscribe(subscription)
+
+    def disconnect(self, chat_id: int | None = None, account_id: int | None = None) -> int:
+        """
+        Revokes the subscriptions to the chat, or of the account, or of the account to the chat when both are given
+        Safe to call from the threadpool that runs sync routes
+        Returns the number of subscriptions revoked
+        """
+        with self._lock:
+            chat_ids = [chat_id] if chat_id is not None else list(self._subscriptions)
+            revoked = []
+            for subscribed_chat_id in chat_ids:
+                subscriptions = self._subscriptions.get(subscribed_chat_id)
+                if subscriptions is None:
+                    continue
+                matching = [subscription for subscription in subscriptions
+                            if account_id is None or subscription.account_id == account_id]
+                subscriptions.difference_update(matching)
+                if not subscriptions:
+                    del self._subscriptions[subscribed_chat_id]
+                revoked.extend(matching)
+        for subscription in revoked:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.revoke)
+            except RuntimeError:
+                pass
+        return len(revoked)
+
+    def connection_count(self) -> int:
+        """
+        Returns the number of open subscriptions across all chats
+        """
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+chat_events = ChatEventBroker()
+
+
+def publish_message_events(chat_id: int, event_type: str, messages: list[DBMessage], last_seq: int | None) -> None:
+    """
+    Publishes an event_type event for each message written by one statement, last_seq being the chat's change_seq of the last
+    """
+    first_seq = last_seq - len(messages) + 1 if last_seq is not None else None
+    for i, message in enumerate(messages):
+        chat_events.publish(chat_id, message_event(event_type, message, first_seq + i if first_seq is not None else None))
+
+
+async def forward_events(websocket: WebSocket, subscription: Subscription) -> None:
+    """
+    Sends the subscription's events to an accepted websocket until the client disconnects
+    Closes the socket with SLOW_CONSUMER_CLOSE_CODE if the client falls behind
+    and with REVOKED_CLOSE_CODE once the subscription is revoked
+    """
+    async def send_events():
+        while (event := await subscription.get()) is not None:
+            await websocket.send_json(event)
+
+    async def wait_for_disconnect():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+    sender = asyncio.create_task(send_events())
+    receiver = asyncio.create_task(wait_for_disconnect())
+    overflow = asyncio.create_task(subscription.overflowed.wait())
+    try:
+        done, _ = await asyncio.wait({sender, receiver, overflow}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (sender, receiver, overflow):
+            task.cancel()
+    for task in done:
+        # Retrieve errors from sending on a socket the client already closed
+        task.exception()
+    if subscription.revoked.is_set():
+        code, reason = REVOKED_CLOSE_CODE, "no longer a member"
+    elif overflow in done:
+        code, reason = SLOW_CONSUMER_CLOSE_CODE, "slow consumer"
+    else:
+        return
+    try:
+        await websocket.close(code=code, reason=reason)
+    except (RuntimeError, WebSocketDisconnect):
+        pass
+
+
+def format_sse(event: dict) -> str:
+    """
+    Formats an event for a text/event-stream response
+    The event's seq is its id, so Last-Event-ID names the last change of the chat the client has seen
+    """
+    lines = []
+    if event["seq"] is not None:
+        lines.append(f"id: {event['seq']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream_events(subscription: Subscription, replay: list[dict], last_event_id: int | None) -> AsyncIterator[str]:
+    """
+    Yields the replayed events (or a reset event) followed by live events of the subscription as server-sent events
+    last_event_id is the seq the client is at, live events are sent in seq order from there:
+    writers publish after they commit, so concurrent writes can be published out of order. An event behind a
+    missing seq is held back until the missing one arrives, or for SSE_REORDER_SECONDS after which the client
+    gets a reset instead. Live events with a seq up to the client's are skipped, the client has them
+    The stream ends once it has been idle for SSE_IDLE_TIMEOUT_SECONDS or the client falls behind,
+    the client then reconnects with Last-Event-ID and gets the missed messages replayed
+    It also ends when the subscription is revoked
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        for event in replay:
+            yield format_sse(event)
+        if replay:
+            last_event_id = replay[-1]["seq"]
+
+        held: dict[int, dict] = {}
+        reorder_deadline = None
+        idle_deadline = loop.time() + SSE_IDLE_TIMEOUT_SECONDS
+        while not subscription.overflowed.is_set():
+            now = loop.time()
+            if reorder_deadline is not None and now >= reorder_deadline:
+                # The missing events never arrived, the client refetches past them
+                last_event_id = max(held)
+                held.clear()
+                reorder_deadline = None
+                yield format_sse(reset_event(subscription.chat_id, last_event_id, None))
+                idle_deadline = now + SSE_IDLE_TIMEOUT_SECONDS
+                continue
+            remaining = idle_deadline - now
+            if remaining <= 0:
+                return
+            timeout = min(SSE_HEARTBEAT_SECONDS, remaining)
+            if reorder_deadline is not None:
+                timeout = min(timeout, reorder_deadline - now)
+            try:
+                event = await asyncio.wait_for(subscription.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if reorder_deadline is None or loop.time() < reorder_deadline:
+                    yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                return
+            seq = event["seq"]
+            if seq is not None and last_event_id is not None:
+                if seq <= last_event_id or seq in held:
+                    continue
+                if seq > last_event_id + 1:
+                    held[seq] = event
+                    if reorder_deadline is None:
+                        reorder_deadline = loop.time() + SSE_REORDER_SECONDS
+                    continue
+            yield format_sse(event)
+            if seq is not None:
+                last_event_id = seq
+                while last_event_id is not None and last_event_id + 1 in held:
+                    last_event_id += 1
+                    yield format_sse(held.pop(last_event_id))
+                # A gap still open further up gets its own wait
+                reorder_deadline = loop.time() + SSE_REORDER_SECONDS if held else None
+            idle_deadline = loop.time() + SSE_IDLE_TIMEOUT_SECONDS
+    finally:
+        chat_events.unsubscribe(subscription)
+
+
+class EventStreamResponse(StreamingResponse):
+    """A text/event-stream response of stream_events that releases the subscription however the response ends."""
+
+    def __init__(self, subscription: Subscription, replay: list[dict], last_event_id: int | None):
+        super().__init__(
+            stream_events(subscription, replay, last_event_id),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        self.subscription = subscription
+
+    async def __call__(self, scope, receive, send) -> None:
+        # The generator's finally only runs once it has been iterated,
+        # a client disconnecting before the first chunk never starts it
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            chat_events.unsubscribe(self.subscription)
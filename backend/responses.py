@@ -0,0 +1,61 @@
+"""Fast rendering of list responses (opt-in with FAST_JSON_RESPONSES=true, requires orjson).
+
+List routes return ORM rows under a response_model such as dict[str, dict | list[Message]].
+FastAPI validates every row into the pydantic model and serializes the result with the stdlib
+json encoder, which is most of the CPU time of a large page. The rows come straight from the
+database with the model's types already, so with fast rendering list_response reads the model's
+fields off each row through one precompiled attrgetter and renders the body with orjson,
+bypassing response_model. Only the model's fields are read, and the bytes on the wire are the
+same as without it.
+
+Args:
+    FAST_JSON_RESPONSES (bool): Whether list routes render with orjson
+"""
+
+import os
+from operator import attrgetter
+from typing import Any, Iterable
+
+from fastapi import Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # optional dependency, only needed with FAST_JSON_RESPONSES
+    orjson = None
+
+
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "false").lower() == "true"
+if FAST_JSON_RESPONSES and orjson is None:
+    raise RuntimeError("FAST_JSON_RESPONSES=true requires orjson (pip install orjson)")
+
+
+class RowSerializer:
+    """Reads the fields of a response model off ORM rows into plain dicts, in the model's field order."""
+
+    __slots__ = ("fields", "getter")
+
+    def __init__(self, model: type[BaseModel]):
+        self.fields = tuple(model.model_fields)
+        # attrgetter with one name returns the value itself rather than a tuple
+        self.getter = attrgetter(*self.fields) if len(self.fields) > 1 else (lambda row: (getattr(row, self.fields[0]),))
+
+    def __call__(self, rows: Iterable[Any]) -> list[dict[str, Any]]:
+        fields, getter = self.fields, self.getter
+        return [dict(zip(fields, getter(row))) for row in rows]
+
+
+_serializers: dict[type[BaseModel], RowSerializer] = {}
+
+
+def list_response(metadata: dict[str, Any], key: str, rows: list[Any], model: type[BaseModel]) -> dict[str, Any] | Response:
+    """
+    Returns the {"metadata": metadata, key: rows} body of a list route
+    With FAST_JSON_RESPONSES it is already rendered by orjson, the rows are read as model without validation
+    """
+    if not FAST_JSON_RESPONSES:
+        return {"metadata": metadata, key: rows}
+    serializer = _serializers.get(model)
+    if serializer is None:
+        serializer = _serializers[model] = RowSerializer(model)
+    return Response(orjson.dumps({"metadata": metadata, key: serializer(rows)}), media_type="application/json")
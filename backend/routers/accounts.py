@@ -1,14 +1,21 @@
+from datetime import datetime
 from typing import Annotated
-from fastapi import APIRouter, Depends, Form
+from fastapi import APIRouter, Depends, Form, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from backend.database.auth import email_exists, username_exists
-from backend.models import Account
+from backend.models import Account, InboxChat
 from backend.database.schema import DBAccount
 from backend.database import accounts as accounts_db
+from backend.database import chats as chats_db
+from backend.database import chatmembership as chatmembership_db
 from backend.dependencies import DBSession
+from backend.error_responses import InvalidCursorError
+from backend.responses import list_response
+from backend.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, decode_id_cursor, encode_cursor
 from backend.routers.auth import RegisteredAccount
-from backend.security import extract_user, hash_password, update_account_details, verify_password
+from backend.security import extract_user, hash_password_async, update_account_details, verify_password_async
 from backend.database.accounts import delete_account, update_password
 
 class UpdateAccountDetails(BaseModel):
@@ -26,19 +33,22 @@ class AccountResponse(BaseModel):
 
 router = APIRouter(prefix="/accounts", tags=["Accounts"])
 
-@router.get("/", response_model=dict[str, dict[str, int] | list[Account]])
-def get_accounts(session: DBSession) -> dict[str, dict[str, int] | list[DBAccount]]:
+@router.get("/", response_model=dict[str, dict[str, int | str | None] | list[Account]])
+def get_accounts(session: DBSession,
+                 limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                 cursor: str | None = None,
+                 include_count: bool = False) -> dict[str, dict[str, int | str | None] | list[DBAccount]]:
     '''
-    Returns JSON object of all accounts
+    Returns JSON object of a page of accounts ordered by id
+    metadata.next_cursor fetches the following page and is null on the last page
+    metadata.count (total number of accounts) is only included when include_count is true
     '''
-    accounts: list[DBAccount] = accounts_db.get_all(session)
-    count: int = len(accounts)
-    return {
-        "metadata": {
-            "count": count
-        },
-        "accounts": accounts
-    }
+    after_id = decode_id_cursor(cursor) if cursor is not None else None
+    accounts, has_more = accounts_db.get_accounts_page(session, limit=limit, after_id=after_id)
+    metadata = {"next_cursor": encode_cursor(i=accounts[-1].id) if has_more else None}
+    if include_count:
+        metadata["count"] = accounts_db.count_accounts(session)
+    return list_response(metadata, "accounts", accounts, Account)
 
 
 @router.get("/me", status_code=200)
@@ -54,6 +64,69 @@ def get_account_data(session: DBSession, current_user: DBAccount = Depends(extra
       return RegisteredAccount(**(accounts_db.get_by_account_id(session=session, account_id=current_user.id).model_dump()))
 
 
+@router.get("/me/chats", response_model=dict[str, dict[str, int | str | None] | list[InboxChat]])
+def get_account_chats(session: DBSession,
+                      limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                      cursor: str | None = None,
+                      current_user: DBAccount = Depends(extract_user)) -> dict[str, dict[str, int | str | None] | list[dict]]:
+      """
+      Authenticated route
+      Returns a page of the chats the account is a member of, most recent activity first
+      Each chat carries its last message, message count and last activity time (null if it has no messages)
+      metadata.next_cursor fetches the following page and is null on the last page
+        Errors: 
+            An access token is not provided -> 403
+            Access token is expired -> 403
+            Access token is invalid -> 403
+            Malformed cursor -> 422
+      """
+      before = decode_inbox_cursor(cursor) if cursor is not None else None
+      page, has_more = chats_db.get_inbox_page(session, account_id=current_user.id, limit=limit, before=before)
+      chats = [{**chat.model_dump(),
+                "message_count": message_count,
+                "last_message": last_message,
+                "last_activity": last_message.created_at if last_message is not None else None}
+               for chat, last_message, message_count in page]
+      next_cursor = None
+      if has_more:
+            last_activity = chats[-1]["last_activity"]
+            next_cursor = encode_cursor(t=last_activity.isoformat() if last_activity else None, i=chats[-1]["id"])
+      return {
+          "metadata": {"count": len(chats), "next_cursor": next_cursor},
+          "chats": chats
+      }
+
+
+@router.get("/me/unread", response_model=dict[str, dict[str, int] | list[dict[str, int | None]]])
+def get_unread_counts(session: DBSession, current_user: DBAccount = Depends(extract_user)) -> dict[str, dict[str, int] | list[dict[str, int | None]]]:
+      """
+      Authenticated route
+      Returns the read marker and unread message count of every chat the account is a member of, plus the total
+        Errors: 
+            An access token is not provided -> 403
+            Access token is expired -> 403
+            Access token is invalid -> 403
+      """
+      chats = [{"chat_id": chat_id, "last_read_message_id": last_read_message_id, "unread_count": unread_count}
+               for chat_id, last_read_message_id, unread_count in chatmembership_db.get_unread_counts(session, account_id=current_user.id)]
+      return {
+          "metadata": {"count": len(chats), "total": sum(chat["unread_count"] for chat in chats)},
+          "chats": chats
+      }
+
+
+def decode_inbox_cursor(cursor: str) -> tuple[datetime, int]:
+      """
+      Returns the (last activity, chat id) keyset encoded in an inbox cursor
+      """
+      fields = decode_cursor(cursor)
+      try:
+            activity = datetime.fromisoformat(fields["t"]) if fields["t"] is not None else chats_db.NO_ACTIVITY
+            return activity, int(fields["i"])
+      except (KeyError, TypeError, ValueError):
+            raise InvalidCursorError()
+
+
 @router.put("/me", status_code=200)
 def update_account(session: DBSession, update_details: UpdateAccountDetails, current_user: DBAccount = Depends(extract_user)):
      """
@@ -92,7 +165,7 @@ def update_account(session: DBSession, update_details: UpdateAccountDetails, cur
 
 
 @router.put("/me/password", status_code=204)
-def router_update_password(session: DBSession, password_details: Annotated[UpdatePassword, Form()], 
+async def router_update_password(session: DBSession, password_details: Annotated[UpdatePassword, Form()], 
                     current_user: DBAccount = Depends(extract_user)) -> None:
      """
      Authenticated route
@@ -105,10 +178,13 @@ def router_update_password(session: DBSession, password_details: Annotated[Updat
     Success: 
         Password is updated -> 204
      """
+     # A cached principal carries no hash, read it on the threadpool rather than lazy-loading it on the event loop
+     hashed_password = await run_in_threadpool(accounts_db.get_hashed_password, session, current_user.id)
      # Verify old password matches accounts hashed_password
-     if verify_password(password=password_details.old_password, hashed_password=current_user.hashed_password):
+     if await verify_password_async(password=password_details.old_password, hashed_password=hashed_password):
           # Success
-        update_password(session=session, account=current_user, hashed_password=hash_password(password_details.new_password))
+        hashed_password = await hash_password_async(password_details.new_password)
+        await run_in_threadpool(update_password, session=session, account=current_user, hashed_password=hashed_password)
      else:
           return JSONResponse(
                 status_code=401,
@@ -0,0 +1,28 @@
+"""Async-native versions of the hot account routes.
+
+Mounted ahead of backend.routers.accounts when ASYNC_DATABASE is enabled; responses match the sync routes of the same path.
+"""
+from fastapi import APIRouter, Query
+from backend.models import Account
+from backend.database.schema import DBAccount
+from backend.database.aio import accounts as accounts_db
+from backend.dependencies import AsyncDBSession
+from backend.responses import list_response
+from backend.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_id_cursor, encode_cursor
+
+router = APIRouter(prefix="/accounts", tags=["Accounts"])
+
+@router.get("/", response_model=dict[str, dict[str, int | str | None] | list[Account]])
+async def get_accounts_async(session: AsyncDBSession,
+                             limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                             cursor: str | None = None,
+                             include_count: bool = False) -> dict[str, dict[str, int | str | None] | list[DBAccount]]:
+    '''
+    Returns JSON object of a page of accounts ordered by id
+    '''
+    after_id = decode_id_cursor(cursor) if cursor is not None else None
+    accounts, has_more = await accounts_db.get_accounts_page(session, limit=limit, after_id=after_id)
+    metadata = {"next_cursor": encode_cursor(i=accounts[-1].id) if has_more else None}
+    if include_count:
+        metadata["count"] = await accounts_db.count_accounts(session)
+    return list_response(metadata, "accounts", accounts, Account)
@@ -0,0 +1,144 @@
+"""Async-native versions of the hot chat routes.
+
+Mounted ahead of backend.routers.chats when ASYNC_DATABASE is enabled; responses match the sync routes of the same path.
+"""
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import JSONResponse
+from backend.database.schema import DBChat, DBAccount, DBMessage
+from backend.models import Chat
+from backend.models import Message
+from backend.database.aio import chats as chats_db
+from backend.database.aio import messages as messages_db
+from backend.database.aio import chatmembership as chatmembership_db
+from backend.database.aio import stats as stats_db
+from backend.database.messages import MessageRequest
+from backend.dependencies import AsyncDBSession
+from backend.error_responses import InvalidCursorError
+from backend.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_id_cursor, encode_cursor
+from backend.responses import list_response
+from backend.realtime import MESSAGE_CREATED, chat_events, message_event
+from backend.routers.chats import decode_message_cursor, message_page_response
+from backend.security import extract_user_async
+
+router = APIRouter(prefix="/chats", tags=["Chats"])
+
+@router.get("/", response_model=dict[str, dict[str, int | str | None] | list[Chat]])
+async def chats_async(session: AsyncDBSession,
+                      limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                      cursor: str | None = None,
+                      include_count: bool = False) -> dict[str, dict[str, int | str | None] | list[DBChat]]:
+      """
+      Returns JSON object of a page of chats ordered by id
+      """
+      after_id = decode_id_cursor(cursor) if cursor is not None else None
+      chats, has_more = await chats_db.get_chats_page(session, limit=limit, after_id=after_id)
+      metadata = {"next_cursor": encode_cursor(i=chats[-1].id) if has_more else None}
+      if include_count:
+           metadata["count"] = await chats_db.count_chats(session)
+      return list_response(metadata, "chats", chats, Chat)
+
+
+@router.get("/{chat_id}", response_model=Chat)
+async def chat_id_async(session: AsyncDBSession, chat_id: int) -> DBChat:
+    """
+    Returns JSON object of the chat corrosponding with given id
+    """
+    chat: DBChat = await chats_db.get_chat_by_id(session, chat_id)
+    if not chat: 
+        return JSONResponse(
+            status_code=404,
+            content={
+                "error": "entity_not_found",
+                "message": f"Unable to find chat with id={chat_id}"
+            }
+        )
+    return chat
+
+
+@router.get("/{chat_id}/messages", response_model=dict[str, dict[str, int | str | None] | list[Message]])
+async def chat_messages_async(session: AsyncDBSession, chat_id: int,
+                              limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                              before_id: int | None = None,
+                              after_id: int | None = None,
+                              cursor: str | None = None,
+                              include_total: bool = False) -> dict[str, dict[str, int | str | None] | list[DBMessage]]:
+    '''
+    Returns a page of messages associated with chat given chat_id, ordered by (created_at, id)
+    See backend.routers.chats.chat_messages
+    '''
+    chat: DBChat = await chats_db.get_chat_by_id(session, chat_id)
+    if chat is None: 
+         return JSONResponse(
+            status_code=404,
+            content={
+                "error": "entity_not_found",
+                "message": f"Unable to find chat with id={chat_id}"
+            }
+        )
+    if sum(value is not None for value in (before_id, after_id, cursor)) > 1:
+         raise InvalidCursorError()
+
+    direction, keyset = "before", None
+    if cursor is not None:
+         direction, keyset = decode_message_cursor(cursor)
+    elif before_id is not None or after_id is not None:
+         anchor_id = before_id if before_id is not None else after_id
+         anchor = await messages_db.get_message_by_id(session=session, message_id=anchor_id)
+         if anchor is None or anchor.chat_id != chat_id:
+              return JSONResponse(
+                   status_code=404,
+                   content={
+                        "error": "entity_not_found",
+                        "message": f"Unable to find message with id={anchor_id}"
+                   })
+         direction = "before" if before_id is not None else "after"
+         keyset = (anchor.created_at, anchor.id)
+
+    messages, has_more = await messages_db.get_messages_page(
+         session=session,
+         chat_id=chat_id,
+         limit=limit,
+         before=keyset if direction == "before" else None,
+         after=keyset if direction == "after" else None,
+    )
+    total = (await stats_db.get_chat_stats(session=session, chat_id=chat_id)).message_count if include_total else None
+    return message_page_response(messages, has_more, direction, total=total)
+
+
+@router.post("/{chat_id}/messages", response_model=Message, status_code=201)
+async def post_message_async(session: AsyncDBSession, chat_id: int, message_request: MessageRequest, 
+                             owner_account: DBAccount = Depends(extract_user_async)) -> DBMessage:
+    """
+    Authenticated route
+    Creates a new message in the database belonging to the specified chat
+    See backend.routers.chats.post_message
+    """
+    chat = await chats_db.get_chat_by_id(session=session, chat_id=chat_id)
+    if chat == None:
+         return JSONResponse(
+              status_code=404,
+              content={
+                   "error": "entity_not_found",
+                   "message": f"Unable to find chat with id={chat_id}"
+                   })
+    
+    if owner_account == None or not await chatmembership_db.is_account_chat_member(session=session, account_id=message_request.account_id, chat=chat):
+         return JSONResponse(
+                status_code=422,
+                content={
+                    "error": "chat_membership_required",
+                    "message": f"Account with id={message_request.account_id} must be a member of chat with id={chat_id}"
+            })
+    
+    if message_request.account_id != owner_account.id:
+         return JSONResponse(
+                status_code=403,
+                content={
+                    "error": "access_denied",
+                    "message": "Cannot create message on behalf of different account"
+            })
+
+    message = DBMessage(text=message_request.text, account_id=message_request.account_id, chat_id=chat_id)
+    seq = await messages_db.create_message(session=session, message=message)
+    chat_events.publish(chat_id, message_event(MESSAGE_CREATED, message, seq))
+    return message
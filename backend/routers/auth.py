@@ -1,12 +1,13 @@
 
 from typing import Annotated
 from fastapi import APIRouter, Depends, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from fastapi import Response
 from backend.database.schema import DBAccount
 from backend.dependencies import DBSession
-from backend.security import generate_token, get_cookie_key, extract_user, remove_token
+from backend.security import generate_token, get_cookie_key, extract_user, hash_password_async, remove_token
 from backend.database.auth import create_account, email_exists, username_exists, verify_user
 
 from dotenv import load_dotenv
@@ -35,7 +36,7 @@ class ResponseToken(BaseModel):
 
 
 @router.post("/registration", status_code=201, response_model=RegisteredAccount)
-def register(session: DBSession, registration: Annotated[Registration, Form()]) -> RegisteredAccount:
+async def register(session: DBSession, registration: Annotated[Registration, Form()]) -> RegisteredAccount:
       """
       Registers a new account in the database with their hashed_password
       Error responses
@@ -44,16 +45,17 @@ def register(session: DBSession, registration: Annotated[Registration, Form()])
 
       Successful response -> 201 (Created)
       Body is an account JSON object with three keys: id, username, and email
+      Async so the request doesn't hold a threadpool thread while the password is hashed
       """
       # Can't register account if identical usernames or email exists
-      if username_exists(session=session, username=registration.username):
+      if await run_in_threadpool(username_exists, session=session, username=registration.username):
             return JSONResponse(
                   status_code=422,
                   content={
                         "error": "duplicate_entity_value",
                         "message": f"Duplicate value: account with username={registration.username} already exists"
                         })
-      if email_exists(session=session, email=registration.email):
+      if await run_in_threadpool(email_exists, session=session, email=registration.email):
             return JSONResponse(
                   status_code=422,
                   content={
@@ -61,11 +63,13 @@ def register(session: DBSession, registration: Annotated[Registration, Form()])
                         "message": f"Duplicate value: account with email={registration.email} already exists"
                         })
       # Successful response
-      new_acc = create_account(
+      hashed_password = await hash_password_async(registration.password)
+      new_acc = await run_in_threadpool(
+            create_account,
             session,
             registration.username,
             registration.email,
-            registration.password,
+            hashed_password,
             )
       
       return RegisteredAccount(id=new_acc.id, username=registration.username, email=registration.email)
@@ -73,7 +77,7 @@ def register(session: DBSession, registration: Annotated[Registration, Form()])
 
 
 @router.post("/token", status_code=200, response_model=ResponseToken)
-def token(session: DBSession, 
+async def token(session: DBSession, 
           username: str = Form(),
           password: str = Form()) -> ResponseToken:
       """
@@ -85,8 +89,8 @@ def token(session: DBSession,
       """
       
       # Success
-      if verify_user(session=session, username=username, password=password):
-            token = generate_token(session=session, username=username)
+      if await verify_user(session=session, username=username, password=password):
+            token = await run_in_threadpool(generate_token, session=session, username=username)
             return ResponseToken(access_token=token)
       else:
             return JSONResponse(
@@ -98,7 +102,7 @@ def token(session: DBSession,
 
 
 @router.post("/web/login", status_code=204, response_model=None)
-def store_web_token(session: DBSession, 
+async def store_web_token(session: DBSession, 
                     response: Response,
                     username: str = Form(),
                     password: str = Form(), 
@@ -111,8 +115,9 @@ def store_web_token(session: DBSession,
       Success: 
             204 No Content
       """
-      if verify_user(session=session, username=username, password=password):
-            response.set_cookie(get_cookie_key(), generate_token(session=session, username=username), httponly=SECURE_COOKIE)
+      if await verify_user(session=session, username=username, password=password):
+            token = await run_in_threadpool(generate_token, session=session, username=username)
+            response.set_cookie(get_cookie_key(), token, httponly=SECURE_COOKIE)
 
       else:
             return JSONResponse(
@@ -1,33 +1,54 @@
-from fastapi import APIRouter, Depends
-from fastapi.responses import JSONResponse
-from backend.database.schema import DBChat, DBAccount, DBChatMembership, DBMessage
-from backend.models import Chat
+import json
+import zlib
+from datetime import datetime
+from typing import Iterator
+from fastapi import APIRouter, Depends, Header, Query, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import Engine
+from sqlmodel import Session
+from backend.database.schema import DBChat, DBAccount, DBChatMembership, DBChatStats, DBMessage
+from backend.models import Chat, ChatStats
 from backend.models import Account
-from backend.models import Message
+from backend.models import Message, MessageSearchResult
 from backend.database import chats as chats_db
 from backend.database.chats import UpdateChatRequest, get_same_chat_name, unique_chat_name
 from backend.database.chats import CreateChatRequest
 from backend.database import messages as messages_db
-from backend.database.messages import MessageRequest, UpdateMessageRequest
+from backend.database.messages import MessageBatchDeleteRequest, MessageBatchRequest, MessageBatchUpdateRequest, MessageRequest, UpdateMessageRequest
 from backend.database import accounts as accounts_db
 from backend.database.accounts import AccountRequest
 from backend.database import chatmembership as chatmembership_db
+from backend.database import stats as stats_db
+from backend.database.chatmembership import BulkMembershipRequest, ReadMarkerRequest
 from backend.dependencies import DBSession
-from backend.security import extract_user
+from backend.error_responses import ExpiredAccessToken, InvalidAccessToken, InvalidCursorError, TokenNotProvidedError
+from backend.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, decode_id_cursor, decode_offset_cursor, encode_cursor
+from backend import realtime
+from backend.responses import list_response
+from backend.purge import chat_purger
+from backend.realtime import MESSAGE_CREATED, MESSAGE_DELETED, MESSAGE_UPDATED, chat_events, forward_events, message_event, publish_message_events
+from backend.security import authenticate_token, extract_user, get_websocket_token
 
 router = APIRouter(prefix="/chats", tags=["Chats"])
 
-@router.get("/", response_model=dict[str, dict[str, int] | list[Chat]])
-def chats(session: DBSession) -> dict[str, dict[str, int] | list[DBChat]]:
+@router.get("/", response_model=dict[str, dict[str, int | str | None] | list[Chat]])
+def chats(session: DBSession,
+          limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+          cursor: str | None = None,
+          include_count: bool = False) -> dict[str, dict[str, int | str | None] | list[DBChat]]:
       """
-      Returns JSON object of all chats as well as the count
+      Returns JSON object of a page of chats ordered by id
+      metadata.next_cursor fetches the following page and is null on the last page
+      metadata.count (total number of chats) is only included when include_count is true
       """
-      chats: list[DBChat] = chats_db.get_chats(session)
-      count: int = len(chats)
+      after_id = decode_id_cursor(cursor) if cursor is not None else None
+      chats, has_more = chats_db.get_chats_page(session, limit=limit, after_id=after_id)
+      metadata = {"next_cursor": encode_cursor(i=chats[-1].id) if has_more else None}
+      if include_count:
+           metadata["count"] = chats_db.count_chats(session)
     
-      return {"metadata": {
-           "count": count},
-           "chats": chats}
+      return list_response(metadata, "chats", chats, Chat)
 
 
 @router.get("/{chat_id}", response_model=Chat)
@@ -47,14 +68,42 @@ def chat_id(session: DBSession, chat_id: int) -> DBChat:
     return chat
 
 
-@router.get("/{chat_id}/messages", response_model=dict[str, dict[str, int] | list[Message]])
-def chat_messages(session: DBSession, chat_id: int) -> dict[str, dict[str, int] | list[DBMessage]]:
+@router.get("/{chat_id}/stats", response_model=ChatStats)
+def chat_stats(session: DBSession, chat_id: int) -> DBChatStats:
+    """
+    Returns the message count, member count and last message of the chat, read from chat_stats
+    """
+    stats = stats_db.get_chat_stats(session=session, chat_id=chat_id)
+    if stats is None:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "error": "entity_not_found",
+                "message": f"Unable to find chat with id={chat_id}"
+            }
+        )
+    return stats
+
+
+@router.get("/{chat_id}/messages", response_model=dict[str, dict[str, int | str | None] | list[Message]])
+def chat_messages(session: DBSession, chat_id: int,
+                  limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                  before_id: int | None = None,
+                  after_id: int | None = None,
+                  cursor: str | None = None,
+                  include_total: bool = False) -> dict[str, dict[str, int | str | None] | list[DBMessage]]:
     '''
-    Returns messages associated with chat given chat_id
+    Returns a page of messages associated with chat given chat_id, ordered by (created_at, id)
+    Without before_id, after_id or cursor the most recent messages are returned
+    metadata.next_cursor continues paging in the same direction and is null once no messages remain
+    include_total adds metadata.total, the chat's message count from chat_stats
+    Errors: 
+        Chat_id does not correspond to a chat in the database -> 404
+        before_id/after_id does not correspond to a message in the chat -> 404
+        Malformed cursor or more than one of before_id, after_id and cursor -> 422
     '''
-    messages: list[DBMessage] = messages_db.get_messages(session, chat_id)
-    count: int = len(messages)
-    if not messages: 
+    chat: DBChat = chats_db.get_chat_by_id(session, chat_id)
+    if chat is None: 
          return JSONResponse(
             status_code=404,
             content={
@@ -62,21 +111,182 @@ def chat_messages(session: DBSession, chat_id: int) -> dict[str, dict[str, int]
                 "message": f"Unable to find chat with id={chat_id}"
             }
         )
+    if sum(value is not None for value in (before_id, after_id, cursor)) > 1:
+         raise InvalidCursorError()
+
+    # Resolve the keyset (created_at, id) the page starts from
+    direction, keyset = "before", None
+    if cursor is not None:
+         direction, keyset = decode_message_cursor(cursor)
+    elif before_id is not None or after_id is not None:
+         anchor_id = before_id if before_id is not None else after_id
+         anchor = messages_db.get_message_by_id(session=session, message_id=anchor_id)
+         if anchor is None or anchor.chat_id != chat_id:
+              return JSONResponse(
+                   status_code=404,
+                   content={
+                        "error": "entity_not_found",
+                        "message": f"Unable to find message with id={anchor_id}"
+                   })
+         direction = "before" if before_id is not None else "after"
+         keyset = (anchor.created_at, anchor.id)
+
+    messages, has_more = messages_db.get_messages_page(
+         session=session,
+         chat_id=chat_id,
+         limit=limit,
+         before=keyset if direction == "before" else None,
+         after=keyset if direction == "after" else None,
+    )
+    total = stats_db.get_chat_stats(session=session, chat_id=chat_id).message_count if include_total else None
+    return message_page_response(messages, has_more, direction, total=total)
+
+
+def message_page_response(messages: list[DBMessage], has_more: bool, direction: str,
+                          total: int | None = None) -> dict[str, dict[str, int | str | None] | list[DBMessage]]:
+    """
+    Builds the response body of a page of messages, next_cursor continues in the page's direction
+    total is added to the metadata when given
+    """
+    next_cursor = None
+    if has_more:
+         edge = messages[0] if direction == "before" else messages[-1]
+         next_cursor = encode_cursor(d=direction, t=edge.created_at.isoformat(), i=edge.id)
+    metadata = {
+         "count": len(messages),
+         "next_cursor": next_cursor
+    }
+    if total is not None:
+         metadata["total"] = total
+    return list_response(metadata, "messages", messages, Message)
+
+
+def decode_message_cursor(cursor: str) -> tuple[str, tuple[datetime, int]]:
+    """
+    Returns the direction and (created_at, id) keyset encoded in a message cursor
+    """
+    fields = decode_cursor(cursor)
+    try:
+         direction = fields["d"]
+         keyset = (datetime.fromisoformat(fields["t"]), int(fields["i"]))
+    except (KeyError, TypeError, ValueError):
+         raise InvalidCursorError()
+    if direction not in ("before", "after"):
+         raise InvalidCursorError()
+    return direction, keyset
+
+@router.get("/{chat_id}/messages/search", response_model=dict[str, dict[str, int | str | None] | list[MessageSearchResult]])
+def search_chat_messages(session: DBSession, chat_id: int,
+                         q: str = Query(min_length=1, max_length=256),
+                         limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                         cursor: str | None = None) -> dict[str, dict[str, int | str | None] | list[dict]]:
+    '''
+    Returns messages of the chat matching every term of q, best match first
+    Each message carries a highlight: its HTML-escaped text with the matched terms wrapped in <mark></mark>
+    A term ending in * matches as a prefix
+    metadata.next_cursor fetches the next page of results and is null on the last page
+    Results stop after the first MAX_SEARCH_RESULTS, a narrower q finds the ones past them
+    Errors:
+        Chat_id does not correspond to a chat in the database -> 404
+        Malformed cursor or one past MAX_SEARCH_RESULTS -> 422
+    '''
+    offset = decode_offset_cursor(cursor, max_offset=messages_db.MAX_SEARCH_RESULTS - 1) if cursor is not None else 0
+    limit = min(limit, messages_db.MAX_SEARCH_RESULTS - offset)
+    chat: DBChat = chats_db.get_chat_by_id(session, chat_id)
+    if chat is None:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "error": "entity_not_found",
+                "message": f"Unable to find chat with id={chat_id}"
+            }
+        )
+    results, has_more = messages_db.search_messages(session, chat_id=chat_id, query=q, limit=limit, offset=offset)
     return {
-         "metadata": { 
-              "count": count
+         "metadata": {
+              "count": len(results),
+              "next_cursor": encode_cursor(o=offset + len(results))
+                             if has_more and offset + len(results) < messages_db.MAX_SEARCH_RESULTS else None
          },
-         "messages": messages
+         "messages": [{**message.model_dump(), "highlight": highlight} for message, highlight in results]
     }
 
+
+@router.get("/{chat_id}/messages/export", response_model=None)
+def export_chat_messages(session: DBSession, chat_id: int, compress: bool = False,
+                         current_user: DBAccount = Depends(extract_user)):
+    """
+    Authenticated route
+    Streams every message of the chat as NDJSON (one JSON message per line), ordered by (created_at, id)
+    compress gzips the stream on the fly and sends it as chat-{chat_id}-messages.ndjson.gz
+    Messages are read in batches through a server-side cursor and written as they are read,
+    so memory stays flat whatever the size of the chat and the first batch is sent right away
+    Errors:
+        An access token is not provided -> 403
+        Access token is expired -> 403
+        Access token is invalid -> 403
+        Chat_id does not correspond to a chat in the database -> 404
+        Authenticated account is not a member of the chat -> 422
+    """
+    chat = chats_db.get_chat_by_id(session, chat_id)
+    if chat is None:
+         return JSONResponse(
+              status_code=404,
+              content={
+                   "error": "entity_not_found",
+                   "message": f"Unable to find chat with id={chat_id}"
+                   })
+    if not chatmembership_db.is_account_chat_member(session=session, account_id=current_user.id, chat=chat):
+         return JSONResponse(
+                status_code=422,
+                content={
+                    "error": "chat_membership_required",
+                    "message": f"Account with id={current_user.id} must be a member of chat with id={chat_id}"
+            })
+
+    # The stream outlives the request's session, it reads through its own
+    engine = session.get_bind()
+    session.close()
+    lines = export_lines(engine, chat_id)
+    filename = f"chat-{chat_id}-messages.ndjson"
+    if compress:
+         return StreamingResponse(gzip_stream(lines), media_type="application/gzip",
+                                  headers={"Content-Disposition": f'attachment; filename="{filename}.gz"'})
+    return StreamingResponse(lines, media_type="application/x-ndjson",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+def export_lines(engine: Engine, chat_id: int) -> Iterator[bytes]:
+    """
+    Yields the chat's messages as NDJSON, one chunk of lines per batch read from the database
+    """
+    with Session(engine) as session:
+         for batch in messages_db.iter_message_batches(session, chat_id=chat_id):
+              yield "".join(
+                   json.dumps({"id": row.id, "text": row.text, "account_id": row.account_id, "chat_id": row.chat_id,
+                               "created_at": row.created_at.isoformat() if row.created_at is not None else None}) + "\n"
+                   for row in batch
+              ).encode()
+
+
+def gzip_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """
+    Gzips chunks on the fly, each chunk is flushed so the client receives it without waiting for the next
+    """
+    compressor = zlib.compressobj(wbits=31)  # 31 -> gzip header and trailer
+    for chunk in chunks:
+         yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
 @router.get("/{chat_id}/accounts", response_model=dict[str, dict[str, int] | list[Account]])
 def account_of_chat_id(session: DBSession, chat_id: int) -> dict[str, dict[str, int] | list[DBAccount]]:
     '''
     Returns
       JSON object of all accounts associated with a chat given its chat_id
+      The count is the chat's stored member_count
     '''
     accounts: list[DBAccount] = accounts_db.get_chat_accounts(session, chat_id)
-    count: int = len(accounts)
     if not accounts: 
         return JSONResponse(
             status_code=404,
@@ -85,12 +295,10 @@ def account_of_chat_id(session: DBSession, chat_id: int) -> dict[str, dict[str,
                 "message": f"Unable to find chat with id={chat_id}"
             }
         )
-    return {
-         "metadata": { 
-              "count": count
-         },
-         "accounts": accounts
-    }
+    stats = stats_db.get_chat_stats(session=session, chat_id=chat_id)
+    # Memberships of a chat row that doesn't exist have no stats to read
+    count: int = stats.member_count if stats is not None else len(accounts)
+    return list_response({"count": count}, "accounts", accounts, Account)
 
 
 @router.post("/", response_model=Chat, status_code=201)
@@ -163,6 +371,8 @@ def delete_chat_by_id(session: DBSession, chat_id: int) -> None:
     """
     Deletes specified chat from database therefore deleting the chat messages within the chat as well as the chat memberships 
     (due to ondelete=CASCADE)
+    The chat is tombstoned and disappears from reads at once, its messages are purged in batches in the background
+    and GET /chats/{chat_id}/deletion reports the progress
     """
     chat = chats_db.get_chat_by_id(session=session, chat_id=chat_id)
 
@@ -175,8 +385,29 @@ def delete_chat_by_id(session: DBSession, chat_id: int) -> None:
                 "message": f"Unable to find chat with id={chat_id}"
          })
     
-    # Delete chat (therefore deleting the Messages and ChatMembership)
-    chats_db.delete_chat(session=session, chat_id=chat_id)
+    # Tombstone the chat, the purger deletes the Messages and ChatMembership
+    chats_db.tombstone_chat(session=session, chat_id=chat_id)
+    chat_purger.schedule(session.get_bind(), chat_id)
+
+
+@router.get("/{chat_id}/deletion", response_model=dict[str, int | datetime])
+def chat_deletion(session: DBSession, chat_id: int) -> dict[str, int | datetime]:
+    """
+    Returns the progress of a deleted chat's purge: when it was deleted and how many of its messages remain
+    Errors:
+        Chat_id does not correspond to a chat being purged (never existed, not deleted or already purged) -> 404
+    """
+    chat = chats_db.get_deleted_chat(session=session, chat_id=chat_id)
+    if chat is None:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "error": "entity_not_found",
+                "message": f"Unable to find deleted chat with id={chat_id}"
+            }
+        )
+    stats = stats_db.get_chat_stats(session=session, chat_id=chat_id, include_deleted=True)
+    return {"chat_id": chat_id, "deleted_at": chat.deleted_at, "remaining_messages": stats.message_count}
 
 
 @router.post("/{chat_id}/messages", response_model=Message, status_code=201)
@@ -200,12 +431,6 @@ def post_message(session: DBSession, chat_id: int, message_request: MessageReque
         Create mesage object and added to database -> 201
     """
     chat = chats_db.get_chat_by_id(session=session, chat_id=chat_id)
-    print()
-    print()
-    print()
-    print(owner_account, "=================oner account id");
-    print()
-    print()
 
     # Validate whether chat_id corresponds with chat in the database
     if chat == None:
@@ -228,12 +453,6 @@ def post_message(session: DBSession, chat_id: int, message_request: MessageReque
     
     # Request account_id does not match the authenticated account's id -> 403
     if message_request.account_id != owner_account.id:
-         print()
-         print()
-         print()
-         print(owner_account, "=================oner account id");
-         print()
-         print()
          return JSONResponse(
                 status_code=403,
                 content={
@@ -243,10 +462,166 @@ def post_message(session: DBSession, chat_id: int, message_request: MessageReque
 
     # Successful response -> create message object and add to database
     message = DBMessage(text=message_request.text, account_id=message_request.account_id, chat_id=chat_id)
-    messages_db.create_message(session=session, message=message)
+    seq = messages_db.create_message(session=session, message=message)
+    chat_events.publish(chat_id, message_event(MESSAGE_CREATED, message, seq))
     return message
 
 
+# Batch routes are registered before /{chat_id}/messages/{message_id} so "batch" isn't taken for a message id
+@router.post("/{chat_id}/messages/batch", response_model=dict[str, dict[str, int] | list[Message]], status_code=201)
+def post_messages_batch(session: DBSession, chat_id: int, batch_request: MessageBatchRequest,
+                        owner_account: DBAccount = Depends(extract_user)) -> dict[str, dict[str, int] | list[DBMessage]]:
+    """
+    Authenticated route
+    Creates up to MAX_BATCH_SIZE messages in the chat with one insert and one commit
+    Authentication and membership are checked once for the whole batch
+    Errors: same as POST /chats/{chat_id}/messages, nothing is created on error
+    Success:
+        Messages created -> 201, with their assigned ids in request order
+    """
+    chat = chats_db.get_chat_by_id(session=session, chat_id=chat_id)
+    if chat == None:
+         return JSONResponse(
+              status_code=404,
+              content={
+                   "error": "entity_not_found",
+                   "message": f"Unable to find chat with id={chat_id}"
+                   })
+
+    if not chatmembership_db.is_account_chat_member(session=session, account_id=batch_request.account_id, chat=chat):
+         return JSONResponse(
+                status_code=422,
+                content={
+                    "error": "chat_membership_required",
+                    "message": f"Account with id={batch_request.account_id} must be a member of chat with id={chat_id}"
+            })
+
+    if batch_request.account_id != owner_account.id:
+         return JSONResponse(
+                status_code=403,
+                content={
+                    "error": "access_denied",
+                    "message": "Cannot create message on behalf of different account"
+            })
+
+    messages, seq = messages_db.create_messages(session=session, chat_id=chat_id, account_id=batch_request.account_id, texts=batch_request.texts)
+    publish_message_events(chat_id, MESSAGE_CREATED, messages, seq)
+    return {"metadata": {"count": len(messages)},
+            "messages": messages}
+
+
+@router.put("/{chat_id}/messages/batch", response_model=dict[str, dict[str, int] | list[Message]], status_code=200)
+def update_messages_batch(session: DBSession, chat_id: int, batch_request: MessageBatchUpdateRequest,
+                          current_user: DBAccount = Depends(extract_user)) -> dict[str, dict[str, int] | list[DBMessage]]:
+    """
+    Authenticated route
+    Updates the text of up to MAX_BATCH_SIZE messages of the chat in one transaction
+    If an id appears more than once the last text wins
+    Error responses (nothing is updated):
+        No chat corresponding with chat_id exists -> 404
+        Authenticated account isn't a member of the chat -> 422
+        Any id doesn't correspond to a message of the chat -> 404
+        Any message was written by a different account -> 403
+    Successful responses:
+        200 status code (OK), the updated messages
+    """
+    chat = chats_db.get_chat_by_id(session=session, chat_id=chat_id)
+    if chat == None:
+         return JSONResponse(
+            status_code=404,
+            content={
+                "error": "entity_not_found",
+                "message": f"Unable to find chat with id={chat_id}"
+         })
+
+    if not chatmembership_db.is_account_chat_member(session=session, account_id=current_user.id, chat=chat):
+         return JSONResponse(
+                status_code=422,
+                content={
+                    "error": "chat_membership_required",
+                    "message": f"Account with id={current_user.id} must be a member of chat with id={chat_id}"
+            })
+
+    texts = {edit.id: edit.text for edit in batch_request.messages}
+    messages = messages_db.get_messages_by_ids(session=session, chat_id=chat_id, message_ids=list(texts))
+    missing = sorted(set(texts) - {message.id for message in messages})
+    if missing:
+         return JSONResponse(
+                status_code=404,
+                content={
+                    "error": "entity_not_found",
+                    "message": f"Unable to find messages with ids={missing}"
+            })
+
+    foreign = sorted(message.id for message in messages if message.account_id != current_user.id)
+    if foreign:
+         return JSONResponse(
+                status_code=403,
+                content={
+                    "error": "access_denied",
+                    "message": f"Cannot modify messages of a different account, ids={foreign}"
+            })
+
+    updated, seq = messages_db.update_messages(session=session, messages=messages, texts=texts)
+    publish_message_events(chat_id, MESSAGE_UPDATED, updated, seq)
+    return {"metadata": {"count": len(updated)},
+            "messages": updated}
+
+
+@router.post("/{chat_id}/messages/batch/delete", response_model=None, status_code=204)
+def delete_messages_batch(session: DBSession, chat_id: int, batch_request: MessageBatchDeleteRequest,
+                          current_user: DBAccount = Depends(extract_user)) -> None:
+    """
+    Authenticated route
+    Deletes up to MAX_BATCH_SIZE messages of the chat by id in one statement
+    Error response (nothing is deleted):
+        chat_id doesn't correspond with chat in database -> 404
+        Authenticated account isn't a member of the chat -> 422
+        Any id doesn't correspond to a message of the chat -> 404
+        Any message was written by a different account -> 403
+    Successful response:
+        No body -> 204 (No Content)
+    """
+    chat = chats_db.get_chat_by_id(session=session, chat_id=chat_id)
+    if chat == None:
+         return JSONResponse(
+            status_code=404,
+            content={
+                "error": "entity_not_found",
+                "message": f"Unable to find chat with id={chat_id}"
+         })
+
+    if not chatmembership_db.is_account_chat_member(session=session, account_id=current_user.id, chat=chat):
+         return JSONResponse(
+                status_code=422,
+                content={
+                    "error": "chat_membership_required",
+                    "message": f"Account with id={current_user.id} must be a member of chat with id={chat_id}"
+            })
+
+    messages = messages_db.get_messages_by_ids(session=session, chat_id=chat_id, message_ids=batch_request.ids)
+    foreign = sorted(message.id for message in messages if message.account_id != current_user.id)
+    if foreign:
+         return JSONResponse(
+                status_code=403,
+                content={
+                    "error": "access_denied",
+                    "message": f"Cannot delete messages of a different account, ids={foreign}"
+            })
+
+    result = messages_db.delete_messages(session=session, chat_id=chat_id, message_ids=batch_request.ids)
+    if result is None:
+         return JSONResponse(
+                status_code=404,
+                content={
+                    "error": "entity_not_found",
+                    "message": f"Unable to find every message with ids={sorted(set(batch_request.ids))}"
+            })
+
+    deleted, seq = result
+    publish_message_events(chat_id, MESSAGE_DELETED, [DBMessage(id=message_id, chat_id=chat_id) for message_id in deleted], seq)
+
+
 @router.put("/{chat_id}/messages/{message_id}", response_model=Message, status_code=200)
 def update_message_text(session: DBSession, chat_id: int, message_id: int, message_request: UpdateMessageRequest) -> DBMessage:
     """
@@ -271,7 +646,7 @@ def update_message_text(session: DBSession, chat_id: int, message_id: int, messa
     
     # Check if message_id corresponds to a message in database OR message_id corresponds to a message that belongs to a different chat
     message = messages_db.get_message_by_id(session=session, message_id=message_id)
-    if message == None or not messages_db.message_in_chat(session=session, message_id=message_id, chat=chat):
+    if message == None or message.chat_id != chat.id:
          return JSONResponse(
                 status_code=404,
                 content={
@@ -280,8 +655,9 @@ def update_message_text(session: DBSession, chat_id: int, message_id: int, messa
             })    
 
     # Successful response -> update the text of the message 
-    msg = messages_db.update_message(session=session, message=message, update=message_request)
-    return msg
+    seq = messages_db.update_message(session=session, message=message, update=message_request)
+    chat_events.publish(chat_id, message_event(MESSAGE_UPDATED, message, seq))
+    return message
 
 @router.delete("/{chat_id}/messages/{message_id}", response_model=None, status_code=204)
 def delete_message(session: DBSession, chat_id: int, message_id: int) -> None:
@@ -306,7 +682,7 @@ def delete_message(session: DBSession, chat_id: int, message_id: int) -> None:
     
     # Check if message_id corresponds to a message in database OR message_id corresponds to a message that belongs to a different chat
     message = messages_db.get_message_by_id(session=session, message_id=message_id)
-    if message == None or not messages_db.message_in_chat(session=session, message_id=message_id, chat=chat):
+    if message == None or message.chat_id != chat.id:
          return JSONResponse(
                 status_code=404,
                 content={
@@ -315,8 +691,66 @@ def delete_message(session: DBSession, chat_id: int, message_id: int) -> None:
             }) 
 
     # Successful response -> delete message 204 no content
-    messages_db.delete_message(session=session, message=message)
+    deleted = DBMessage(id=message.id, chat_id=message.chat_id)
+    seq = messages_db.delete_message(session=session, message=message)
+    chat_events.publish(chat_id, message_event(MESSAGE_DELETED, deleted, seq))
        
+def bulk_membership_response(outcomes: dict[int, str]) -> dict[str, dict[str, int] | list[dict[str, int | str]]]:
+    """
+    Builds the response of the bulk membership routes: the count of each outcome and the outcome of each account id
+    """
+    metadata = {}
+    for outcome in outcomes.values():
+         metadata[outcome] = metadata.get(outcome, 0) + 1
+    return {"metadata": metadata,
+            "results": [{"account_id": account_id, "outcome": outcome} for account_id, outcome in outcomes.items()]}
+
+
+@router.post("/{chat_id}/accounts/bulk", response_model=dict[str, dict[str, int] | list[dict[str, int | str]]], status_code=200)
+def add_chat_members_bulk(session: DBSession, chat_id: int, bulk_request: BulkMembershipRequest):
+    """
+    Adds up to MAX_BULK_MEMBERS accounts to the chat in one transaction
+    Unknown ids and current members are skipped and reported, not errors
+    Error response:
+        chat_id doesn't correspond with chat in database -> 404
+    Successful response:
+        200, outcome per account id: added / already_member / not_found
+    """
+    chat = chats_db.get_chat_by_id(session=session, chat_id=chat_id)
+    if chat == None:
+          return JSONResponse(
+            status_code=404,
+            content={
+                "error": "entity_not_found",
+                "message": f"Unable to find chat with id={chat_id}"
+         })
+    outcomes = chatmembership_db.add_chat_members(session=session, chat=chat, account_ids=bulk_request.account_ids)
+    return bulk_membership_response(outcomes)
+
+
+@router.post("/{chat_id}/accounts/bulk/delete", response_model=dict[str, dict[str, int] | list[dict[str, int | str]]], status_code=200)
+def remove_chat_members_bulk(session: DBSession, chat_id: int, bulk_request: BulkMembershipRequest):
+    """
+    Removes up to MAX_BULK_MEMBERS accounts from the chat in one transaction
+    As with DELETE /chats/{chat_id}/accounts/{account_id} the owner can't be removed, the rest of the batch still is
+    Messages of removed accounts in this chat are updated to NULL account_id
+    Error response:
+        chat_id doesn't correspond with chat in database -> 404
+    Successful response:
+        200, outcome per account id: removed / chat_owner / not_member
+    """
+    chat = chats_db.get_chat_by_id(session=session, chat_id=chat_id)
+    if chat == None:
+          return JSONResponse(
+            status_code=404,
+            content={
+                "error": "entity_not_found",
+                "message": f"Unable to find chat with id={chat_id}"
+         })
+    outcomes = chatmembership_db.remove_chat_members(session=session, chat=chat, account_ids=bulk_request.account_ids)
+    return bulk_membership_response(outcomes)
+
+
 @router.post("/{chat_id}/accounts", response_model=DBChatMembership)
 def account_associated_with_chat(session: DBSession, chat_id: int, account_request: AccountRequest) -> DBChatMembership:
     """
@@ -352,7 +786,7 @@ def account_associated_with_chat(session: DBSession, chat_id: int, account_reque
         # Add new chat membership -> 201 created
         chatmembership_db.add_chat_member(session=session, account=account, chat=chat)
         return JSONResponse(status_code=201, content={"chat_id": f"{chat_id}", 
-                                                      "account_id": f"{account.id}"})
+                                                      "account_id": f"{account_request.account_id}"})
 
 
 @router.delete("/{chat_id}/accounts/{account_id}", response_model=None, status_code=204)
@@ -390,7 +824,169 @@ def delete_membership(session: DBSession, chat_id: int, account_id: int):
                     "message": "Unable to remove the owner of a chat"
             })
     
-    # Successful response -> 204 (NO CONTENT). Nulllify each account_id associated with deleted account 
-    messages_db.nullify_account_messages(session=session, account_id=account_id)
+    # Successful response -> 204 (NO CONTENT). Nullify the account's messages in this chat, same transaction as the delete
+    messages_db.nullify_account_messages(session=session, account_id=account_id, chat_id=chat_id)
     chatmembership_db.delete_membership(session=session, chat_id=chat_id, account_id=account_id)
-    
+
+
+@router.put("/{chat_id}/read", response_model=dict[str, int | None], status_code=200)
+def mark_chat_read(session: DBSession, chat_id: int, read_request: ReadMarkerRequest,
+                   current_user: DBAccount = Depends(extract_user)) -> dict[str, int | None]:
+    """
+    Authenticated route
+    Advances the account's read marker in the chat to message_id, or to the latest message if message_id is null
+    The marker never moves backwards
+    Errors:
+        An access token is not provided -> 403
+        Access token is expired -> 403
+        Access token is invalid -> 403
+        Chat_id does not correspond to a chat in the database -> 404
+        The account is not a member of the chat -> 422
+        message_id does not correspond to a message of the chat -> 404
+    Success:
+        200, the read marker and the number of messages still unread
+    """
+    chat = chats_db.get_chat_by_id(session=session, chat_id=chat_id)
+    if chat == None:
+         return JSONResponse(
+            status_code=404,
+            content={
+                "error": "entity_not_found",
+                "message": f"Unable to find chat with id={chat_id}"
+         })
+
+    account_id = current_user.id
+    if not chatmembership_db.is_account_chat_member(session=session, account_id=account_id, chat=chat):
+         return JSONResponse(
+                status_code=422,
+                content={
+                    "error": "chat_membership_required",
+                    "message": f"Account with id={account_id} must be a member of chat with id={chat_id}"
+            })
+
+    message_id = read_request.message_id
+    if message_id is None:
+         message_id = messages_db.get_latest_message_id(session=session, chat_id=chat_id)
+    else:
+         message = messages_db.get_message_by_id(session=session, message_id=message_id)
+         if message == None or message.chat_id != chat_id:
+              return JSONResponse(
+                    status_code=404,
+                    content={
+                        "error": "entity_not_found",
+                        "message": f"Unable to find message with id={message_id}"
+                })
+
+    if message_id is not None:
+         chatmembership_db.advance_read_marker(session=session, chat_id=chat_id, account_id=account_id, message_id=message_id)
+         session.commit()
+    last_read_message_id, unread_count = chatmembership_db.get_read_state(session=session, chat_id=chat_id, account_id=account_id)
+    return {"chat_id": chat_id, "last_read_message_id": last_read_message_id, "unread_count": unread_count}
+
+
+@router.websocket("/{chat_id}/ws")
+async def chat_websocket(websocket: WebSocket, session: DBSession, chat_id: int) -> None:
+    """
+    Authenticated websocket
+    Pushes message_created, message_updated and message_deleted events of the chat to a member of the chat
+    The access token is read from the cookie, an Authorization bearer header or the token query parameter
+    Errors (handshake rejected with close code 1008): 
+        An access token is not provided, expired or invalid
+        Chat_id does not correspond to a chat in the database OR the account is not a member of the chat
+    A client that falls behind the chat's events is disconnected with close code 1013
+    The socket is closed with code 1008 once the account leaves the chat or the chat is deleted
+    """
+    try:
+        token = get_websocket_token(websocket)
+        member_id = await run_in_threadpool(_token_chat_member_id, session, token, chat_id)
+    except (TokenNotProvidedError, ExpiredAccessToken, InvalidAccessToken):
+        member_id = None
+    finally:
+        # Release the connection, the socket doesn't touch the database again
+        session.close()
+    if member_id is None:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    subscription = chat_events.subscribe(chat_id, member_id)
+    try:
+        await forward_events(websocket, subscription)
+    finally:
+        chat_events.unsubscribe(subscription)
+
+
+def _token_chat_member_id(session: DBSession, token: str, chat_id: int) -> int | None:
+    """
+    Returns the id of the token's account if it is a member of the chat corresponding with chat_id, None otherwise
+    """
+    account = authenticate_token(session=session, token=token)
+    chat = chats_db.get_chat_by_id(session=session, chat_id=chat_id)
+    if account is None or chat is None or \
+            not chatmembership_db.is_account_chat_member(session=session, account_id=account.id, chat=chat):
+        return None
+    return account.id
+
+
+@router.get("/{chat_id}/events", response_model=None)
+async def chat_event_stream(session: DBSession, chat_id: int,
+                            last_event_id: int | None = Header(default=None),
+                            current_user: DBAccount = Depends(extract_user)):
+    """
+    Authenticated route
+    Server-sent event stream of the chat's message_created, message_updated and message_deleted events
+    Every event's id is the chat's change sequence number of its write, bumped by each message created, edited
+    or deleted. A client reconnecting with Last-Event-ID first receives the messages created since, or a reset
+    event (refetch the messages) if more than SSE_REPLAY_LIMIT were missed or a message was edited or deleted
+    since. The reset event's id is the chat's current sequence number
+    Errors: 
+        An access token is not provided -> 403
+        Access token is expired -> 403
+        Access token is invalid -> 403
+        Chat_id does not correspond to a chat in the database -> 404
+        Authenticated account is not a member of the chat -> 422
+    """
+    chat = await run_in_threadpool(chats_db.get_chat_by_id, session, chat_id)
+    if chat is None:
+         return JSONResponse(
+              status_code=404,
+              content={
+                   "error": "entity_not_found",
+                   "message": f"Unable to find chat with id={chat_id}"
+                   })
+    if not await run_in_threadpool(chatmembership_db.is_account_chat_member, session, current_user.id, chat):
+         return JSONResponse(
+                status_code=422,
+                content={
+                    "error": "chat_membership_required",
+                    "message": f"Account with id={current_user.id} must be a member of chat with id={chat_id}"
+            })
+
+    # Subscribe before reading the replay so no message falls between the two
+    subscription = chat_events.subscribe(chat_id, current_user.id)
+    replay = []
+    try:
+         stats = await run_in_threadpool(stats_db.get_chat_stats, session, chat_id)
+         seq = stats.change_seq
+         if last_event_id is None:
+              # A new client starts at the current sequence number, live events are ordered from there
+              last_event_id = seq
+         else:
+              reset = realtime.reset_event(chat_id, seq, stats.last_message_id)
+              # Edits and deletes aren't replayed, and an id past the sequence isn't one of this chat's
+              if last_event_id > seq or last_event_id < stats.last_changed_seq or seq - last_event_id > realtime.SSE_REPLAY_LIMIT:
+                   replay = [reset]
+              elif last_event_id < seq:
+                   # Only messages were created since the client's change, they are the newest ones as of these stats
+                   missed = await run_in_threadpool(messages_db.get_latest_messages, session, chat_id,
+                                                    seq - last_event_id, stats.last_message_id or 0)
+                   if len(missed) < seq - last_event_id:
+                        replay = [reset]
+                   else:
+                        replay = [message_event(MESSAGE_CREATED, message, last_event_id + 1 + i) for i, message in enumerate(missed)]
+         # Release the connection, the stream doesn't touch the database again
+         session.close()
+         return realtime.EventStreamResponse(subscription, replay, last_event_id)
+    except BaseException:
+         chat_events.unsubscribe(subscription)
+         raise
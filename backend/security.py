@@ -1,17 +1,23 @@
 
+import asyncio
 from datetime import datetime, timezone
-from fastapi import Depends, Response
+from fastapi import Depends, Response, WebSocket
 from fastapi.security import APIKeyCookie, HTTPAuthorizationCredentials, HTTPBearer
 import bcrypt
 from dotenv import load_dotenv
 import os
 from jose import ExpiredSignatureError, jwt
 from pydantic import BaseModel
+from sqlalchemy.orm import make_transient_to_detached
 from backend.database.accounts import get_by_account_id, get_by_account_username, update_email, update_username
+from backend.cache import principal_cache
+from backend.database.aio import accounts as aio_accounts
 from backend.database.schema import DBAccount
-from backend.dependencies import DBSession
-from backend.error_responses import ExpiredAccessToken, InvalidAccessToken, TokenNotProvidedError
+from backend.dependencies import AsyncDBSession, DBSession
+from backend.error_responses import ExpiredAccessToken, InvalidAccessToken, PasswordHashingUnavailable, TokenNotProvidedError
+from concurrent.futures import ThreadPoolExecutor
 import secrets
+import threading
 
 
 # Load environment variables from .env file
@@ -25,6 +31,16 @@ JWT_ISS = "http://127.0.0.1"
 DURATION = 3600
 JWT_COOKIE_KEY = "pony_express_token"
 
+# Password hashing
+# bcrypt releases the GIL, so a small dedicated thread pool keeps hashing off the
+# request threadpool while still using every core. Routes await it from the event loop
+# (the *_async functions), so no request thread is parked waiting on bcrypt
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_QUEUE_DEPTH = int(os.getenv("PASSWORD_QUEUE_DEPTH", "16"))
+_password_pool = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="password")
+_password_slots = threading.BoundedSemaphore(PASSWORD_WORKERS + PASSWORD_QUEUE_DEPTH)
+
 # Authentication schemes
 # These are essentially used to transport the JWT
 COOKIE_SCHEME = APIKeyCookie(name=JWT_COOKIE_KEY, auto_error=False)
@@ -60,6 +76,51 @@ def extract_user(session: DBSession, token: str = Depends(get_access_token)) ->
       Raises errors if token invlaid or expired
       Used as a dependency for authentication schemes
       """
+      return authenticate_token(session=session, token=token)
+
+
+def authenticate_token(session: DBSession, token: str) -> DBAccount:
+      """
+      Returns the account the given token was issued to
+      Raises errors if token invlaid or expired
+      Shared by the HTTP dependency and the websocket/streaming routes
+      Served from the principal cache when possible, skipping the decode and the account lookup
+      """
+      digest = principal_cache.digest(token)
+      snapshot = principal_cache.get(digest)
+      if snapshot is not None:
+            return session.merge(_detached_account(snapshot), load=False)
+      claims = decode_token(token)
+      account_id = int(claims.sub)
+      generation = principal_cache.generation(account_id)
+      account = get_by_account_id(session, account_id)
+      if account is not None:
+            principal_cache.put(digest, _principal_snapshot(account), token_exp=claims.exp, generation=generation)
+      return account
+
+
+async def extract_user_async(session: AsyncDBSession, token: str = Depends(get_access_token)) -> DBAccount:
+      """
+      Async version of extract_user for the async-native routes
+      """
+      digest = principal_cache.digest(token)
+      snapshot = principal_cache.get(digest)
+      if snapshot is not None:
+            return await session.merge(_detached_account(snapshot), load=False)
+      claims = decode_token(token)
+      account_id = int(claims.sub)
+      generation = principal_cache.generation(account_id)
+      account = await aio_accounts.get_by_account_id(session, account_id)
+      if account is not None:
+            principal_cache.put(digest, _principal_snapshot(account), token_exp=claims.exp, generation=generation)
+      return account
+
+
+def decode_token(token: str) -> JWT_Claims:
+      """
+      Decodes the given token and returns its claims
+      Raises errors if token invlaid or expired
+      """
       try:
             payload = jwt.decode(
                   token=token,
@@ -68,13 +129,49 @@ def extract_user(session: DBSession, token: str = Depends(get_access_token)) ->
 			options=JWT_OPTS
                   )
             claims = JWT_Claims(**payload)
-            return get_by_account_id(session, int(claims.sub))
+            int(claims.sub)
+            return claims
       except ExpiredSignatureError:
             raise ExpiredAccessToken()
       except Exception:
             raise InvalidAccessToken()
 
 
+def _principal_snapshot(account: DBAccount) -> dict:
+      """
+      Returns the columns of the account kept in the principal cache, never the password hash
+      Routes that need the hash read it with accounts_db.get_hashed_password, not off the principal
+      """
+      return account.model_dump(exclude={"hashed_password"})
+
+
+def _detached_account(snapshot: dict) -> DBAccount:
+      """
+      Rebuilds a cached account snapshot as a detached instance so it can be merged without a SELECT
+      """
+      account = DBAccount(**snapshot)
+      make_transient_to_detached(account)
+      return account
+
+
+def get_websocket_token(websocket: WebSocket) -> str:
+      """
+      Returns the token of a websocket handshake from the cookie, an Authorization bearer header or the token query parameter
+      Browsers can't set headers on websockets so the query parameter is accepted as well
+      Throws exception if none
+      """
+      cookie_token = websocket.cookies.get(JWT_COOKIE_KEY)
+      if cookie_token:
+            return cookie_token
+      scheme, _, bearer_token = websocket.headers.get("authorization", "").partition(" ")
+      if scheme.lower() == "bearer" and bearer_token:
+            return bearer_token
+      query_token = websocket.query_params.get("token")
+      if query_token:
+            return query_token
+      raise TokenNotProvidedError()
+
+
 def generate_token(session: DBSession, username: str) -> str:
       """
       Generates JWT token for given user
@@ -105,8 +202,10 @@ def _generate_token_claims(account: DBAccount):
 def verify_password(password: str, hashed_password: str) -> bool:
       """
       Verifies given hashed_password matches given password
+      Runs on the bounded password pool
       """
-      return bcrypt.checkpw(
+      return _run_password_job(
+            bcrypt.checkpw,
 		password.encode("utf-8"),
 		hashed_password.encode("utf-8"),
 	)
@@ -115,13 +214,74 @@ def verify_password(password: str, hashed_password: str) -> bool:
 def hash_password(password: str) -> str:
     '''
     Returns a string representation of hashed verison of given passwrod using bycrypt
+    Runs on the bounded password pool with BCRYPT_ROUNDS as the work factor
     '''
-    return bcrypt.hashpw(
+    return _run_password_job(
+          bcrypt.hashpw,
           password.encode("utf-8"),
-          bcrypt.gensalt(),
+          bcrypt.gensalt(rounds=BCRYPT_ROUNDS),
           ).decode("utf-8")
 
 
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+      """
+      Async version of verify_password, awaited from the event loop
+      """
+      return await _run_password_job_async(
+            bcrypt.checkpw,
+            password.encode("utf-8"),
+            hashed_password.encode("utf-8"),
+      )
+
+
+async def hash_password_async(password: str) -> str:
+      """
+      Async version of hash_password, awaited from the event loop
+      """
+      hashed_password = await _run_password_job_async(
+            bcrypt.hashpw,
+            password.encode("utf-8"),
+            bcrypt.gensalt(rounds=BCRYPT_ROUNDS),
+      )
+      return hashed_password.decode("utf-8")
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+      """
+      Returns true if the given bcrypt hash was made with a work factor other than BCRYPT_ROUNDS
+      """
+      try:
+            return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+      except (IndexError, ValueError):
+            return False
+
+
+def _run_password_job(function, *args):
+      """
+      Runs a bcrypt call on the password pool and waits for its result
+      Raises PasswordHashingUnavailable right away if PASSWORD_WORKERS + PASSWORD_QUEUE_DEPTH jobs are already in flight
+      """
+      if not _password_slots.acquire(blocking=False):
+            raise PasswordHashingUnavailable()
+      try:
+            return _password_pool.submit(function, *args).result()
+      finally:
+            _password_slots.release()
+
+
+async def _run_password_job_async(function, *args):
+      """
+      Runs a bcrypt call on the password pool and awaits its result without blocking a thread
+      Raises PasswordHashingUnavailable right away if PASSWORD_WORKERS + PASSWORD_QUEUE_DEPTH jobs are already in flight
+      """
+      if not _password_slots.acquire(blocking=False):
+            raise PasswordHashingUnavailable()
+      try:
+            return await asyncio.get_running_loop().run_in_executor(_password_pool, function, *args)
+      finally:
+            _password_slots.release()
+
+
 def get_cookie_key() -> str:
       """
       Getter for JWT_COOKIE_KEY
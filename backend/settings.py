@@ -0,0 +1,62 @@
+"""Runtime settings read from the environment (and secrets.env).
+
+Args:
+    database_settings (DatabaseSettings): Engine profile used by backend.dependencies
+"""
+
+import os
+
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class DatabaseSettings(BaseSettings):
+    """Database engine profile. Every field can be set with a DB_ prefixed environment variable."""
+
+    model_config = SettingsConfigDict(env_prefix="DB_", env_file="secrets.env", extra="ignore")
+
+    # Connection
+    url: str | None = None
+    sqlite_path: str = "backend/database/development.db"
+    echo: bool = False
+    async_database: bool = Field(default=False, validation_alias="ASYNC_DATABASE")
+
+    # SQLite pragmas, applied to every new connection
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64 * 1024  # negative -> KiB, i.e. 64 MiB
+    sqlite_foreign_keys: bool = True
+
+    # Connection pool for server databases (DATABASE_URL)
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_pre_ping: bool = True
+    pool_recycle: int = 1800
+
+    def database_url(self) -> str:
+        """
+        Returns DB_URL if set, DATABASE_URL when deployed on Render, otherwise the local SQLite file
+        """
+        if self.url:
+            return self.url
+        if os.getenv("RENDER") == "true":
+            return os.environ["DATABASE_URL"]
+        return f"sqlite:///{self.sqlite_path}"
+
+    def sqlite_pragmas(self) -> dict[str, str | int]:
+        """
+        Returns the PRAGMA name -> value pairs for new SQLite connections
+        """
+        return {
+            "journal_mode": self.sqlite_journal_mode,
+            "synchronous": self.sqlite_synchronous,
+            "busy_timeout": self.sqlite_busy_timeout_ms,
+            "mmap_size": self.sqlite_mmap_size,
+            "cache_size": self.sqlite_cache_size,
+            "foreign_keys": "ON" if self.sqlite_foreign_keys else "OFF",
+        }
+
+
+database_settings = DatabaseSettings()
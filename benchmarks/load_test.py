@@ -0,0 +1,256 @@
+"""HTTP load test of backend.main:app served by a local uvicorn process.
+
+The server gets a fresh SQLite database in a temporary directory. Setup registers
+--users accounts, has each of them create a chat, adds every user to --chats-per-user
+other chats and seeds --messages messages per chat. Then --concurrency workers run
+for --seconds, each picking an operation from the weighted mix:
+
+    login          POST /auth/token
+    list_chats     GET /chats
+    page_messages  GET /chats/{chat_id}/messages (newest page, sometimes the page before it)
+    post_message   POST /chats/{chat_id}/messages
+
+Results (throughput, p50/p95/p99 latency and errors per route) are printed and written
+to --json. --compare prints the change against an earlier results file.
+
+Usage:
+    python -m benchmarks.load_test [--seconds 20] [--concurrency 16] [--json results.json] [--compare baseline.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+
+DEFAULT_MIX = {"login": 1, "list_chats": 4, "page_messages": 10, "post_message": 5}
+PASSWORD = "load-test-password"
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server(directory: Path, port: int, workers: int) -> subprocess.Popen:
+    """
+    Starts uvicorn on port with a fresh database in directory and waits until it answers
+    """
+    env = {
+        **os.environ,
+        "DB_URL": f"sqlite:///{directory}/load_test.db",
+        "JWT_SECRET_KEY": os.getenv("JWT_SECRET_KEY", "load-test-secret"),
+        # Setup registers many accounts, keep hashing cheap unless told otherwise
+        "BCRYPT_ROUNDS": os.getenv("BCRYPT_ROUNDS", "4"),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/metrics", timeout=1)
+            return server
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start within 30 seconds")
+
+
+class Recorder:
+    """Latencies and errors per operation."""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    async def request(self, operation: str, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response | None:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            response = None
+        elapsed = time.perf_counter() - start
+        if response is None or response.status_code >= 400:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+        else:
+            self.latencies.setdefault(operation, []).append(elapsed)
+        return response
+
+    def report(self, seconds: float) -> dict[str, dict[str, float]]:
+        operations = sorted(set(self.latencies) | set(self.errors))
+        report = {}
+        for operation in operations:
+            latencies = sorted(self.latencies.get(operation, []))
+            report[operation] = {
+                "requests": len(latencies),
+                "errors": self.errors.get(operation, 0),
+                "throughput": len(latencies) / seconds,
+                "p50_ms": _percentile(latencies, 50) * 1000,
+                "p95_ms": _percentile(latencies, 95) * 1000,
+                "p99_ms": _percentile(latencies, 99) * 1000,
+            }
+        return report
+
+
+def _percentile(values: list[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(percentile / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def _login(client: httpx.AsyncClient, username: str) -> str:
+    response = await client.post("/auth/token", data={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def setup(client: httpx.AsyncClient, users: int, chats_per_user: int, messages: int, rng: random.Random) -> list[dict]:
+    """
+    Creates the accounts, chats, memberships and messages, returns one dict per user
+    with its username, account id, token and the ids of the chats it belongs to
+    """
+    people = []
+    for i in range(users):
+        username = f"load{i}"
+        response = await client.post("/auth/registration",
+                                     data={"username": username, "email": f"{username}@example.com", "password": PASSWORD})
+        response.raise_for_status()
+        token = await _login(client, username)
+        people.append({"username": username, "id": response.json()["id"], "token": token, "chats": []})
+
+    for person in people:
+        headers = {"Authorization": f"Bearer {person['token']}"}
+        response = await client.post("/chats/", json={"name": f"chat of {person['username']}", "owner_id": person["id"]}, headers=headers)
+        response.raise_for_status()
+        person["chats"].append(response.json()["id"])
+
+    chat_ids = [person["chats"][0] for person in people]
+    for person in people:
+        for chat_id in rng.sample(chat_ids, min(chats_per_user, len(chat_ids))):
+            if chat_id not in person["chats"]:
+                (await client.post(f"/chats/{chat_id}/accounts", json={"account_id": person["id"]})).raise_for_status()
+                person["chats"].append(chat_id)
+
+    for person in people:
+        headers = {"Authorization": f"Bearer {person['token']}"}
+        chat_id = person["chats"][0]
+        for i in range(messages):
+            (await client.post(f"/chats/{chat_id}/messages", json={"text": f"seed message {i}", "account_id": person["id"]},
+                               headers=headers)).raise_for_status()
+    return people
+
+
+async def worker(client: httpx.AsyncClient, recorder: Recorder, people: list[dict], mix: dict[str, int],
+                 deadline: float, rng: random.Random):
+    operations, weights = list(mix), list(mix.values())
+    while time.monotonic() < deadline:
+        person = rng.choice(people)
+        headers = {"Authorization": f"Bearer {person['token']}"}
+        chat_id = rng.choice(person["chats"])
+        operation = rng.choices(operations, weights)[0]
+        if operation == "login":
+            await recorder.request(operation, client, "POST", "/auth/token",
+                                   data={"username": person["username"], "password": PASSWORD})
+        elif operation == "list_chats":
+            await recorder.request(operation, client, "GET", "/chats/", params={"limit": 50})
+        elif operation == "page_messages":
+            response = await recorder.request(operation, client, "GET", f"/chats/{chat_id}/messages", params={"limit": 50})
+            cursor = response.json()["metadata"]["next_cursor"] if response is not None and response.status_code == 200 else None
+            if cursor and rng.random() < 0.3:
+                await recorder.request(operation, client, "GET", f"/chats/{chat_id}/messages", params={"cursor": cursor})
+        elif operation == "post_message":
+            await recorder.request(operation, client, "POST", f"/chats/{chat_id}/messages",
+                                   json={"text": "load test message", "account_id": person["id"]}, headers=headers)
+
+
+async def run_load(base_url: str, args: argparse.Namespace, mix: dict[str, int]) -> dict:
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30, follow_redirects=True) as client:
+        people = await setup(client, args.users, args.chats_per_user, args.messages, rng)
+        recorder = Recorder()
+        start = time.monotonic()
+        deadline = start + args.seconds
+        await asyncio.gather(*(worker(client, recorder, people, mix, deadline, random.Random(rng.random()))
+                               for _ in range(args.concurrency)))
+        elapsed = time.monotonic() - start
+
+    routes = recorder.report(elapsed)
+    total = sum(route["requests"] for route in routes.values())
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "compare")} | {"mix": mix},
+        "total": {"requests": total, "errors": sum(route["errors"] for route in routes.values()), "throughput": total / elapsed},
+        "routes": routes,
+    }
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    """
+    Returns one line per route with the relative change of throughput and p50/p95/p99 against baseline
+    """
+    lines = []
+    for operation, current in results["routes"].items():
+        before = baseline.get("routes", {}).get(operation)
+        if before is None:
+            continue
+        changes = []
+        for key in ("throughput", "p50_ms", "p95_ms", "p99_ms"):
+            change = (current[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            changes.append(f"{key} {change:+.1f}%")
+        lines.append(f"{operation:<16}" + "  ".join(changes))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--chats-per-user", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=100, help="seeded messages per chat")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--mix", type=json.loads, default=DEFAULT_MIX, help="operation -> weight, as JSON")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    parser.add_argument("--compare", type=Path, help="results file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_server(Path(directory), port, args.workers)
+        try:
+            results = asyncio.run(run_load(f"http://127.0.0.1:{port}", args, args.mix))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{'route':<16}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for operation, route in results["routes"].items():
+        print(f"{operation:<16}{route['throughput']:>10.1f}{route['p50_ms']:>10.1f}{route['p95_ms']:>10.1f}"
+              f"{route['p99_ms']:>10.1f}{route['errors']:>8}")
+    print(f"{'total':<16}{results['total']['throughput']:>10.1f}")
+    if args.compare:
+        print(f"\nchange against {args.compare}:")
+        print("\n".join(compare(results, json.loads(args.compare.read_text()))))
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
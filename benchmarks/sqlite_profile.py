@@ -0,0 +1,117 @@
+"""Compares SQLite throughput with the default engine and the tuned DatabaseSettings profile.
+
+Each profile gets a fresh database file. The benchmark measures:
+    writes: single-message commits per second, the pattern of messages_db.create_message
+    reads: keyset page reads per second from reader threads while one writer keeps committing
+
+Usage:
+    python -m benchmarks.sqlite_profile [--writes 2000] [--readers 4] [--seconds 5] [--json out.json]
+"""
+
+import argparse
+import json
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from sqlmodel import Session, SQLModel, create_engine
+
+from backend.database import messages as messages_db
+from backend.database.schema import DBAccount, DBChat, DBMessage
+from backend.dependencies import configure_sqlite
+from backend.settings import DatabaseSettings
+
+
+def _engine(path: Path, tuned: bool):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    if tuned:
+        configure_sqlite(engine, DatabaseSettings())
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(DBAccount(id=1, username="bench", email="bench@example.com", hashed_password="x"))
+        session.add(DBChat(id=1, name="bench", owner_id=1))
+        session.commit()
+    return engine
+
+
+def _write(engine, count: int) -> float:
+    start = time.perf_counter()
+    with Session(engine) as session:
+        for i in range(count):
+            messages_db.create_message(session, DBMessage(text=f"message {i}", account_id=1, chat_id=1))
+    return count / (time.perf_counter() - start)
+
+
+def _read_under_write(engine, readers: int, seconds: float) -> dict[str, float]:
+    stop = threading.Event()
+    reads = [0] * readers
+    writes = [0]
+    errors = [0]
+
+    def reader(slot: int):
+        with Session(engine) as session:
+            while not stop.is_set():
+                try:
+                    messages_db.get_messages_page(session, chat_id=1, limit=50)
+                    session.rollback()
+                    reads[slot] += 1
+                except Exception:
+                    session.rollback()
+                    errors[0] += 1
+
+    def writer():
+        with Session(engine) as session:
+            while not stop.is_set():
+                try:
+                    messages_db.create_message(session, DBMessage(text="concurrent", account_id=1, chat_id=1))
+                    writes[0] += 1
+                except Exception:
+                    session.rollback()
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=reader, args=(slot,)) for slot in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {
+        "reads_per_second": sum(reads) / seconds,
+        "concurrent_writes_per_second": writes[0] / seconds,
+        "errors": errors[0],
+    }
+
+
+def run(writes: int, readers: int, seconds: float) -> dict[str, dict[str, float]]:
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, tuned in (("default", False), ("tuned", True)):
+            engine = _engine(Path(directory) / f"{name}.db", tuned)
+            results[name] = {"writes_per_second": _write(engine, writes), **_read_under_write(engine, readers, seconds)}
+            engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args.writes, args.readers, args.seconds)
+    print(f"{'profile':<10}{'writes/s':>12}{'reads/s':>12}{'writes/s*':>12}{'errors':>8}")
+    for name, result in results.items():
+        print(f"{name:<10}{result['writes_per_second']:>12.0f}{result['reads_per_second']:>12.0f}"
+              f"{result['concurrent_writes_per_second']:>12.0f}{result['errors']:>8}")
+    print("* while readers are running")
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
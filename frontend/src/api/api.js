@@ -45,6 +45,17 @@ export const get = async (url, headers) => {
   return await handleResponse(response);
 };
 
+/**
+ * Asynchronously GETs one page of a paginated list route
+ * @param {*} url list route
+ * @param {*} cursor metadata.next_cursor of the previous page, null for the first page
+ * @param {*} headers 
+ * @returns the page, its metadata.next_cursor is null on the last page
+ */
+export const getPage = async (url, cursor, headers) => {
+  const separator = url.includes("?") ? "&" : "?";
+  return await get(cursor ? `${url}${separator}cursor=${encodeURIComponent(cursor)}` : url, headers);
+};
 
 export const postLoginForm = async (url, values) => {
   const { password } = values;
@@ -220,4 +231,4 @@ export const joinChat = async (headers, chatID, accountID) => {
 
 
 
-export default { get, postLoginForm, registrationForm, sendMessage, joinChat}
\ No newline at end of file
+export default { get, getPage, postLoginForm, registrationForm, sendMessage, joinChat}
\ No newline at end of file
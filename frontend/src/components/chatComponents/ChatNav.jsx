@@ -4,7 +4,7 @@ import { useContext } from "react";
 import { AuthContext } from "../../auth";
 
 export default function ChatNav({ onOpenCreateChat }) {
-    const allChats = useAllChats();
+    const { chats, fetchNextPage, hasNextPage, isFetchingNextPage } = useAllChats();
     const { username, logout } = useContext(AuthContext);
 
     return (
@@ -17,7 +17,7 @@ export default function ChatNav({ onOpenCreateChat }) {
             <p className="text-blue-900 hover:text-blue-300 text-xs mb-3"><a href="/settings">settings</a></p>
 
 
-            <ChatList allChats={allChats || []}></ChatList>
+            <ChatList allChats={chats} loadMore={() => hasNextPage && !isFetchingNextPage && fetchNextPage()}></ChatList>
             <CreateChat onClick={onOpenCreateChat}></CreateChat>
             <button className="tracking-tight font-stretch-none shadow-lg font-semibold text-white font-medium hover:text-white mb-5
                     rounded-lg p-1 bg-white/20 box-shadow-xl hover:bg-gray-300 w-3/4 "
@@ -27,9 +27,17 @@ export default function ChatNav({ onOpenCreateChat }) {
     );
 }   
 
-function ChatList({ allChats }) {
+/**
+ * List of the loaded chats, scrolling near its bottom loads the next page
+ */
+function ChatList({ allChats, loadMore }) {
+    const onScroll = (event) => {
+        const list = event.currentTarget;
+        if (list.scrollHeight - list.scrollTop - list.clientHeight < 50) loadMore();
+    };
+
     return (
-        <ul id="chatlist" className="flex flex-col gap-y-0 overflow-y-scroll h-50/100 no-scrollbar tracking-wide font-semibold">
+        <ul id="chatlist" onScroll={onScroll} className="flex flex-col gap-y-0 overflow-y-scroll h-50/100 no-scrollbar tracking-wide font-semibold">
             {allChats.map((chat) => (
                 <ChatItem name={chat.name} id={chat.id} key={chat.id}>{chat.name}</ChatItem>
             ))}
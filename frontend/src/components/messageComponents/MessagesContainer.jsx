@@ -1,4 +1,4 @@
-import { useEffect, useRef, useContext, useState } from "react";
+import { useEffect, useLayoutEffect, useRef, useContext, useState } from "react";
 import { useParams } from "react-router"
 
 import { useChatMessages, useAccountName, useAccountsInChat } from "../../data/queries/queries.js";
@@ -20,11 +20,14 @@ export default function MessagesContainer() {
   const { username, id } = useContext(AuthContext);
   const { chatId } = useParams();
   const { usernames } = useAccountsInChat(chatId);
-  const { messages, refetch } = useChatMessages(chatId) || [];
+  const { messages, refetch, fetchOlder, hasOlder, isFetchingOlder } = useChatMessages(chatId);
 
   const [memberOfChat, setMemberOfChat] = useState(usernames.includes(username));
   const [editedMessage, setEditedMessage] = useState(null);
   const divRef = useRef(null);
+  const scrollRef = useRef(null);
+  // scrollHeight before older messages were requested, to keep the view in place once they're prepended
+  const heightBeforeOlder = useRef(null);
 
 
   let viewableMessagesClass = memberOfChat ? "relative flex-1 bg-gray-400/40 overflow-y-auto px-4 md:px-4 z-40" :
@@ -35,9 +38,26 @@ export default function MessagesContainer() {
     setMemberOfChat(usernames.includes(username));
   }, [chatId, usernames])
 
+  // Only a new latest message scrolls to the bottom, not older pages being loaded
+  const latestMessageId = messages.at(-1)?.id;
   useEffect(() => {
     divRef.current.scrollIntoView({ behavior: 'auto' });
-  }, [messages]);
+  }, [chatId, latestMessageId]);
+
+  useLayoutEffect(() => {
+    if (heightBeforeOlder.current !== null && !isFetchingOlder) {
+      scrollRef.current.scrollTop += scrollRef.current.scrollHeight - heightBeforeOlder.current;
+      heightBeforeOlder.current = null;
+    }
+  }, [messages.length, isFetchingOlder]);
+
+  // Scrolling near the top loads the page of messages before the oldest loaded one
+  const onScroll = () => {
+    if (scrollRef.current.scrollTop < 50 && hasOlder && !isFetchingOlder) {
+      heightBeforeOlder.current = scrollRef.current.scrollHeight;
+      fetchOlder();
+    }
+  };
 
   return (
     // <section className="flex w-2/3 h-95/100 flex-col bg-gradient-to-b from-gray-300 to-slate-300 border-1 border-blue-400 rounded-xl "> 
@@ -46,7 +66,7 @@ export default function MessagesContainer() {
       {/* <section className="flex w-2/3 h-95/100 flex-col bg-white/20 shadow-lg ring-1 ring-black/10 border-1 border-blue-400 rounded-xl "> 
        <section className={`${viewableMessagesClass}`}> */}
       {/* Scrollable message area */}
-      <div id="viewableMessagesClass" className={`${viewableMessagesClass}`}>
+      <div id="viewableMessagesClass" ref={scrollRef} onScroll={onScroll} className={`${viewableMessagesClass}`}>
         <ul className="space-y-4 z-10">
           {messages.map((msg) =>
             msg.account_id == id ? (
@@ -1,44 +1,49 @@
 //import api from "./api";
-import { useQuery,  QueryClient } from "@tanstack/react-query";
+import { useQuery, useInfiniteQuery, QueryClient } from "@tanstack/react-query";
 import  api from "../../api/api";
 import { useQueryClient } from "@tanstack/react-query";
 import { useMutation } from "@tanstack/react-query";
 
 /**
- * Retrieves and sorts all JSON chat objects using React Query from API
- * Essentially retrieving from database
- * @returns {Array} of JSON chat objects
+ * Retrieves and sorts the loaded pages of JSON chat objects using React Query from API
+ * Only the first page is fetched up front, fetchNextPage loads the next one
+ * @returns {Object} chats array, fetchNextPage and hasNextPage
  */
 export const useAllChats = () => {
-    const { data } = useQuery({
+    const { data, fetchNextPage, hasNextPage, isFetchingNextPage } = useInfiniteQuery({
         queryKey: ["chats"],
-        queryFn: () => api.get("/chats")
+        queryFn: ({ pageParam }) => api.getPage("/chats", pageParam),
+        initialPageParam: null,
+        getNextPageParam: (lastPage) => lastPage.metadata?.next_cursor ?? undefined,
     });
 
-    const { chats } = data || { metadata: null, chats: [] }
+    const chats = data?.pages.flatMap((page) => page.chats) ?? [];
     chats.sort((a, b) => {
         if (a.name < b.name) return -1;
         if (a.name > b.name) return 1;
         return 0;
     });
-    return chats
+    return { chats, fetchNextPage, hasNextPage, isFetchingNextPage }
 }
 
 /**
- * Retrieves and sorts by created_at date of all JSON message objects associated with their chat
+ * Retrieves the loaded pages of JSON message objects of a chat, oldest first
+ * Only the newest page is fetched up front, fetchOlder loads the page before the oldest loaded one
  * @param {*} id of chat
- * @returns array of JSON message objects or empty array if data not defined
+ * @returns messages array (empty if data not defined), refetch, fetchOlder and hasOlder
  */
 export const useChatMessages = (chatId) => {
-    const { data, refetch } = useQuery({
+    const { data, refetch, fetchNextPage, hasNextPage, isFetchingNextPage } = useInfiniteQuery({
         queryKey: ["messages", chatId],
-        queryFn: () => api.get("/chats/" + chatId + "/messages"),
+        // Pages are the latest messages first, each next page is older
+        queryFn: ({ pageParam }) => api.getPage("/chats/" + chatId + "/messages", pageParam),
+        initialPageParam: null,
+        getNextPageParam: (lastPage) => lastPage.metadata?.next_cursor ?? undefined,
         enabled: !!chatId, 
     });
 
-    // const { messages } = data || []
-    const messages = data?.messages ?? [];
-    return { messages, refetch }
+    const messages = [...(data?.pages ?? [])].reverse().flatMap((page) => page.messages);
+    return { messages, refetch, fetchOlder: fetchNextPage, hasOlder: hasNextPage, isFetchingOlder: isFetchingNextPage }
 }
 
 /**